@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class CommonConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'common'
+
+    def ready(self):
+        from common.metrics import registry
+        from . import checks  # noqa: F401 (registers the system checks)
+        from . import tasks
+        from .db import pool
+        registry.register_collector(pool.collect_metrics)
+        registry.register_collector(tasks.collect_metrics)
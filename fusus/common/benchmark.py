@@ -0,0 +1,66 @@
+import json
+import threading
+import time
+from collections import Counter
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(latencies, statuses=None, elapsed=None):
+    """Latencies in seconds in, a JSON-friendly summary in milliseconds out."""
+    summary = {
+        'count': len(latencies),
+        'p50_ms': _ms(percentile(latencies, 50)),
+        'p95_ms': _ms(percentile(latencies, 95)),
+        'p99_ms': _ms(percentile(latencies, 99)),
+        'mean_ms': _ms(sum(latencies) / len(latencies)) if latencies else None,
+    }
+    if elapsed:
+        summary['throughput_rps'] = round(len(latencies) / elapsed, 2)
+    if statuses is not None:
+        summary['statuses'] = {str(code): count for code, count in sorted(Counter(statuses).items())}
+    return summary
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+class Recorder:
+    """Thread-safe collector of (latency, status) samples per name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    def record(self, name, latency, status):
+        with self._lock:
+            self.samples.setdefault(name, []).append((latency, status))
+
+    def summary(self, name, elapsed=None, ok=lambda status: 200 <= status < 400):
+        samples = self.samples.get(name, [])
+        latencies = [latency for latency, status in samples if ok(status)]
+        return summarize(latencies, [status for _, status in samples], elapsed)
+
+
+def run_workers(target, concurrency, duration):
+    """Call ``target(deadline)`` on ``concurrency`` threads and return the elapsed wall time."""
+    deadline = time.monotonic() + duration
+    started = time.monotonic()
+    threads = [threading.Thread(target=target, args=(deadline,), daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.monotonic() - started
+
+
+def write_results(path, results):
+    with open(path, 'w') as output:
+        json.dump(results, output, indent=2, sort_keys=True)
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+
+@register()
+def shared_cache_check(app_configs, **kwargs):
+    """Settings that are only correct when every worker uses the same cache."""
+    if settings.CACHE_SHARED:
+        return []
+    errors = []
+    if settings.JWT_REVOCATION_CHECK:
+        errors.append(Error('JWT_REVOCATION_CHECK needs a cache shared by all workers; revocations '
+                            'would only reach the worker that made them.',
+                            hint='Set CACHE_URL to a Redis or Memcached server.', id='common.E001'))
+    if settings.THROTTLE_STORE == 'cache':
+        errors.append(Error("THROTTLE_STORE='cache' needs a cache shared by all workers.",
+                            hint="Set CACHE_URL, or use THROTTLE_STORE='mmap'.", id='common.E002'))
+    return errors
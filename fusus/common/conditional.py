@@ -0,0 +1,35 @@
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+CONDITIONAL_HEADERS = ('HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE')
+
+
+class Validators:
+    """
+    Strong ETag and Last-Modified of a representation, built from the ``version`` and
+    ``updated_at`` of every row it is rendered from.
+    """
+
+    def __init__(self, *rows):
+        self.etag = quote_etag('-'.join(f"{version}.{int(updated_at.timestamp() * 1000000)}"
+                                        for version, updated_at in rows))
+        self.last_modified = max(updated_at for _, updated_at in rows)
+
+    def not_modified(self, request):
+        """A 304 response when the request's If-None-Match/If-Modified-Since still match, else None."""
+        response = get_conditional_response(request, etag=self.etag,
+                                            last_modified=int(self.last_modified.timestamp()))
+        if response is None or response.status_code != status.HTTP_304_NOT_MODIFIED:
+            return None
+        return self.apply(Response(status=status.HTTP_304_NOT_MODIFIED))
+
+    def apply(self, response):
+        response['ETag'] = self.etag
+        response['Last-Modified'] = http_date(self.last_modified.timestamp())
+        return response
+
+
+def is_conditional(request):
+    return any(header in request.META for header in CONDITIONAL_HEADERS)
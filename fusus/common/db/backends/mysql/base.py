@@ -0,0 +1,11 @@
+from django.db.backends.mysql import base
+
+from common.db.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    """django.db.backends.mysql with connections kept in a per-process pool (see DATABASES POOL)."""
+
+    @staticmethod
+    def ping_connection(connection):
+        connection.ping()
@@ -0,0 +1,227 @@
+import os
+import threading
+import time
+
+from django.db.utils import OperationalError
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of DB-API connections of one database in one process.
+
+    Idle connections are handed out most recently used first, so a quiet worker lets the rest
+    age out. A connection is pinged on checkout when it has been idle for ``ping_interval``
+    seconds or more, and closed instead of reused once it has been idle for ``max_idle`` or open
+    for ``max_lifetime`` seconds. With all ``max_size`` connections in use, checkouts wait up to
+    ``timeout`` seconds and then raise PoolTimeout.
+    """
+
+    def __init__(self, max_size=10, timeout=5.0, max_idle=300.0, max_lifetime=3600.0, ping_interval=1.0,
+                 ping=None):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.ping_interval = ping_interval
+        self.ping = ping or _select_one
+        self.pid = os.getpid()
+        self._condition = threading.Condition()
+        self._idle = []
+        self._opened_at = {}
+        self._size = 0
+        self._stats = {'created': 0, 'closed': 0, 'waits': 0, 'wait_seconds': 0.0, 'timeouts': 0,
+                       'failed_checks': 0}
+
+    def acquire(self, connect):
+        """A healthy connection, opened with ``connect()`` when none is idle and the pool isn't full."""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            connection, last_used = self._checkout(deadline)
+            if connection is None:
+                return self._open(connect)
+            if time.monotonic() - last_used < self.ping_interval or self._healthy(connection):
+                return connection
+            self.discard(connection)
+
+    def release(self, connection):
+        """Return a checked-out connection; it is closed instead if it outlived ``max_lifetime``."""
+        now = time.monotonic()
+        with self._condition:
+            if now - self._opened_at.get(id(connection), now) >= self.max_lifetime:
+                self._close(connection)
+            else:
+                self._idle.append((connection, now))
+            self._condition.notify()
+
+    def discard(self, connection):
+        """Close a checked-out connection that must not be reused."""
+        with self._condition:
+            self._close(connection)
+            self._condition.notify()
+
+    def close_idle(self):
+        with self._condition:
+            while self._idle:
+                self._close(self._idle.pop()[0])
+
+    def stats(self):
+        with self._condition:
+            return dict(self._stats, size=self._size, idle=len(self._idle), in_use=self._size - len(self._idle))
+
+    def _checkout(self, deadline):
+        """An idle connection and when it was last used, or (None, None) with a slot reserved to open one."""
+        waiting_since = None
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                while self._idle:
+                    connection, last_used = self._idle.pop()
+                    if now - last_used >= self.max_idle or now - self._opened_at[id(connection)] >= self.max_lifetime:
+                        self._close(connection)
+                        continue
+                    self._waited(waiting_since, now)
+                    return connection, last_used
+                if self._size < self.max_size:
+                    self._size += 1
+                    self._waited(waiting_since, now)
+                    return None, None
+
+                if waiting_since is None:
+                    waiting_since = now
+                    self._stats['waits'] += 1
+                if now >= deadline:
+                    self._waited(waiting_since, now)
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(f'No database connection available within {self.timeout}s '
+                                      f'({self.max_size} in use)')
+                self._condition.wait(deadline - now)
+
+    def _open(self, connect):
+        try:
+            connection = connect()
+        except BaseException:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._opened_at[id(connection)] = time.monotonic()
+            self._stats['created'] += 1
+        return connection
+
+    def _healthy(self, connection):
+        try:
+            self.ping(connection)
+            return True
+        except Exception:
+            with self._condition:
+                self._stats['failed_checks'] += 1
+            return False
+
+    def _waited(self, waiting_since, now):
+        if waiting_since is not None:
+            self._stats['wait_seconds'] += now - waiting_since
+
+    def _close(self, connection):
+        self._size -= 1
+        self._opened_at.pop(id(connection), None)
+        self._stats['closed'] += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+def _select_one(connection):
+    cursor = connection.cursor()
+    try:
+        cursor.execute('SELECT 1')
+    finally:
+        cursor.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, options, ping=None):
+    """
+    The pool of database ``alias`` in this process. ``options`` are the database's POOL settings
+    (MAX_SIZE, TIMEOUT, MAX_IDLE, MAX_LIFETIME, PING_INTERVAL). A forked child starts with an
+    empty pool and leaves the connections it inherited to its parent.
+    """
+    with _pools_lock:
+        pool = _pools.get(alias)
+        if pool is None or pool.pid != os.getpid():
+            pool = _pools[alias] = ConnectionPool(
+                max_size=options.get('MAX_SIZE', 10),
+                timeout=options.get('TIMEOUT', 5.0),
+                max_idle=options.get('MAX_IDLE', 300.0),
+                max_lifetime=options.get('MAX_LIFETIME', 3600.0),
+                ping_interval=options.get('PING_INTERVAL', 1.0),
+                ping=ping,
+            )
+        return pool
+
+
+def close_pools():
+    """Close the idle connections of every pool of this process."""
+    with _pools_lock:
+        pools = [pool for pool in _pools.values() if pool.pid == os.getpid()]
+    for pool in pools:
+        pool.close_idle()
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    Mixed in front of a backend's DatabaseWrapper so that connecting checks a connection out of
+    the process's pool and closing (at the end of every request, with CONN_MAX_AGE=0) puts it
+    back. Works the same under WSGI and ASGI: Django closes the connection of whichever thread
+    served the request when the request finishes.
+    """
+
+    @staticmethod
+    def ping_connection(connection):
+        _select_one(connection)
+
+    @property
+    def pool(self):
+        return get_pool(self.alias, self.settings_dict.get('POOL', {}), self.ping_connection)
+
+    def get_new_connection(self, conn_params):
+        connect = super().get_new_connection
+        return self.pool.acquire(lambda: connect(conn_params))
+
+    def _close(self):
+        if self.connection is None:
+            return
+        # Connections closed mid-transaction, outside autocommit or after errors may hold state
+        # the next user must not inherit.
+        if self.in_atomic_block or not self.autocommit or self.errors_occurred:
+            self.pool.discard(self.connection)
+        else:
+            self.pool.release(self.connection)
+
+
+def collect_metrics():
+    with _pools_lock:
+        pools = [(alias, pool) for alias, pool in _pools.items() if pool.pid == os.getpid()]
+    metrics = []
+    for alias, pool in pools:
+        stats = pool.stats()
+        labels = {'alias': alias}
+        metrics += [
+            ('gauge', 'db_pool_connections', dict(labels, state='in_use'), stats['in_use']),
+            ('gauge', 'db_pool_connections', dict(labels, state='idle'), stats['idle']),
+            ('counter', 'db_pool_connections_created_total', labels, stats['created']),
+            ('counter', 'db_pool_connections_closed_total', labels, stats['closed']),
+            ('counter', 'db_pool_waits_total', labels, stats['waits']),
+            ('counter', 'db_pool_wait_seconds_total', labels, round(stats['wait_seconds'], 6)),
+            ('counter', 'db_pool_timeouts_total', labels, stats['timeouts']),
+            ('counter', 'db_pool_failed_checks_total', labels, stats['failed_checks']),
+        ]
+    return metrics
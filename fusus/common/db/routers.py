@@ -0,0 +1,135 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.utils import OperationalError
+
+# Per request: {'replica': send reads to a replica, 'wrote': the request wrote to the primary}.
+_request = ContextVar('replica_routing', default=None)
+
+
+class ReplicaSet:
+    """
+    Picks a replica alias from ``DATABASE_REPLICAS`` for a read. A replica that can't be
+    connected to is skipped for ``REPLICA_RETRY_SECONDS``; with none left, reads fall back to
+    the primary.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._down_until = {}
+
+    def choose(self):
+        now = time.monotonic()
+        with self._lock:
+            candidates = [alias for alias in settings.DATABASE_REPLICAS if self._down_until.get(alias, 0) <= now]
+        random.shuffle(candidates)
+        for alias in candidates:
+            try:
+                connections[alias].ensure_connection()
+                return alias
+            except OperationalError:
+                self.mark_down(alias)
+        return None
+
+    def mark_down(self, alias):
+        with self._lock:
+            self._down_until[alias] = time.monotonic() + settings.REPLICA_RETRY_SECONDS
+
+    def reset(self):
+        with self._lock:
+            self._down_until.clear()
+
+
+replicas = ReplicaSet()
+
+
+class ReplicaRouter:
+    """
+    Sends reads to a replica while ``ReplicaMiddleware`` allows it for the current request and
+    every write to the primary, remembering that the request wrote.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _request.get()
+        if state is None or not state['replica']:
+            return None
+        alias = state.get('alias') or replicas.choose()
+        if alias is None:
+            state['replica'] = False
+            return None
+        state['alias'] = alias
+        return alias
+
+    def db_for_write(self, model, **hints):
+        state = _request.get()
+        if state is not None:
+            state['replica'] = False
+            state['wrote'] = True
+        # Explicit, or instances read from a replica would be saved back to it.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+@contextmanager
+def use_primary():
+    """Read from the primary inside the block, e.g. to fill a cache other clients read from."""
+    state = _request.get()
+    if state is None or not state['replica']:
+        yield
+        return
+    state['replica'] = False
+    try:
+        yield
+    finally:
+        state['replica'] = True
+
+
+class ReplicaMiddleware:
+    """
+    Lets GET/HEAD requests to views with ``replica_reads = True`` read from a replica. A request
+    that writes sets a signed cookie that keeps that client on the primary for
+    ``REPLICA_STICKY_SECONDS``, so it reads its own writes despite replication lag.
+    """
+    cookie_name = 'primary_until'
+    cookie_salt = 'common.db.routers'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = {'replica': False, 'wrote': False}
+        token = _request.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request.reset(token)
+
+        if state['wrote'] and settings.DATABASE_REPLICAS:
+            response.set_signed_cookie(self.cookie_name, int(time.time()), salt=self.cookie_salt,
+                                       max_age=settings.REPLICA_STICKY_SECONDS, httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'cls', None)
+        if request.method in ('GET', 'HEAD') and getattr(view_class, 'replica_reads', False) \
+                and settings.DATABASE_REPLICAS and not self._sticky(request):
+            _request.get()['replica'] = True
+
+    def _sticky(self, request):
+        return request.get_signed_cookie(self.cookie_name, default=None, salt=self.cookie_salt,
+                                         max_age=settings.REPLICA_STICKY_SECONDS) is not None
@@ -0,0 +1,46 @@
+from rest_framework.exceptions import ValidationError
+
+FIELDS_PARAM = 'fields'
+EXCLUDE_PARAM = 'exclude'
+
+
+def _names(request, param):
+    value = request.query_params.get(param)
+    if value is None:
+        return None
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def sparse_fields(request, allowed):
+    """
+    Output fields picked with ``?fields=a,b`` and/or ``?exclude=c``, in the order of
+    ``allowed``. Names outside ``allowed`` are a 400.
+    """
+    fields, exclude = _names(request, FIELDS_PARAM), _names(request, EXCLUDE_PARAM)
+    for param, names in ((FIELDS_PARAM, fields), (EXCLUDE_PARAM, exclude)):
+        unknown = [name for name in names or () if name not in allowed]
+        if unknown:
+            raise ValidationError({param: [f"Unknown field(s): {', '.join(unknown)}. "
+                                           f"Allowed: {', '.join(allowed)}."]})
+
+    selected = [name for name in allowed
+                if (fields is None or name in fields) and name not in (exclude or ())]
+    if not selected:
+        raise ValidationError({FIELDS_PARAM: ["No fields selected."]})
+    return selected
+
+
+def columns_for(fields, sources, *extra):
+    """Database columns behind ``fields`` (``sources`` maps field -> columns), plus ``extra``."""
+    columns = [column for field in fields for column in sources[field]]
+    return list(dict.fromkeys(columns + list(extra)))
+
+
+class DynamicFieldsMixin:
+    """Serializer mixin taking ``fields=[...]`` to render a subset of its declared fields."""
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
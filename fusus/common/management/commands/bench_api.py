@@ -0,0 +1,255 @@
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from common.benchmark import Recorder, run_workers, write_results
+from user.models import User
+from user.seeding import parse_roles, seed
+
+DEFAULT_MIX = ('login=5,users-list=25,users-search=15,users-detail=20,'
+               'organization-detail=10,organization-users-list=20,info=5')
+METRIC_SAMPLE = re.compile(r'^db_queries_per_request_(sum|count)\{method="(\w+)",route="([^"]+)"\} ([0-9.e+-]+)$')
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in ENDPOINTS:
+            raise CommandError(f'Unknown endpoint {name!r}, choose from {", ".join(ENDPOINTS)}')
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+class Principal:
+    def __init__(self, user, token, peers):
+        self.id = user.id
+        self.email = user.email
+        self.name = user.name
+        self.user_type = user.user_type
+        self.organization_id = user.organization_id
+        self.headers = {'Authorization': f'Bearer {token}'}
+        self.peer_ids = [pk for pk, _ in peers]
+        self.peer_names = [name for _, name in peers]
+
+
+def _managers(principals):
+    return [p for p in principals if p.user_type in ('ADMIN', 'VIEWER')]
+
+
+def _login(ctx, principal):
+    return 'POST', '/api/auth/login/', {'json': {'email': principal.email, 'password': ctx.password}}
+
+
+def _users_list(ctx, principal):
+    return 'GET', '/api/users/', {'headers': principal.headers}
+
+
+def _users_search(ctx, principal):
+    term = random.choice(principal.peer_names)
+    return 'GET', '/api/users/', {'headers': principal.headers, 'params': {'search': term}}
+
+
+def _users_detail(ctx, principal):
+    pk = principal.id if principal.user_type == 'USER' else random.choice(principal.peer_ids)
+    return 'GET', f'/api/users/{pk}/', {'headers': principal.headers}
+
+
+def _organization_detail(ctx, principal):
+    return 'GET', f'/api/organizations/{principal.organization_id}/', {'headers': principal.headers}
+
+
+def _organization_users_list(ctx, principal):
+    return 'GET', f'/api/organization/{principal.organization_id}/users/', {'headers': principal.headers}
+
+
+def _info(ctx, principal):
+    return 'GET', '/api/info/', {'headers': principal.headers}
+
+
+# endpoint name -> (metrics route label, request builder, whether only ADMIN/VIEWER may call it)
+ENDPOINTS = {
+    'login': ('auth-login', _login, False),
+    'users-list': ('users-list', _users_list, True),
+    'users-search': ('users-list', _users_search, True),
+    'users-detail': ('users-detail', _users_detail, False),
+    'organization-detail': ('organization-detail', _organization_detail, True),
+    'organization-users-list': ('organization-users-list', _organization_users_list, True),
+    'info': ('info', _info, False),
+}
+
+
+class Command(BaseCommand):
+    help = ('Replays a weighted mix of user/org API calls against a local server and reports '
+            'throughput, p50/p95/p99 latency and SQL queries per request for each endpoint')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', action='store_true', help='Insert a benchmark dataset first')
+        parser.add_argument('--orgs', type=int, default=1000)
+        parser.add_argument('--users-per-org', type=int, default=1000)
+        parser.add_argument('--roles', default='ADMIN=1,VIEWER=9,USER=90')
+        parser.add_argument('--password', default='password', help='Password of the benchmark users')
+        parser.add_argument('--workers', type=int, default=1, help='Processes generating rows for --seed')
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--start-server', action='store_true',
+                            help='Start a server for the run (see --server-cmd) and stop it afterwards')
+        parser.add_argument('--server-cmd', default=f'{sys.executable} manage.py runserver --noreload 127.0.0.1:8000',
+                            help='Command used by --start-server')
+        parser.add_argument('--mix', default=DEFAULT_MIX, help='Weighted endpoints, e.g. users-list=3,info=1')
+        parser.add_argument('--principals', type=int, default=20, help='Users logged in to drive the load')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=30.0)
+        parser.add_argument('--metrics-token', default=settings.METRICS_TOKEN)
+        parser.add_argument('--output', help='Write results as JSON to this file')
+        parser.add_argument('--compare', help='Baseline results JSON; exit with an error on regressions')
+        parser.add_argument('--tolerance', type=float, default=0.10,
+                            help='Allowed relative slowdown before --compare reports a regression')
+
+    def handle(self, *args, **options):
+        mix = parse_mix(options['mix'])
+        self.base_url = options['base_url'].rstrip('/')
+        self.password = options['password']
+
+        if options['seed']:
+            summary = seed(options['orgs'], options['users_per_org'], parse_roles(options['roles']),
+                           password=options['password'], workers=options['workers'], log=self.stdout.write)
+            self.stdout.write(self.style.SUCCESS(f'Seeded {summary}'))
+
+        server = self._start_server(options['server_cmd']) if options['start_server'] else None
+        try:
+            results = self._run(mix, options)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=10)
+
+        self.stdout.write(json.dumps(results, indent=2, sort_keys=True))
+        if options['output']:
+            write_results(options['output'], results)
+        if options['compare']:
+            self._compare(results, options['compare'], options['tolerance'])
+
+    def _start_server(self, command):
+        server = subprocess.Popen(command.split(), env=dict(os.environ, THROTTLE_ENABLED='False'))
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            try:
+                requests.get(f'{self.base_url}/metrics', timeout=1)
+                return server
+            except requests.RequestException:
+                if server.poll() is not None:
+                    raise CommandError(f'Server exited with {server.returncode}')
+                time.sleep(0.25)
+        server.terminate()
+        raise CommandError('Server did not start within 60 seconds')
+
+    def _principals(self, count):
+        users = list(User.objects.filter(email__contains='@bench-org').order_by('?')[:count])
+        if not users:
+            raise CommandError('No benchmark users found, run with --seed first')
+
+        principals = []
+        for user in users:
+            response = requests.post(f'{self.base_url}/api/auth/login/',
+                                     json={'email': user.email, 'password': self.password}, timeout=60)
+            if response.status_code != 200:
+                raise CommandError(f'Could not log in {user.email}: {response.status_code} {response.text}')
+            peers = list(User.objects.filter(organization_id=user.organization_id).values_list('id', 'name')[:200])
+            principals.append(Principal(user, response.json()['access'], peers))
+        return principals
+
+    def _query_counts(self, token):
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        response = requests.get(f'{self.base_url}/metrics', headers=headers, timeout=10)
+        totals = {}
+        for line in response.text.splitlines():
+            match = METRIC_SAMPLE.match(line)
+            if match:
+                kind, method, route, value = match.groups()
+                totals.setdefault((method, route), {})[kind] = float(value)
+        return totals
+
+    def _run(self, mix, options):
+        principals = self._principals(options['principals'])
+        managers = _managers(principals)
+        names, weights = list(mix), list(mix.values())
+        recorder = Recorder()
+
+        def worker(deadline):
+            session = requests.Session()
+            while time.monotonic() < deadline:
+                name = random.choices(names, weights)[0]
+                _, build, managers_only = ENDPOINTS[name]
+                candidates = managers if managers_only else principals
+                if not candidates:
+                    continue
+                method, path, kwargs = build(self, random.choice(candidates))
+                started = time.perf_counter()
+                try:
+                    status = session.request(method, self.base_url + path, timeout=60, **kwargs).status_code
+                except requests.RequestException:
+                    status = 599
+                recorder.record(name, time.perf_counter() - started, status)
+
+        before = self._query_counts(options['metrics_token'])
+        elapsed = run_workers(worker, options['concurrency'], options['duration'])
+        after = self._query_counts(options['metrics_token'])
+
+        endpoints = {}
+        for name in names:
+            route = ENDPOINTS[name][0]
+            summary = recorder.summary(name, elapsed)
+            method = 'POST' if name == 'login' else 'GET'
+            start, end = before.get((method, route), {}), after.get((method, route), {})
+            count = end.get('count', 0) - start.get('count', 0)
+            summary['queries_per_request'] = (
+                round((end.get('sum', 0) - start.get('sum', 0)) / count, 2) if count else None
+            )
+            endpoints[name] = summary
+
+        return {
+            'meta': {
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'base_url': self.base_url,
+                'concurrency': options['concurrency'],
+                'duration': options['duration'],
+                'mix': mix,
+                'principals': len(principals),
+                'users': User.objects.count(),
+            },
+            'total_rps': round(sum(len(recorder.samples.get(name, [])) for name in names) / elapsed, 2),
+            'endpoints': endpoints,
+        }
+
+    def _compare(self, results, path, tolerance):
+        with open(path) as source:
+            baseline = json.load(source)
+
+        regressions = []
+        for name, current in results['endpoints'].items():
+            previous = baseline.get('endpoints', {}).get(name)
+            if not previous:
+                continue
+            for key in ('p95_ms', 'p99_ms'):
+                if previous.get(key) and current.get(key) and current[key] > previous[key] * (1 + tolerance):
+                    regressions.append(f'{name}: {key} {previous[key]} -> {current[key]}')
+            if previous.get('throughput_rps') and current.get('throughput_rps', 0) < \
+                    previous['throughput_rps'] * (1 - tolerance):
+                regressions.append(f'{name}: throughput {previous["throughput_rps"]} -> {current.get("throughput_rps")}')
+            if previous.get('queries_per_request') is not None and current.get('queries_per_request') is not None \
+                    and current['queries_per_request'] > previous['queries_per_request']:
+                regressions.append(f'{name}: queries/request {previous["queries_per_request"]} -> '
+                                   f'{current["queries_per_request"]}')
+
+        if regressions:
+            raise CommandError('Regressions against baseline:\n  ' + '\n  '.join(regressions))
+        self.stdout.write(self.style.SUCCESS(f'No regressions against {path}'))
@@ -0,0 +1,70 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from common.authentication import tokens_for_user
+from common.benchmark import summarize, write_results
+from user.models import User
+
+BROWSER = 'common.middleware.BrowserMiddleware'
+
+
+def full_stack():
+    """MIDDLEWARE as it was before the split: the browser middleware inline for every path."""
+    middleware = []
+    for path in settings.MIDDLEWARE:
+        middleware += settings.BROWSER_MIDDLEWARE if path == BROWSER else [path]
+    return middleware
+
+
+class Command(BaseCommand):
+    help = ('Serves users-detail and organization-detail in-process through the full and the API '
+            'middleware stacks and reports the per-request time saved')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per endpoint and stack')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(user_type='ADMIN').order_by('id').first()
+        if user is None:
+            raise CommandError('No ADMIN user; seed some with insert_initial_data first.')
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {tokens_for_user(user).access_token}',
+                   'HTTP_HOST': 'localhost'}
+        endpoints = {
+            'users-detail': reverse('users-detail', args=[user.id]),
+            'organization-detail': reverse('organization-detail', args=[user.organization_id]),
+        }
+        stacks = {'full': full_stack(), 'api': list(settings.MIDDLEWARE)}
+
+        results = {}
+        for name, url in endpoints.items():
+            results[name] = {}
+            for stack, middleware in stacks.items():
+                with override_settings(MIDDLEWARE=middleware, THROTTLE_RATES={}):
+                    # A client loads its middleware chain on its first request.
+                    client = Client()
+                    client.get(url, **headers)
+                    results[name][stack] = summarize(self._timed(client, url, headers, options['requests']))
+            full, api = results[name]['full'], results[name]['api']
+            results[name]['saved_mean_ms'] = round(full['mean_ms'] - api['mean_ms'], 3)
+            results[name]['saved_p50_ms'] = round(full['p50_ms'] - api['p50_ms'], 3)
+
+        self.stdout.write(json.dumps(results, indent=2, sort_keys=True))
+        if options['output']:
+            write_results(options['output'], results)
+
+    @staticmethod
+    def _timed(client, url, headers, count):
+        latencies = []
+        for _ in range(count):
+            started = time.perf_counter()
+            response = client.get(url, **headers)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                raise CommandError(f'GET {url} returned {response.status_code}')
+        return latencies
@@ -0,0 +1,63 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework import renderers
+
+from common import renderers as fast_renderers
+from common.benchmark import write_results
+from common.fields import columns_for
+from common.middleware import ENCODERS
+from user.models import User
+from user.serializers import READ_SOURCES, UserReadSerializer, add_related_ids
+
+
+class Command(BaseCommand):
+    help = ('Renders a users-list page with every available renderer and compresses it with every '
+            'available encoding, reporting bytes and CPU time per response')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help='Users per rendered page')
+        parser.add_argument('--repeat', type=int, default=50, help='Renders/compressions timed per variant')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        fields = list(READ_SOURCES)
+        rows = list(User.objects.order_by('id').values(*columns_for(fields, READ_SOURCES))[:options['rows']])
+        if not rows:
+            raise CommandError('No users to render; seed some with insert_initial_data --orgs first.')
+        add_related_ids(rows)
+        payload = {'next': None, 'previous': None, 'results': UserReadSerializer(rows, many=True).data}
+
+        variants = {'json-stdlib': renderers.JSONRenderer()}
+        if fast_renderers.orjson is not None:
+            variants['json-orjson'] = fast_renderers.JSONRenderer()
+        if fast_renderers.msgpack is not None:
+            variants['msgpack'] = fast_renderers.MessagePackRenderer()
+
+        repeat = options['repeat']
+        results = {'rows': len(rows), 'renderers': {}, 'encodings': {}}
+        for name, renderer in variants.items():
+            body, cpu = _timed(lambda: renderer.render(payload), repeat)
+            results['renderers'][name] = {'bytes': len(body), 'cpu_ms': cpu}
+
+        body = variants['json-stdlib'].render(payload)
+        for name, encoder_class in ENCODERS.items():
+            def compress():
+                encoder = encoder_class()
+                return encoder.compress(body) + encoder.finish()
+            compressed, cpu = _timed(compress, repeat)
+            results['encodings'][name] = {'bytes': len(compressed), 'ratio': round(len(body) / len(compressed), 2),
+                                          'cpu_ms': cpu}
+
+        self.stdout.write(json.dumps(results, indent=2, sort_keys=True))
+        if options['output']:
+            write_results(options['output'], results)
+
+
+def _timed(func, repeat):
+    """The result of ``func`` and its mean CPU time over ``repeat`` calls, in milliseconds."""
+    started = time.process_time()
+    for _ in range(repeat):
+        result = func()
+    return result, round((time.process_time() - started) / repeat * 1000, 3)
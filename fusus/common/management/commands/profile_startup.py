@@ -0,0 +1,123 @@
+import json
+import re
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from common.benchmark import write_results
+
+# Run in a fresh interpreter: import the entry point, then serve one request through it.
+PROBE = r'''
+import asyncio, importlib, json, sys, time
+from wsgiref.util import setup_testing_defaults
+
+entrypoint, path = sys.argv[1:3]
+started = time.perf_counter()
+application = importlib.import_module(f'fusus.{entrypoint}').application
+imported = time.perf_counter()
+
+if entrypoint == 'wsgi':
+    environ = {'PATH_INFO': path}
+    setup_testing_defaults(environ)
+    statuses = []
+    b''.join(application(environ, lambda status, headers, exc_info=None: statuses.append(status)))
+    status = int(statuses[0].split()[0])
+else:
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+             'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+             'headers': [(b'host', b'127.0.0.1')], 'client': ('127.0.0.1', 0), 'server': ('127.0.0.1', 80)}
+    asyncio.run(application(scope, receive, send))
+    status = messages[0]['status']
+
+print(json.dumps({'import_ms': (imported - started) * 1000,
+                  'first_request_ms': (time.perf_counter() - imported) * 1000, 'status': status}))
+'''
+
+IMPORT_TIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def parse_importtime(stderr):
+    """Self time per imported module, in milliseconds, from ``python -X importtime`` output."""
+    modules = {}
+    for line in stderr.splitlines():
+        match = IMPORT_TIME.match(line)
+        if match:
+            modules[match.group(4)] = int(match.group(1)) / 1000
+    return modules
+
+
+class Command(BaseCommand):
+    help = ('Measures cold start of fusus.wsgi/fusus.asgi in fresh interpreters: import time, first '
+            'request time and the modules that cost the most to import. Fails when over budget')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entrypoint', choices=['wsgi', 'asgi', 'both'], default='both')
+        parser.add_argument('--runs', type=int, default=3, help='Cold starts per entry point; medians are reported')
+        parser.add_argument('--path', default='/metrics', help='Path of the first request')
+        parser.add_argument('--budget-ms', type=float, default=settings.STARTUP_BUDGET_MS,
+                            help='Maximum import + first request time per entry point')
+        parser.add_argument('--top', type=int, default=15, help='Most expensive modules and packages to list')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        entrypoints = ['wsgi', 'asgi'] if options['entrypoint'] == 'both' else [options['entrypoint']]
+        results = {'budget_ms': options['budget_ms'], 'entrypoints': {}}
+        over_budget = []
+        for entrypoint in entrypoints:
+            runs = [self._cold_start(entrypoint, options['path']) for _ in range(options['runs'])]
+            summary = self._summarize(runs, options['top'])
+            results['entrypoints'][entrypoint] = summary
+            if summary['total_ms'] > options['budget_ms']:
+                over_budget.append(f"{entrypoint} {summary['total_ms']:.0f} ms")
+
+        self.stdout.write(json.dumps(results, indent=2))
+        if options['output']:
+            write_results(options['output'], results)
+        if over_budget:
+            raise CommandError(f"Over the {options['budget_ms']:.0f} ms startup budget: {', '.join(over_budget)}")
+
+    @staticmethod
+    def _cold_start(entrypoint, path):
+        completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE, entrypoint, path],
+                                   capture_output=True, text=True, cwd=settings.BASE_DIR)
+        if completed.returncode != 0:
+            raise CommandError(f'Starting fusus.{entrypoint} failed:\n{completed.stderr[-2000:]}')
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        result['modules'] = parse_importtime(completed.stderr)
+        return result
+
+    @staticmethod
+    def _summarize(runs, top):
+        modules, packages = defaultdict(list), defaultdict(float)
+        for run in runs:
+            for name, self_ms in run['modules'].items():
+                modules[name].append(self_ms)
+        medians = {name: statistics.median(values) for name, values in modules.items()}
+        for name, self_ms in medians.items():
+            packages[name.split('.')[0]] += self_ms
+
+        import_ms = statistics.median(run['import_ms'] for run in runs)
+        first_request_ms = statistics.median(run['first_request_ms'] for run in runs)
+        return {
+            'import_ms': round(import_ms, 1),
+            'first_request_ms': round(first_request_ms, 1),
+            'total_ms': round(import_ms + first_request_ms, 1),
+            'status': runs[-1]['status'],
+            'modules_imported': len(medians),
+            'top_packages_ms': {name: round(value, 1) for name, value in
+                                sorted(packages.items(), key=lambda item: -item[1])[:top]},
+            'top_modules_ms': {name: round(value, 1) for name, value in
+                               sorted(medians.items(), key=lambda item: -item[1])[:top]},
+        }
@@ -0,0 +1,36 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from common.tasks import run_due_tasks
+
+
+class Command(BaseCommand):
+    help = 'Runs the durable tasks of the DeferredTask table until stopped (SIGTERM/SIGINT finish the current batch)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=100, help='Tasks claimed per query')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when no task is due')
+        parser.add_argument('--once', action='store_true', help='Exit once no task is due')
+
+    def handle(self, *args, **options):
+        stopping = threading.Event()
+        previous = {signum: signal.signal(signum, lambda *_: stopping.set())
+                    for signum in (signal.SIGTERM, signal.SIGINT)}
+
+        total = 0
+        try:
+            while not stopping.is_set():
+                close_old_connections()
+                claimed = run_due_tasks(options['batch'])
+                total += claimed
+                if not claimed:
+                    if options['once']:
+                        break
+                    stopping.wait(options['sleep'])
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+        self.stdout.write(self.style.SUCCESS(f'Ran {total} tasks'))
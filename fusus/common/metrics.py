@@ -0,0 +1,192 @@
+import glob
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+HELP = {
+    'http_requests_total': 'Requests by route, method and status code.',
+    'http_request_duration_seconds': 'Time spent producing the response.',
+    'http_response_size_bytes': 'Size of the response body.',
+    'db_queries_per_request': 'SQL statements executed per request.',
+    'db_time_per_request_seconds': 'Time spent in SQL per request.',
+}
+
+
+class Registry:
+    """
+    In-process store of counters, gauges and histograms keyed by (name, labels).
+
+    With ``METRICS_DIR`` set, each worker periodically writes its snapshot to
+    ``<METRICS_DIR>/metrics-<pid>.json`` and the exposition merges every file, so any worker
+    can answer ``/metrics`` for the whole gunicorn master.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._collectors = []
+        self._last_flush = 0.0
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._gauges = {}
+            self._histograms = {}
+
+    def inc(self, name, labels, value=1):
+        key = (name, _freeze(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, labels, value):
+        with self._lock:
+            self._gauges[(name, _freeze(labels))] = value
+
+    def observe(self, name, labels, value, buckets):
+        key = (name, _freeze(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'buckets': list(buckets), 'counts': [0] * len(buckets),
+                                                     'sum': 0, 'count': 0}
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram['counts'][index] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def register_collector(self, collector):
+        """``collector()`` returns ``[(kind, name, labels, value), ...]`` with kind 'counter' or 'gauge'."""
+        self._collectors.append(collector)
+
+    def snapshot(self):
+        counters, gauges = {}, {}
+        for collector in self._collectors:
+            for kind, name, labels, value in collector():
+                target = counters if kind == 'counter' else gauges
+                target[_encode(name, _freeze(labels))] = value
+
+        with self._lock:
+            counters.update({_encode(*key): value for key, value in self._counters.items()})
+            gauges.update({_encode(*key): value for key, value in self._gauges.items()})
+            histograms = {_encode(*key): dict(value, counts=list(value['counts']))
+                          for key, value in self._histograms.items()}
+        return {'counters': counters, 'gauges': gauges, 'histograms': histograms}
+
+    def maybe_flush(self):
+        directory = settings.METRICS_DIR
+        if not directory or time.monotonic() - self._last_flush < settings.METRICS_FLUSH_INTERVAL:
+            return
+        self.flush()
+
+    def flush(self):
+        directory = settings.METRICS_DIR
+        if not directory:
+            return
+        self._last_flush = time.monotonic()
+        path = os.path.join(directory, f'metrics-{os.getpid()}.json')
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as output:
+            json.dump(self.snapshot(), output)
+        os.replace(tmp_path, path)
+
+    def collect(self):
+        """Snapshot of this process, merged with the other workers' files when METRICS_DIR is set."""
+        if not settings.METRICS_DIR:
+            return self.snapshot()
+
+        self.flush()
+        merged = {'counters': {}, 'gauges': {}, 'histograms': {}}
+        for path in glob.glob(os.path.join(settings.METRICS_DIR, 'metrics-*.json')):
+            try:
+                with open(path) as source:
+                    _merge(merged, json.load(source))
+            except (OSError, ValueError):
+                continue
+        return merged
+
+
+def mark_process_dead(pid):
+    """Drop the gauges of a worker that exited; its counters and histograms keep counting."""
+    directory = settings.METRICS_DIR
+    if not directory:
+        return
+    path = os.path.join(directory, f'metrics-{pid}.json')
+    try:
+        with open(path) as source:
+            snapshot = json.load(source)
+    except (OSError, ValueError):
+        return
+    snapshot['gauges'] = {}
+    with open(path, 'w') as output:
+        json.dump(snapshot, output)
+
+
+def _freeze(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _encode(name, labels):
+    return json.dumps([name, labels])
+
+
+def _decode(key):
+    name, labels = json.loads(key)
+    return name, [tuple(label) for label in labels]
+
+
+def _merge(merged, snapshot):
+    for kind in ('counters', 'gauges'):
+        for key, value in snapshot.get(kind, {}).items():
+            merged[kind][key] = merged[kind].get(key, 0) + value
+    for key, value in snapshot.get('histograms', {}).items():
+        current = merged['histograms'].get(key)
+        if current is None:
+            merged['histograms'][key] = dict(value, counts=list(value['counts']))
+            continue
+        current['counts'] = [a + b for a, b in zip(current['counts'], value['counts'])]
+        current['sum'] += value['sum']
+        current['count'] += value['count']
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def render(snapshot):
+    """Prometheus text exposition format (version 0.0.4)."""
+    families = {}
+    for kind, type_name in (('counters', 'counter'), ('gauges', 'gauge'), ('histograms', 'histogram')):
+        for key, value in snapshot[kind].items():
+            name, labels = _decode(key)
+            families.setdefault((name, type_name), []).append((labels, value))
+
+    lines = []
+    for (name, type_name), samples in sorted(families.items()):
+        if name in HELP:
+            lines.append(f'# HELP {name} {HELP[name]}')
+        lines.append(f'# TYPE {name} {type_name}')
+        for labels, value in sorted(samples, key=lambda sample: sample[0]):
+            if type_name != 'histogram':
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+                continue
+            for bound, count in zip(value['buckets'], value['counts']):
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {count}')
+            lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {value["count"]}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {value["sum"]}')
+            lines.append(f'{name}_count{_format_labels(labels)} {value["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
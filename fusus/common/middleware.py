@@ -0,0 +1,280 @@
+import itertools
+import re
+import time
+import zlib
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.handlers.exception import convert_exception_to_response
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+from django.utils.module_loading import import_string
+
+from .metrics import LATENCY_BUCKETS, QUERY_BUCKETS, SIZE_BUCKETS, registry
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """
+    Records per-route latency, status codes, response size and SQL count/time per request.
+    Place it first in MIDDLEWARE so the numbers cover the whole stack.
+    """
+    skipped_routes = ('metrics',)
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryStats()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(queries))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match else 'unmatched'
+        if route in self.skipped_routes:
+            return response
+
+        labels = {'route': route, 'method': request.method}
+        registry.inc('http_requests_total', dict(labels, status=str(response.status_code)))
+        registry.observe('http_request_duration_seconds', labels, elapsed, LATENCY_BUCKETS)
+        registry.observe('db_queries_per_request', labels, queries.count, QUERY_BUCKETS)
+        registry.observe('db_time_per_request_seconds', labels, queries.duration, LATENCY_BUCKETS)
+
+        if response.streaming:
+            response.streaming_content = self._count_streamed(response.streaming_content, labels)
+        else:
+            registry.observe('http_response_size_bytes', labels, len(response.content), SIZE_BUCKETS)
+
+        registry.maybe_flush()
+        return response
+
+    @staticmethod
+    def _count_streamed(content, labels):
+        size = 0
+        for chunk in content:
+            size += len(chunk)
+            yield chunk
+        registry.observe('http_response_size_bytes', labels, size, SIZE_BUCKETS)
+
+
+class _Gzip:
+    def __init__(self):
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class _Brotli:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=5)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class _Zstd:
+    def __init__(self):
+        self._compressor = zstandard.ZstdCompressor(level=3).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+ENCODERS = {'gzip': _Gzip}
+if brotli is not None:
+    ENCODERS['br'] = _Brotli
+if zstandard is not None:
+    ENCODERS['zstd'] = _Zstd
+
+ACCEPT_ENCODING = re.compile(r'\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*(?:,|$)')
+
+
+def choose_encoding(accept_encoding, preferred):
+    """The best of ``preferred`` (available encodings, best first) the client accepts, or None."""
+    weights = {}
+    for name, q in ACCEPT_ENCODING.findall(accept_encoding.lower()):
+        try:
+            weights[name] = float(q) if q else 1.0
+        except ValueError:
+            continue
+    candidates = [(weights.get(name, weights.get('*', 0)), -index, name)
+                  for index, name in enumerate(preferred) if name in ENCODERS]
+    best = max(candidates, default=None)
+    return best[2] if best and best[0] > 0 else None
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses with the best encoding both sides support (``COMPRESSION_ENCODINGS``,
+    brotli and zstd only when their packages are installed). Bodies smaller than
+    ``COMPRESSION_MIN_SIZE`` are sent as is; for streamed responses the first chunks are read
+    ahead to make that call, then every chunk is flushed as it is produced.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.has_header('Content-Encoding') or response.status_code in (204, 304) \
+                or request.method == 'HEAD':
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), settings.COMPRESSION_ENCODINGS)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            head, content = self._read_ahead(response.streaming_content)
+            if content is None:
+                response.streaming_content = head
+                return response
+            response.streaming_content = self._compress_stream(itertools.chain(head, content or ()), encoding)
+            response.headers.pop('Content-Length', None)
+        else:
+            if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+                return response
+            encoder = ENCODERS[encoding]()
+            compressed = encoder.compress(response.content) + encoder.finish()
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        # The compressed bytes differ from the identity representation (RFC 9110 8.8.3).
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        registry.inc('http_responses_compressed_total', {'encoding': encoding})
+        return response
+
+    @staticmethod
+    def _read_ahead(content):
+        """
+        Chunks until COMPRESSION_MIN_SIZE bytes are buffered, and the rest of the stream, or None
+        when it ended below the threshold.
+        """
+        content = iter(content)
+        head, size = [], 0
+        for chunk in content:
+            head.append(chunk)
+            size += len(chunk)
+            if size >= settings.COMPRESSION_MIN_SIZE:
+                return head, content
+        return head, None
+
+    @staticmethod
+    def _compress_stream(content, encoding):
+        encoder = ENCODERS[encoding]()
+        for chunk in content:
+            data = encoder.compress(chunk) + encoder.flush()
+            if data:
+                yield data
+        yield encoder.finish()
+
+
+class BrowserMiddleware:
+    """
+    Runs ``BROWSER_MIDDLEWARE`` (sessions, CSRF, authentication, messages) as a nested chain for
+    everything except ``API_PATH_PREFIXES``. The API authenticates with bearer tokens only, so its
+    requests go straight to the rest of MIDDLEWARE while the admin keeps the full stack.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._view_middleware = []
+        self._template_response_middleware = []
+        self._exception_middleware = []
+        # Built like django.core.handlers.base.BaseHandler.load_middleware.
+        handler = convert_exception_to_response(get_response)
+        for path in reversed(settings.BROWSER_MIDDLEWARE):
+            middleware = import_string(path)(handler)
+            if hasattr(middleware, 'process_view'):
+                self._view_middleware.insert(0, middleware.process_view)
+            if hasattr(middleware, 'process_template_response'):
+                self._template_response_middleware.append(middleware.process_template_response)
+            if hasattr(middleware, 'process_exception'):
+                self._exception_middleware.append(middleware.process_exception)
+            handler = convert_exception_to_response(middleware)
+        self._browser_chain = handler
+
+    @staticmethod
+    def is_api(request):
+        return request.path_info.startswith(tuple(settings.API_PATH_PREFIXES))
+
+    def __call__(self, request):
+        if self.is_api(request):
+            return self.get_response(request)
+        return self._browser_chain(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if self.is_api(request):
+            return None
+        for process_view in self._view_middleware:
+            response = process_view(request, view_func, view_args, view_kwargs)
+            if response is not None:
+                return response
+        return None
+
+    def process_template_response(self, request, response):
+        if not self.is_api(request):
+            for process_template_response in self._template_response_middleware:
+                response = process_template_response(request, response)
+        return response
+
+    def process_exception(self, request, exception):
+        if self.is_api(request):
+            return None
+        for process_exception in self._exception_middleware:
+            response = process_exception(request, exception)
+            if response is not None:
+                return response
+        return None
@@ -1,3 +1,43 @@
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+
+class VersionedModel(models.Model):
+    """
+    Adds a ``version`` bumped on every save and an ``updated_at`` timestamp, used for ETag and
+    Last-Modified headers. Bulk writes and ``QuerySet.update()`` have to bump both themselves,
+    see ``version_bump()``.
+    """
+    version = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            self.version += 1
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'version', 'updated_at'}
+        super().save(*args, **kwargs)
+
+
+def version_bump():
+    """Keyword arguments for ``QuerySet.update()`` that bump the version of every updated row."""
+    return {'version': models.F('version') + 1, 'updated_at': timezone.now()}
+
+
+class DeferredTask(models.Model):
+    """A function call queued by ``common.tasks.enqueue`` and run by ``manage.py run_tasks``."""
+    name = models.CharField(max_length=255)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    attempts = models.PositiveIntegerField(default=0)
+    # When the task is due; NULL once it has failed every attempt.
+    run_at = models.DateTimeField(null=True, default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['run_at'], name='deferred_task_run_at_idx')]
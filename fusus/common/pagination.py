@@ -0,0 +1,133 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward-only keyset pagination.
+
+    Pages are fetched with ``WHERE (ordering) > (last row) ORDER BY ordering LIMIT n + 1``
+    so every page costs the same index range scan as the first one; there is no OFFSET
+    and no COUNT(*). The cursor is an opaque, url-safe encoding of the last row's key.
+    """
+    ordering = ('organization_id', 'id')
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = getattr(settings, 'MAX_PAGE_SIZE', 1000)
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.keyset = self.get_ordering(view)
+
+        queryset = queryset.order_by(*self.keyset)
+        position = self.decode_cursor(request)
+        if position is not None:
+            position = self.clean_position(position, queryset)
+            queryset = queryset.filter(self.get_position_filter(position))
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_ordering(self, view):
+        return tuple(getattr(view, 'keyset_ordering', self.ordering))
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_position_filter(self, position):
+        # (a, b) > (x, y)  <=>  a > x OR (a = x AND b > y), which MySQL turns into a
+        # single range scan on a composite index over the same columns.
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.keyset, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def encode_cursor(self, row):
+        position = [self._value(row, field.lstrip('-')) for field in self.keyset]
+        payload = json.dumps(position, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            position = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        except (binascii.Error, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.keyset):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def clean_position(self, position, queryset):
+        """Cursor values converted to the types of their keyset fields; anything else is a 404."""
+        try:
+            cleaned = [self._field(queryset, field.lstrip('-')).to_python(value)
+                       for field, value in zip(self.keyset, position)]
+        except (DjangoValidationError, FieldDoesNotExist, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in cleaned:
+            raise NotFound(self.invalid_cursor_message)
+        return cleaned
+
+    @staticmethod
+    def _field(queryset, name):
+        # Keyset keys may be annotations, e.g. the search rank.
+        annotation = queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return queryset.model._meta.get_field(name)
+
+    @staticmethod
+    def _value(row, name):
+        if isinstance(row, dict):
+            return row[name]
+        return getattr(row, name)
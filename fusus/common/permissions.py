@@ -23,4 +23,4 @@ class IsUser(BasePermission):
         return request.user.user_type == UserType.USER.value
 
     def has_object_permission(self, request, view, obj):
-        return obj == request.user
+        return obj.pk == request.user.pk
@@ -0,0 +1,117 @@
+import csv
+import json
+
+from rest_framework import parsers, renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Whatever orjson/msgpack can't serialize natively (lazy strings, Decimals, and datetimes so
+# they come out exactly as with DRF's encoder) goes through DRF's JSONEncoder.
+_encode_default = JSONEncoder().default
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    """
+    DRF's JSONRenderer backed by orjson when it is installed. Falls back to the stdlib encoder
+    without orjson and for the indented/ASCII output orjson doesn't produce.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type or '', renderer_context or {})
+        if orjson is None or indent or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        return orjson.dumps(data, default=_encode_default,
+                            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+
+
+class JSONParser(parsers.JSONParser):
+    renderer_class = JSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read() if stream is not None else b'')
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_encode_default, datetime=False)
+
+
+class MessagePackParser(parsers.BaseParser):
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False, strict_map_key=False)
+        except (ValueError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError) as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+class NDJSONRenderer(BaseRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        return b''.join(self.stream([rows]))
+
+    def stream(self, batches, fields=None):
+        for rows in batches:
+            yield b''.join(_dumps(row) + b'\n' for row in rows)
+
+
+def _dumps(row):
+    if orjson is None:
+        return json.dumps(row, cls=JSONEncoder).encode()
+    return orjson.dumps(row, default=_encode_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+
+
+class CSVRenderer(BaseRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        fields = list(rows[0].keys()) if rows else []
+        return b''.join(self.stream([rows], fields))
+
+    def stream(self, batches, fields):
+        writer = csv.writer(_Echo())
+        yield writer.writerow(fields).encode(self.charset)
+        for rows in batches:
+            yield ''.join(writer.writerow([row.get(field) for field in fields]) for row in rows).encode(self.charset)
@@ -0,0 +1,213 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import timedelta
+from importlib import import_module
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .models import DeferredTask
+
+logger = logging.getLogger(__name__)
+
+
+class TaskQueueFull(Exception):
+    pass
+
+
+def _backoff(attempt):
+    return min(settings.TASK_RETRY_BACKOFF * 2 ** attempt, settings.TASK_RETRY_MAX_DELAY)
+
+
+class TaskExecutor:
+    """
+    Per-process pool of ``TASK_WORKERS`` threads running side effects that a response doesn't
+    have to wait for. At most ``TASK_QUEUE_SIZE`` tasks wait; beyond that ``submit`` raises
+    ``TaskQueueFull``. A failing task is retried up to ``TASK_MAX_RETRIES`` times with
+    exponential backoff. Tasks are lost if the process is killed, see ``enqueue`` for ones
+    that must survive that.
+    """
+
+    def __init__(self):
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stats = {'submitted': 0, 'succeeded': 0, 'retried': 0, 'failed': 0, 'rejected': 0}
+
+    def _start(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Threads inherited through fork() don't run in the child; start new ones.
+                self._queue = queue.Queue(settings.TASK_QUEUE_SIZE)
+                self._stopping = threading.Event()
+                for index in range(settings.TASK_WORKERS):
+                    threading.Thread(target=self._work, name=f'task-{index}', daemon=True).start()
+                self._pid = os.getpid()
+
+    def _count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def submit(self, fn, *args, **kwargs):
+        if self._pid != os.getpid():
+            self._start()
+        if self._stopping.is_set():
+            raise TaskQueueFull()
+        try:
+            self._queue.put_nowait((fn, args, kwargs))
+        except queue.Full:
+            self._count('rejected')
+            raise TaskQueueFull() from None
+        self._count('submitted')
+
+    def _work(self):
+        while True:
+            fn, args, kwargs = self._queue.get()
+            try:
+                self._run(fn, args, kwargs)
+            finally:
+                # Give this thread's database connections back (to the pool, if any).
+                connections.close_all()
+                self._queue.task_done()
+
+    def _run(self, fn, args, kwargs):
+        for attempt in range(settings.TASK_MAX_RETRIES + 1):
+            try:
+                fn(*args, **kwargs)
+            except Exception:
+                if attempt == settings.TASK_MAX_RETRIES:
+                    self._count('failed')
+                    logger.exception('Task %s failed after %d attempts', fn.__qualname__, attempt + 1)
+                    return
+                self._count('retried')
+                # Returns right away once draining: the process is about to exit.
+                self._stopping.wait(_backoff(attempt))
+            else:
+                self._count('succeeded')
+                return
+
+    def wait(self, timeout):
+        """Block until every submitted task has finished, at most ``timeout`` seconds. True if they did."""
+        if self._pid != os.getpid():
+            return True
+        deadline = time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def drain(self, timeout):
+        """Stop taking tasks, skip the remaining backoff delays and wait for the queued tasks."""
+        if self._pid != os.getpid():
+            return True
+        self._stopping.set()
+        finished = self.wait(timeout)
+        if not finished:
+            logger.warning('%d tasks still queued after %ss', self._queue.unfinished_tasks, timeout)
+        return finished
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._queue.unfinished_tasks if self._pid == os.getpid() else 0
+        return stats
+
+
+task_executor = TaskExecutor()
+atexit.register(lambda: task_executor.drain(settings.TASK_DRAIN_TIMEOUT))
+
+
+def _submit(fn, args, kwargs):
+    try:
+        task_executor.submit(fn, *args, **kwargs)
+    except TaskQueueFull:
+        # Shed to the caller rather than drop the side effect.
+        try:
+            fn(*args, **kwargs)
+        except Exception:
+            logger.exception('Task %s failed', fn.__qualname__)
+
+
+def defer(fn, *args, using=None, **kwargs):
+    """
+    Run ``fn(*args, **kwargs)`` on the task executor once the current transaction commits, or
+    right away outside of one. Nothing runs if the transaction rolls back. When the queue is
+    full the task runs on the calling thread instead.
+    """
+    transaction.on_commit(lambda: _submit(fn, args, kwargs), using=using)
+
+
+def enqueue(fn, *args, delay=0, **kwargs):
+    """
+    Store a call of ``fn`` (a module-level function taking JSON-serializable arguments) as a
+    ``DeferredTask`` row for ``manage.py run_tasks``. The row is written in the caller's
+    transaction, so the task exists exactly when the caller's writes do.
+    """
+    if '.' in fn.__qualname__ or '<' in fn.__qualname__:
+        raise ValueError(f'{fn.__qualname__} is not a module-level function')
+    return DeferredTask.objects.create(name=f'{fn.__module__}.{fn.__qualname__}', args=list(args), kwargs=kwargs,
+                                       run_at=timezone.now() + timedelta(seconds=delay))
+
+
+def _resolve(name):
+    module, _, attribute = name.rpartition('.')
+    return getattr(import_module(module), attribute)
+
+
+def claim_tasks(limit):
+    """
+    Lease up to ``limit`` due tasks to this worker for ``TASK_LEASE_SECONDS``. Rows locked by
+    another worker are skipped; a task whose worker died becomes due again when its lease ends.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        tasks = list(DeferredTask.objects.select_for_update(skip_locked=True)
+                     .filter(run_at__lte=now).order_by('run_at')[:limit])
+        lease = now + timedelta(seconds=settings.TASK_LEASE_SECONDS)
+        for task in tasks:
+            task.attempts += 1
+            task.run_at = lease
+        DeferredTask.objects.bulk_update(tasks, ['attempts', 'run_at'])
+    return tasks
+
+
+def run_task(task):
+    """Run a claimed task. It is deleted on success, else rescheduled with backoff or given up on."""
+    try:
+        _resolve(task.name)(*task.args, **task.kwargs)
+    except Exception as error:
+        logger.exception('Task %s (%s) failed', task.pk, task.name)
+        task.last_error = repr(error)
+        # run_at NULL: out of retries, kept for inspection.
+        task.run_at = (timezone.now() + timedelta(seconds=_backoff(task.attempts - 1))
+                       if task.attempts <= settings.TASK_MAX_RETRIES else None)
+        task.save(update_fields=['last_error', 'run_at'])
+        return False
+    task.delete()
+    return True
+
+
+def run_due_tasks(limit=100):
+    """Claim and run due tasks, returning how many were claimed."""
+    tasks = claim_tasks(limit)
+    for task in tasks:
+        run_task(task)
+    return len(tasks)
+
+
+def collect_metrics():
+    stats = task_executor.stats()
+    return [
+        ('counter', 'background_tasks_total', {'result': 'succeeded'}, stats['succeeded']),
+        ('counter', 'background_tasks_total', {'result': 'failed'}, stats['failed']),
+        ('counter', 'background_tasks_total', {'result': 'rejected'}, stats['rejected']),
+        ('counter', 'background_task_retries_total', {}, stats['retried']),
+        ('gauge', 'background_tasks_queued', {}, stats['queued']),
+    ]
@@ -1,11 +1,18 @@
+from django.core.cache import cache
 from rest_framework.test import APITestCase
+from org.cache import organization_cache
 from org.models import Organization
 from user.models import User
-from rest_framework_simplejwt.tokens import RefreshToken
+from common.authentication import tokens_for_user
+from common.throttling import get_store
 
 class BaseTestCase(APITestCase):
 
     def setUp(self):
+        cache.clear()
+        organization_cache.clear()
+        get_store().reset()
+
         self.org1 = Organization.objects.create(name="TestOrg1")
         self.org2 = Organization.objects.create(name="TestOrg2")
 
@@ -43,5 +50,5 @@ class BaseTestCase(APITestCase):
                         users.append(user)
 
                 self.tokens[user_type][org.name] = [
-                    str(RefreshToken.for_user(user).access_token) for user in users
+                    str(tokens_for_user(user).access_token) for user in users
                 ]
\ No newline at end of file
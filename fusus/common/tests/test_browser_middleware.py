@@ -0,0 +1,39 @@
+from django.test import Client
+from django.urls import reverse
+from rest_framework import status
+
+from common.tests.base import BaseTestCase
+
+
+class BrowserMiddlewareTests(BaseTestCase):
+
+    def test_api_skips_browser_middleware(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        response = self.client.get(reverse('organization-detail', args=[self.org1.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(hasattr(response.wsgi_request, 'session'))
+        self.assertNotIn('Cookie', response.get('Vary', ''))
+
+    def test_api_post_needs_no_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        response = client.post(reverse('auth-login'), {'email': 'admin1@testorg1.com', 'password': 'password'},
+                               content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_admin_keeps_full_stack(self):
+        client = Client(enforce_csrf_checks=True)
+        response = client.get(reverse('admin:login'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('csrftoken', response.cookies)
+        self.assertTrue(hasattr(response.wsgi_request, 'session'))
+
+        # CSRF's process_view still runs for the admin.
+        response = client.post(reverse('admin:login'), {'username': 'admin1@testorg1.com', 'password': 'password'})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        response = client.post(reverse('admin:login'), {
+            'username': 'admin1@testorg1.com', 'password': 'password',
+            'csrfmiddlewaretoken': client.cookies['csrftoken'].value,
+        })
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(client.get(reverse('admin:index')).status_code, status.HTTP_200_OK)
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+
+from common.checks import shared_cache_check
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+
+    @override_settings(CACHE_SHARED=False, JWT_REVOCATION_CHECK=True, THROTTLE_STORE='cache')
+    def test_local_cache_rejects_settings_that_need_a_shared_one(self):
+        self.assertEqual([error.id for error in shared_cache_check(None)], ['common.E001', 'common.E002'])
+
+    @override_settings(CACHE_SHARED=True, JWT_REVOCATION_CHECK=True, THROTTLE_STORE='cache')
+    def test_shared_cache(self):
+        self.assertEqual(shared_cache_check(None), [])
+
+    @override_settings(CACHE_SHARED=False, JWT_REVOCATION_CHECK=False, THROTTLE_STORE='mmap')
+    def test_local_cache_with_defaults(self):
+        self.assertEqual(shared_cache_check(None), [])
+
+    def test_local_memory_cache_is_never_shared(self):
+        # Also under the dev settings, which gunicorn runs with several workers when ENV is unset.
+        self.assertEqual(settings.CACHES['default']['BACKEND'], 'django.core.cache.backends.locmem.LocMemCache')
+        self.assertFalse(settings.CACHE_SHARED)
@@ -0,0 +1,58 @@
+import json
+import os
+import tempfile
+
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+
+from common.metrics import Registry, registry, render
+from common.tests.base import BaseTestCase
+
+
+class MetricsTests(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        registry.reset()
+
+    def test_request_metrics_are_exposed(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        self.client.get(reverse('users-list'))
+        self.client.get(reverse('organization-detail', args=[self.org1.id]))
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.content.decode()
+
+        self.assertIn('http_requests_total{method="GET",route="users-list",status="200"} 1', body)
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="organization-detail"} 1', body)
+        self.assertIn('db_queries_per_request_bucket{method="GET",route="users-list",le="+Inf"} 1', body)
+        self.assertIn('# TYPE http_response_size_bytes histogram', body)
+        self.assertIn('organization_cache_lookups_total{result="miss"}', body)
+        self.assertNotIn('route="metrics"', body)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_worker_snapshots_are_merged(self):
+        local = Registry()
+        local.inc('http_requests_total', {'route': 'info', 'method': 'GET', 'status': '200'}, 2)
+        local.observe('http_request_duration_seconds', {'route': 'info', 'method': 'GET'}, 0.02, (0.01, 0.1))
+
+        other = Registry()
+        other.inc('http_requests_total', {'route': 'info', 'method': 'GET', 'status': '200'}, 3)
+        other.observe('http_request_duration_seconds', {'route': 'info', 'method': 'GET'}, 0.005, (0.01, 0.1))
+
+        with tempfile.TemporaryDirectory() as directory, self.settings(METRICS_DIR=directory):
+            with open(os.path.join(directory, 'metrics-1.json'), 'w') as output:
+                json.dump(other.snapshot(), output)
+            body = render(local.collect())
+
+        self.assertIn('http_requests_total{method="GET",route="info",status="200"} 5', body)
+        self.assertIn('http_request_duration_seconds_bucket{method="GET",route="info",le="0.01"} 1', body)
+        self.assertIn('http_request_duration_seconds_bucket{method="GET",route="info",le="0.1"} 2', body)
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="info"} 2', body)
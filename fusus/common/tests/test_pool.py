@@ -0,0 +1,150 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.db import connection
+from django.db.backends.sqlite3 import base as sqlite_base
+from django.test import SimpleTestCase
+
+from common.db import pool as pool_module
+from common.db.pool import ConnectionPool, PooledDatabaseWrapperMixin, PoolTimeout, collect_metrics
+
+
+class PooledSQLiteWrapper(PooledDatabaseWrapperMixin, sqlite_base.DatabaseWrapper):
+    pass
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'pool.sqlite3')
+
+    def connect(self):
+        return sqlite3.connect(self.path, check_same_thread=False)
+
+    def test_reuses_connections(self):
+        pool = ConnectionPool(max_size=2)
+        first = pool.acquire(self.connect)
+        pool.release(first)
+        self.assertIs(pool.acquire(self.connect), first)
+        self.assertEqual(pool.stats()['created'], 1)
+        self.assertEqual(pool.stats()['in_use'], 1)
+
+    def test_bounded_checkout_waits_then_times_out(self):
+        pool = ConnectionPool(max_size=1, timeout=0.05)
+        held = pool.acquire(self.connect)
+        with self.assertRaises(PoolTimeout):
+            pool.acquire(self.connect)
+
+        threading.Timer(0.02, pool.release, args=[held]).start()
+        pool.timeout = 1
+        self.assertIs(pool.acquire(self.connect), held)
+        stats = pool.stats()
+        self.assertEqual((stats['waits'], stats['timeouts'], stats['created']), (2, 1, 1))
+        self.assertGreater(stats['wait_seconds'], 0)
+
+    def test_broken_connection_is_replaced_on_checkout(self):
+        pool = ConnectionPool(ping_interval=0)
+        broken = pool.acquire(self.connect)
+        pool.release(broken)
+        broken.close()
+        replacement = pool.acquire(self.connect)
+        self.assertIsNot(replacement, broken)
+        self.assertEqual(pool.stats()['failed_checks'], 1)
+        self.assertEqual(pool.stats()['size'], 1)
+
+    def test_idle_and_old_connections_are_recycled(self):
+        pool = ConnectionPool(max_idle=0.01)
+        idle = pool.acquire(self.connect)
+        pool.release(idle)
+        time.sleep(0.02)
+        self.assertIsNot(pool.acquire(self.connect), idle)
+
+        pool = ConnectionPool(max_lifetime=0)
+        old = pool.acquire(self.connect)
+        pool.release(old)
+        self.assertEqual(pool.stats()['closed'], 1)
+        self.assertIsNot(pool.acquire(self.connect), old)
+
+    def test_failed_connect_frees_its_slot(self):
+        pool = ConnectionPool(max_size=1, timeout=0)
+
+        def fail():
+            raise sqlite3.OperationalError('unreachable')
+        with self.assertRaises(sqlite3.OperationalError):
+            pool.acquire(fail)
+        pool.acquire(self.connect)
+
+
+class PooledDatabaseWrapperTests(SimpleTestCase):
+    """The mixin on Django's SQLite backend, standing in for common.db.backends.mysql."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.alias = f'pooled-{id(self)}'
+        self.settings_dict = dict(connection.settings_dict, NAME=os.path.join(directory.name, 'pool.sqlite3'),
+                                  POOL={'MAX_SIZE': 2, 'TIMEOUT': 1})
+        self.addCleanup(lambda: pool_module._pools.pop(self.alias).close_idle())
+
+    def wrapper(self):
+        return PooledSQLiteWrapper(self.settings_dict, self.alias)
+
+    def test_close_returns_the_connection(self):
+        database = self.wrapper()
+        database.ensure_connection()
+        raw = database.connection
+        database.close()
+        self.assertIsNone(database.connection)
+
+        database.ensure_connection()
+        self.assertIs(database.connection, raw)
+        with database.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            self.assertEqual(cursor.fetchone(), (1,))
+        database.close()
+        stats = database.pool.stats()
+        self.assertEqual((stats['created'], stats['in_use'], stats['idle']), (1, 0, 1))
+
+    def test_connection_closed_in_transaction_is_discarded(self):
+        database = self.wrapper()
+        database.ensure_connection()
+        raw = database.connection
+        database.set_autocommit(False)
+        database.close()
+        database.ensure_connection()
+        self.assertIsNot(database.connection, raw)
+        database.close()
+
+    def test_threads_share_a_bounded_pool(self):
+        seen, errors = set(), []
+
+        def work():
+            database = self.wrapper()
+            try:
+                for _ in range(5):
+                    database.ensure_connection()
+                    seen.add(id(database.connection))
+                    database.close()
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=work) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        stats = self.wrapper().pool.stats()
+        self.assertLessEqual(stats['created'], 2)
+        self.assertEqual(stats['in_use'], 0)
+
+        metrics = {(name, labels.get('state')): value for _, name, labels, value in collect_metrics()
+                   if labels['alias'] == self.alias}
+        self.assertEqual(metrics[('db_pool_connections', 'in_use')], 0)
+        self.assertLessEqual(metrics[('db_pool_connections_created_total', None)], 2)
@@ -0,0 +1,129 @@
+import re
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+
+from common.tests.base import BaseTestCase
+from org.cache import organization_cache
+from user.models import User
+from user.seeding import seed
+
+# Tables that grow with the number of users; every query touching them has to use an index.
+WATCHED_TABLES = {'user_user', 'user_user_groups', 'user_usersearchtoken', 'org_organization'}
+ALIAS = re.compile(r'[`"](\w+)[`"] (?:AS )?[`"]?([A-Z]\d+)\b')
+QUOTED_NAME = re.compile(r'[`"](\w+)[`"]')
+
+
+def explain(sql):
+    """Plan problems of one statement: full table/index scans of watched tables and sorts."""
+    tables = {alias: table for table, alias in ALIAS.findall(sql)}
+    problems = []
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute(f'EXPLAIN {sql}')
+            columns = [column[0] for column in cursor.description]
+            for row in (dict(zip(columns, values)) for values in cursor.fetchall()):
+                table = tables.get(row['table'], row['table'])
+                if table in WATCHED_TABLES and row['type'] in ('ALL', 'index'):
+                    problems.append(f'full scan of {table} ({row["type"]})')
+                if 'Using filesort' in (row['Extra'] or ''):
+                    problems.append('filesort')
+        else:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            for detail in (row[-1] for row in cursor.fetchall()):
+                # SQLite: "SCAN t" / "SCAN t USING [COVERING] INDEX i" read every row, "SEARCH" is a range.
+                if detail.startswith('SCAN '):
+                    name = detail.split()[1]
+                    table = tables.get(name, name)
+                    if table in WATCHED_TABLES:
+                        problems.append(f'full scan of {table} ({detail})')
+                if detail.startswith('USE TEMP B-TREE FOR ORDER BY'):
+                    problems.append('filesort')
+    return problems
+
+
+class QueryPlanTests(BaseTestCase):
+    """
+    Captures the SQL of each endpoint and fails when its plan scans a whole user/org table or
+    sorts. Runs on SQLite here and on MySQL against the real schema.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        seed(20, 100, prefix='plan', chunk_size=1000)
+        with connection.cursor() as cursor:
+            if connection.vendor == 'mysql':
+                cursor.execute('ANALYZE TABLE user_user, user_user_groups, user_usersearchtoken, org_organization')
+            else:
+                cursor.execute('ANALYZE')
+
+    def setUp(self):
+        super().setUp()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+
+    def assertIndexedPlans(self, url, params=None, allow_sort=False):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params or {})
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        statements = [query['sql'] for query in queries.captured_queries
+                      if query['sql'].upper().startswith('SELECT')
+                      and WATCHED_TABLES.intersection(QUOTED_NAME.findall(query['sql']))]
+        self.assertTrue(statements)
+        for sql in statements:
+            problems = explain(sql)
+            if allow_sort:
+                problems = [problem for problem in problems if problem != 'filesort']
+            self.assertEqual(problems, [], sql)
+        return response
+
+    def test_users_list(self):
+        response = self.assertIndexedPlans(reverse('users-list'), {'page_size': 3})
+        self.assertIndexedPlans(response.data['next'])
+
+    def test_users_filter_by_phone(self):
+        self.assertIndexedPlans(reverse('users-list'), {'phone': '1000000001'})
+
+    def test_users_filter_by_user_type(self):
+        self.assertIndexedPlans(reverse('users-list'), {'user_type': 'VIEWER'})
+
+    def test_users_search(self):
+        # Relevance ordering sorts the matches; the lookups themselves must be index range scans.
+        self.assertIndexedPlans(reverse('users-list'), {'search': 'viewer us'}, allow_sort=True)
+
+    def test_user_detail(self):
+        user = User.objects.filter(organization=self.org1).first()
+        self.assertIndexedPlans(reverse('users-detail', args=[user.id]))
+
+    def test_organization_detail(self):
+        cache.clear()
+        organization_cache.clear()
+        self.assertIndexedPlans(reverse('organization-detail', args=[self.org1.id]))
+
+    def test_organization_users_list(self):
+        url = reverse('organization-users-list', args=[self.org1.id])
+        response = self.assertIndexedPlans(url, {'page_size': 3})
+        self.assertIndexedPlans(response.data['next'])
+
+    def test_organization_users_list_is_index_only(self):
+        url = reverse('organization-users-list', args=[self.org1.id])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, {'fields': 'id,name'})
+        sql = queries.captured_queries[-1]['sql']
+        with connection.cursor() as cursor:
+            if connection.vendor == 'mysql':
+                cursor.execute(f'EXPLAIN {sql}')
+                extra = cursor.fetchone()[[column[0] for column in cursor.description].index('Extra')]
+                self.assertIn('Using index', extra or '')
+            else:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                self.assertIn('COVERING INDEX', cursor.fetchone()[-1])
+
+    def test_organization_users_export(self):
+        self.assertIndexedPlans(reverse('organization-users-export', args=[self.org1.id]), {'format': 'ndjson'})
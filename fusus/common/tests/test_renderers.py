@@ -0,0 +1,87 @@
+import gzip
+import json
+import zlib
+from datetime import datetime, timezone
+from decimal import Decimal
+from io import BytesIO
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, override_settings
+from django.urls import reverse
+from django.utils.translation import gettext_lazy
+from rest_framework import renderers, status
+
+from common.middleware import CompressionMiddleware, choose_encoding
+from common.renderers import JSONParser, JSONRenderer
+from common.tests.base import BaseTestCase
+
+
+class JSONRendererTests(BaseTestCase):
+
+    def test_matches_drf_renderer(self):
+        data = {'name': 'Ünïcode', 'when': datetime(2023, 1, 2, 3, 4, 5, 678901, tzinfo=timezone.utc),
+                'price': Decimal('1.50'), 'label': gettext_lazy('Users'), 1: [None, True, 2.5]}
+        self.assertEqual(json.loads(JSONRenderer().render(data)), json.loads(renderers.JSONRenderer().render(data)))
+
+    def test_parser_round_trip(self):
+        self.assertEqual(JSONParser().parse(BytesIO(b'{"a": [1, "\\u00fc"]}')), {'a': [1, 'ü']})
+
+    def test_api_responses(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        response = self.client.get(reverse('users-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content)['results'], json.loads(json.dumps(response.data['results'])))
+
+
+@override_settings(COMPRESSION_ENCODINGS=['gzip'], COMPRESSION_MIN_SIZE=100)
+class CompressionMiddlewareTests(BaseTestCase):
+
+    def get(self, response, accept_encoding='gzip, deflate'):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def test_choose_encoding(self):
+        self.assertEqual(choose_encoding('gzip, br;q=0.5', ['zstd', 'br', 'gzip']), 'gzip')
+        self.assertEqual(choose_encoding('*', ['gzip']), 'gzip')
+        self.assertIsNone(choose_encoding('gzip;q=0, identity', ['gzip']))
+        self.assertIsNone(choose_encoding('', ['gzip']))
+
+    def test_compresses_large_responses(self):
+        body = b'{"name": "user"}' * 100
+        response = self.get(HttpResponse(body, headers={'ETag': '"1.2"'}))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], 'W/"1.2"')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(response.content), body)
+
+    def test_leaves_small_or_unaccepted_responses(self):
+        response = self.get(HttpResponse(b'{}'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, b'{}')
+
+        response = self.get(HttpResponse(b'x' * 1000), accept_encoding='identity')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_streams_chunk_by_chunk(self):
+        chunks = [b'%d,row\n' % i * 20 for i in range(10)]
+        response = self.get(StreamingHttpResponse(iter(chunks)))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+        decompressor = zlib.decompressobj(31)
+        parts = [decompressor.decompress(part) for part in response.streaming_content]
+        self.assertEqual(b''.join(parts), b''.join(chunks))
+        # Each chunk is flushed as soon as it is produced.
+        self.assertIn(chunks[0], parts)
+
+    def test_short_stream_is_sent_as_is(self):
+        response = self.get(StreamingHttpResponse(iter([b'a', b'b'])))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), b'ab')
+
+    def test_api_export_is_compressed(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        url = reverse('organization-users-export', args=[self.org1.id])
+        response = self.client.get(url, {'format': 'ndjson'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        rows = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(len(rows), 9)
@@ -0,0 +1,87 @@
+from unittest import mock
+
+from django.db import connections
+from django.db.utils import OperationalError
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+
+from common.db.routers import ReplicaMiddleware, replicas
+from common.tests.base import BaseTestCase
+from org.models import Organization
+from user.models import User
+
+REPLICA = 'replica'
+
+# A second database standing in for a replica; the test runner creates and migrates it like
+# ``default`` but nothing replicates between the two.
+_default = connections['default'].settings_dict
+connections.settings[REPLICA] = dict(_default, ENGINE='django.db.backends.sqlite3', NAME=':memory:', OPTIONS={},
+                                     POOL={}, TEST=dict(_default['TEST'], NAME=None, MIRROR=None))
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA])
+class ReplicaRoutingTests(BaseTestCase):
+    databases = {'default', REPLICA}
+
+    def setUp(self):
+        super().setUp()
+        replicas.reset()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        # The replica lags behind: it has an older copy of TestOrg1 and none of its users.
+        Organization.objects.using(REPLICA).create(id=self.org1.id, name='TestOrg1 (replica)',
+                                                   phone=self.org1.phone, address=self.org1.address)
+
+    def test_reads_go_to_replica(self):
+        response = self.client.get(reverse('users-detail', args=[self.admin_id()]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.client.get(reverse('organization-user-detail', args=[self.org1.id, self.admin_id()]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(CACHE_SHARED=True)
+    def test_shared_caches_are_filled_from_primary(self):
+        response = self.client.get(reverse('organization-detail', args=[self.org1.id]))
+        self.assertEqual(response.data['name'], 'TestOrg1')
+
+        response = self.client.get(reverse('organization-users-list', args=[self.org1.id]))
+        self.assertEqual(len(response.data['results']), 9)
+
+    def test_writer_sticks_to_primary(self):
+        response = self.client.patch(reverse('organization-detail', args=[self.org1.id]), {'phone': '5550000'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(ReplicaMiddleware.cookie_name, response.cookies)
+
+        response = self.client.get(reverse('users-detail', args=[self.admin_id()]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.client.cookies.clear()
+        response = self.client.get(reverse('users-detail', args=[self.admin_id()]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_reads_without_writes_set_no_cookie(self):
+        response = self.client.get(reverse('organization-detail', args=[self.org1.id]))
+        self.assertNotIn(ReplicaMiddleware.cookie_name, response.cookies)
+
+    def test_expired_stickiness(self):
+        self.client.patch(reverse('organization-detail', args=[self.org1.id]), {'phone': '5550000'})
+        with override_settings(REPLICA_STICKY_SECONDS=-1):
+            response = self.client.get(reverse('users-detail', args=[self.admin_id()]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_unreachable_replica_fails_over_to_primary(self):
+        with mock.patch.object(connections[REPLICA], 'ensure_connection', side_effect=OperationalError):
+            response = self.client.get(reverse('users-detail', args=[self.admin_id()]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Skipped until REPLICA_RETRY_SECONDS have passed.
+        self.assertIsNone(replicas.choose())
+
+    def test_writes_outside_requests_use_primary(self):
+        user = User.objects.create_user(email='primary@testorg1.com', password='password', name='Primary',
+                                        phone='5551111', organization_id=self.org1.id, user_type='USER',
+                                        birthdate='1992-12-20')
+        self.assertEqual(user._state.db, 'default')
+        self.assertFalse(User.objects.using(REPLICA).filter(email='primary@testorg1.com').exists())
+
+    def admin_id(self):
+        return User.objects.get(email="admin1@testorg1.com").id
@@ -0,0 +1,22 @@
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase
+
+from common.management.commands.profile_startup import parse_importtime
+
+IMPORTTIME = """import time: self [us] | cumulative | imported package
+import time:       150 |        150 |     _io
+import time:      2500 |       2650 |   requests
+import time:        40 |       2690 | user.egress
+"""
+
+
+class ProfileStartupTests(SimpleTestCase):
+
+    def test_parse_importtime(self):
+        self.assertEqual(parse_importtime(IMPORTTIME), {'_io': 0.15, 'requests': 2.5, 'user.egress': 0.04})
+
+    def test_over_budget_fails(self):
+        with self.assertRaisesMessage(CommandError, 'startup budget: wsgi'):
+            call_command('profile_startup', entrypoint='wsgi', runs=1, budget_ms=0, stdout=StringIO())
@@ -0,0 +1,148 @@
+import threading
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+
+from common import tasks
+from common.models import DeferredTask
+from common.tasks import TaskExecutor, TaskQueueFull, defer, enqueue, run_due_tasks
+
+calls = []
+
+
+def record(value):
+    calls.append(value)
+
+
+def fail():
+    raise RuntimeError('boom')
+
+
+@override_settings(TASK_WORKERS=1, TASK_QUEUE_SIZE=2, TASK_RETRY_BACKOFF=0.001)
+class TaskExecutorTests(TestCase):
+
+    def setUp(self):
+        calls.clear()
+        self.executor = TaskExecutor()
+
+    def test_runs_tasks_in_background(self):
+        self.executor.submit(record, 1)
+        self.assertTrue(self.executor.wait(5))
+        self.assertEqual(calls, [1])
+        self.assertEqual(self.executor.stats()['succeeded'], 1)
+
+    def test_retries_with_backoff(self):
+        attempts = []
+
+        def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise RuntimeError('flaky')
+
+        with self.assertLogs('common.tasks', 'ERROR'):
+            self.executor.submit(flaky)
+            self.executor.submit(fail)
+            self.assertTrue(self.executor.wait(5))
+        stats = self.executor.stats()
+        self.assertEqual(len(attempts), 3)
+        self.assertEqual((stats['succeeded'], stats['failed'], stats['retried']), (1, 1, 5))
+
+    def test_queue_is_bounded(self):
+        started, release = threading.Event(), threading.Event()
+
+        def block():
+            started.set()
+            release.wait()
+
+        self.executor.submit(block)
+        started.wait(5)
+        self.executor.submit(record, 1)
+        self.executor.submit(record, 2)
+        with self.assertRaises(TaskQueueFull):
+            self.executor.submit(record, 3)
+        release.set()
+        self.assertTrue(self.executor.wait(5))
+        self.assertEqual(self.executor.stats()['rejected'], 1)
+
+    def test_drain_finishes_queued_tasks_and_stops(self):
+        self.executor.submit(record, 1)
+        self.assertTrue(self.executor.drain(5))
+        self.assertEqual(calls, [1])
+        with self.assertRaises(TaskQueueFull):
+            self.executor.submit(record, 2)
+
+
+class DeferTests(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_runs_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            defer(record, 1)
+            self.assertEqual(calls, [])
+        self.assertTrue(tasks.task_executor.wait(5))
+        self.assertEqual(calls, [1])
+
+    def test_skipped_on_rollback(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            try:
+                with transaction.atomic():
+                    defer(record, 1)
+                    raise RuntimeError()
+            except RuntimeError:
+                pass
+        self.assertEqual(callbacks, [])
+
+    def test_runs_inline_when_queue_is_full(self):
+        with mock.patch.object(tasks.task_executor, 'submit', side_effect=TaskQueueFull), \
+                self.captureOnCommitCallbacks(execute=True):
+            defer(record, 1)
+        self.assertEqual(calls, [1])
+
+
+@override_settings(TASK_MAX_RETRIES=1, TASK_RETRY_BACKOFF=0)
+class DurableTaskTests(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_and_run(self):
+        enqueue(record, 'a')
+        self.assertEqual(run_due_tasks(), 1)
+        self.assertEqual(calls, ['a'])
+        self.assertFalse(DeferredTask.objects.exists())
+
+    def test_failed_task_is_retried_then_kept(self):
+        task = enqueue(fail)
+        with self.assertLogs('common.tasks', 'ERROR'):
+            self.assertEqual(run_due_tasks(), 1)
+        task.refresh_from_db()
+        self.assertEqual(task.attempts, 1)
+        self.assertIsNotNone(task.run_at)
+        self.assertIn('boom', task.last_error)
+
+        with self.assertLogs('common.tasks', 'ERROR'):
+            self.assertEqual(run_due_tasks(), 1)
+        task.refresh_from_db()
+        self.assertIsNone(task.run_at)
+        self.assertEqual(run_due_tasks(), 0)
+
+    def test_delayed_task_waits(self):
+        enqueue(record, 'later', delay=60)
+        self.assertEqual(run_due_tasks(), 0)
+
+    def test_rejects_nested_functions(self):
+        with self.assertRaises(ValueError):
+            enqueue(lambda: None)
+
+    def test_run_tasks_command(self):
+        enqueue(record, 'a')
+        enqueue(record, 'b')
+        output = StringIO()
+        call_command('run_tasks', '--once', stdout=output)
+        self.assertEqual(calls, ['a', 'b'])
+        self.assertIn('Ran 2 tasks', output.getvalue())
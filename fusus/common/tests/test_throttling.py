@@ -0,0 +1,118 @@
+import os
+import tempfile
+import time
+
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+
+from common.metrics import registry, render
+from common.tests.base import BaseTestCase
+from common.throttling import LocalStore, MmapStore, get_store, parse_rate
+from user.models import User
+
+RATES = {'user': '', 'organization': '', 'ip': '', 'login': '', 'list': ''}
+
+
+class StoreTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'throttle')
+
+    def assertBurstThenRecovery(self, store):
+        # 5 per 10 s: a burst of 5, then one more every 2 s.
+        now = 1000.0
+        for _ in range(5):
+            self.assertEqual(store.hit('k', 2.0, 10.0, now), 0)
+        self.assertAlmostEqual(store.hit('k', 2.0, 10.0, now), 2.0)
+        self.assertAlmostEqual(store.hit('k', 2.0, 10.0, now + 1), 1.0)
+        self.assertEqual(store.hit('k', 2.0, 10.0, now + 2), 0)
+        self.assertEqual(store.hit('other', 2.0, 10.0, now + 2), 0)
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('30/min'), (30, 60.0))
+        self.assertIsNone(parse_rate(''))
+
+    def test_local_store(self):
+        self.assertBurstThenRecovery(LocalStore())
+
+    def test_mmap_store(self):
+        self.assertBurstThenRecovery(MmapStore(self.path, 64))
+
+    def test_mmap_store_is_shared_between_processes(self):
+        store = MmapStore(self.path, 64)
+        pid = os.fork()
+        if pid == 0:
+            code = 0 if all(store.hit('k', 1.0, 3.0, 1000.0) == 0 for _ in range(3)) else 1
+            os._exit(code)
+        _, status_code = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status_code), 0)
+        self.assertGreater(MmapStore(self.path, 64).hit('k', 1.0, 3.0, 1000.0), 0)
+
+    def test_mmap_store_evicts_the_oldest_bucket(self):
+        store = MmapStore(self.path, MmapStore.PROBES)
+        for index in range(MmapStore.PROBES):
+            store.hit(f'k{index}', 50.0, 100.0, 1000.0 + index)
+        # The table is full: the newcomer takes the slot of k0, whose bucket had drained the most.
+        self.assertEqual(store.hit('new', 50.0, 100.0, 1010.0), 0)
+        self.assertEqual(store.hit('k0', 50.0, 100.0, 1010.0), 0)
+
+    def test_mmap_store_overhead(self):
+        store = MmapStore(self.path, 1024)
+        started = time.perf_counter()
+        for index in range(10000):
+            store.hit(f'user:{index % 100}', 0.001, 60.0, time.time())
+        # Generous bound for slow CI machines; a hit takes a few microseconds.
+        self.assertLess((time.perf_counter() - started) / 10000, 0.0005)
+
+
+class ThrottleTests(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        registry.reset()
+        self.addCleanup(get_store().reset)
+
+    def login(self):
+        return self.client.post(reverse('auth-login'), {'email': 'admin1@testorg1.com', 'password': 'password'})
+
+    @override_settings(THROTTLE_RATES=dict(RATES, login='2/min'))
+    def test_login_is_throttled_per_ip(self):
+        self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+        self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+        response = self.login()
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertGreaterEqual(int(response['Retry-After']), 29)
+
+        self.assertIn('throttled_requests_total{scope="login"} 1', render(registry.snapshot()))
+
+    @override_settings(THROTTLE_RATES=dict(RATES, login='2/min'))
+    def test_forwarded_for_header_does_not_open_new_buckets(self):
+        statuses = [self.client.post(reverse('auth-login'), {'email': 'admin1@testorg1.com', 'password': 'wrong'},
+                                     HTTP_X_FORWARDED_FOR=f'10.0.0.{index}').status_code
+                    for index in range(4)]
+        self.assertEqual(statuses, [400, 400, 429, 429])
+
+    @override_settings(THROTTLE_RATES=dict(RATES, organization='3/min'))
+    def test_organization_bucket_is_shared_by_its_users(self):
+        url = reverse('organization-detail', args=[self.org1.id])
+        for token in (self.tokens["ADMIN"]["TestOrg1"][0], self.tokens["VIEWER"]["TestOrg1"][0],
+                      self.tokens["VIEWER"]["TestOrg1"][1]):
+            self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + token)
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["VIEWER"]["TestOrg1"][2])
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg2"][0])
+        self.assertEqual(self.client.get(reverse('organization-detail', args=[self.org2.id])).status_code,
+                         status.HTTP_200_OK)
+
+    @override_settings(THROTTLE_RATES=dict(RATES, list='1/min'))
+    def test_list_throttle_leaves_detail_requests_alone(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        self.assertEqual(self.client.get(reverse('users-list')).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(reverse('users-list')).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        user = User.objects.get(email='user1@testorg1.com')
+        self.assertEqual(self.client.get(reverse('users-detail', args=[user.id])).status_code, status.HTTP_200_OK)
@@ -0,0 +1,36 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.urls import get_resolver
+
+from common import warmup
+from common.tests.base import BaseTestCase
+from org.cache import organization_cache
+from user.groups import group_id_for, reset_group_ids
+
+
+class WarmupTests(BaseTestCase):
+
+    def test_warm_imports_loads_urls(self):
+        warmup.warm_imports()
+        self.assertTrue(get_resolver()._populated)
+
+    def test_warm_worker_primes_caches(self):
+        cache.clear()
+        organization_cache.clear()
+        reset_group_ids()
+        with patch('user.egress.EgressIPProvider.refresh_async') as refresh_async:
+            timings = warmup.warm_worker()
+        self.assertEqual(list(timings), ['connections', 'caches'])
+        refresh_async.assert_called_once()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(organization_cache.get(self.org1.id).name, 'TestOrg1')
+            self.assertIsNotNone(group_id_for('ADMIN'))
+
+    def test_failed_step_is_skipped(self):
+        def fail():
+            raise RuntimeError('down')
+        with self.assertLogs('common.warmup', 'ERROR'):
+            timings = warmup.run([('broken', fail), ('ok', lambda: None)])
+        self.assertEqual(list(timings), ['ok'])
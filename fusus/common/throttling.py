@@ -0,0 +1,232 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+from .metrics import registry
+
+PERIODS = {'s': 1, 'sec': 1, 'm': 60, 'min': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+
+
+def parse_rate(rate):
+    """'100/min' -> (100, 60.0), or None for an empty rate (the scope isn't throttled)."""
+    if not rate:
+        return None
+    count, _, period = rate.partition('/')
+    return int(count), float(PERIODS[period])
+
+
+class LocalStore:
+    """Buckets of this process only. For tests and single-process servers."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tats = {}
+
+    def hit(self, key, interval, window, now):
+        """
+        GCRA: admit a request unless it would push the bucket's theoretical arrival time more
+        than ``window`` seconds ahead of ``now``. Returns 0 when admitted, else the seconds to wait.
+        """
+        with self._lock:
+            tat = max(self._tats.get(key, now), now) + interval
+            if tat - now > window:
+                return tat - now - window
+            self._tats[key] = tat
+            return 0.0
+
+    def reset(self):
+        with self._lock:
+            self._tats.clear()
+
+
+class MmapStore:
+    """
+    Buckets shared by every process on the host through a memory-mapped file (in /dev/shm by
+    default): an open-addressing table of (key hash, theoretical arrival time) slots.
+
+    A key lives in one of ``PROBES`` consecutive slots; only that range is locked (fcntl record
+    lock, plus a thread lock within the process), so unrelated keys don't contend. When the
+    range is full the slot with the oldest arrival time is reused. That bucket was the closest to
+    full anyway, so an eviction can only ever let a request through early, never block one.
+    """
+    SLOT = struct.Struct('<Qd')
+    PROBES = 8
+
+    def __init__(self, path, slots):
+        self.path = path
+        self.slots = slots
+        size = slots * self.SLOT.size
+        self._lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size != size:
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._map = mmap.mmap(self._fd, size)
+
+    def _slot(self, key):
+        digest = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little')
+        # 0 marks an empty slot.
+        return digest or 1, digest % (self.slots - self.PROBES + 1)
+
+    def hit(self, key, interval, window, now):
+        digest, first = self._slot(key)
+        size = self.SLOT.size
+        start, length = first * size, self.PROBES * size
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, length, start)
+            try:
+                free = oldest = None
+                for index in range(first, first + self.PROBES):
+                    slot_digest, tat = self.SLOT.unpack_from(self._map, index * size)
+                    if slot_digest == digest:
+                        target = index
+                        break
+                    # An empty slot, or a bucket that has fully refilled and is the same as no bucket.
+                    if free is None and (slot_digest == 0 or tat <= now):
+                        free = index
+                    if oldest is None or tat < oldest[1]:
+                        oldest = (index, tat)
+                else:
+                    target = free if free is not None else oldest[0]
+                    tat = now
+
+                tat = max(tat, now) + interval
+                if tat - now > window:
+                    return tat - now - window
+                self.SLOT.pack_into(self._map, target * size, digest, tat)
+                return 0.0
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, length, start)
+
+    def reset(self):
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                self._map[:] = bytes(len(self._map))
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+class CacheStore:
+    """
+    Buckets in a Django cache, for limits shared across hosts. Read-modify-write without a
+    lock, so concurrent requests for one key can slightly overshoot the rate.
+    """
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def hit(self, key, interval, window, now):
+        cache_key = f'throttle:{key}'
+        tat = max(self.cache.get(cache_key, now), now) + interval
+        if tat - now > window:
+            return tat - now - window
+        self.cache.set(cache_key, tat, int(window) + 1)
+        return 0.0
+
+    def reset(self):
+        pass
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The store selected by THROTTLE_STORE ('mmap', 'local' or 'cache'), created once per process."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if settings.THROTTLE_STORE == 'local':
+                    _store = LocalStore()
+                elif settings.THROTTLE_STORE == 'cache':
+                    _store = CacheStore(settings.THROTTLE_CACHE)
+                else:
+                    path = settings.THROTTLE_FILE or os.path.join(
+                        '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'fusus-throttle')
+                    _store = MmapStore(path, settings.THROTTLE_SLOTS)
+    return _store
+
+
+class GCRAThrottle(BaseThrottle):
+    """
+    DRF throttle admitting ``THROTTLE_RATES[scope]`` requests per period per key, with bursts of
+    up to the full count. Subclasses pick the key; returning None skips the check.
+    """
+    scope = None
+
+    def get_key(self, request, view):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        rate = parse_rate(settings.THROTTLE_RATES.get(self.scope))
+        if rate is None:
+            return True
+        key = self.get_key(request, view)
+        if key is None:
+            return True
+
+        count, period = rate
+        self.delay = get_store().hit(f'{self.scope}:{key}', period / count, period, time.time())
+        if self.delay:
+            registry.inc('throttled_requests_total', {'scope': self.scope})
+            return False
+        return True
+
+    def wait(self):
+        return self.delay
+
+
+def _authenticated(request):
+    return request.user is not None and request.user.is_authenticated
+
+
+class UserRateThrottle(GCRAThrottle):
+    scope = 'user'
+
+    def get_key(self, request, view):
+        return request.user.id if _authenticated(request) else None
+
+
+class OrganizationRateThrottle(GCRAThrottle):
+    """One bucket for all users of an organization, so a tenant can't starve the others."""
+    scope = 'organization'
+
+    def get_key(self, request, view):
+        return request.user.organization_id if _authenticated(request) else None
+
+
+class IPRateThrottle(GCRAThrottle):
+    scope = 'ip'
+
+    def get_key(self, request, view):
+        return self.get_ident(request)
+
+
+class LoginRateThrottle(IPRateThrottle):
+    """Password checks are deliberately slow; keep one client from queueing many of them."""
+    scope = 'login'
+
+
+class ListRateThrottle(UserRateThrottle):
+    """Per-user limit on list requests only (GET without a pk)."""
+    scope = 'list'
+
+    def get_key(self, request, view):
+        if request.method != 'GET' or getattr(view, 'action', 'list') != 'list':
+            return None
+        return super().get_key(request, view)
@@ -1,3 +1,13 @@
-from django.shortcuts import render
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
 
-# Create your views here.
+from .metrics import registry, render
+
+
+def metrics(request):
+    if settings.METRICS_TOKEN:
+        expected = f'Bearer {settings.METRICS_TOKEN}'
+        if not constant_time_compare(request.headers.get('Authorization', ''), expected):
+            return HttpResponse(status=401)
+    return HttpResponse(render(registry.collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,92 @@
+import logging
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.urls import URLPattern, URLResolver, get_resolver
+from rest_framework.settings import api_settings
+
+from common.db.pool import close_pools
+
+logger = logging.getLogger(__name__)
+
+# DRF settings that import their classes on first access.
+API_SETTINGS = ('DEFAULT_AUTHENTICATION_CLASSES', 'DEFAULT_PERMISSION_CLASSES', 'DEFAULT_RENDERER_CLASSES',
+                'DEFAULT_PARSER_CLASSES', 'DEFAULT_PAGINATION_CLASS', 'DEFAULT_CONTENT_NEGOTIATION_CLASS',
+                'DEFAULT_THROTTLE_CLASSES', 'DEFAULT_FILTER_BACKENDS')
+
+
+def warm_imports():
+    """Import the URLconf (and with it every view) and the classes DRF loads lazily."""
+    for name in API_SETTINGS:
+        getattr(api_settings, name)
+    resolver = get_resolver()
+    _compile(resolver.url_patterns)
+    # Builds the reverse lookup tables used by reverse() and the pagination links.
+    resolver.reverse_dict
+
+
+def _compile(patterns):
+    for pattern in patterns:
+        pattern.pattern.regex
+        if isinstance(pattern, URLResolver):
+            _compile(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern):
+            pattern.lookup_str
+
+
+def warm_connections():
+    """
+    Open a connection to every database. With the pooled backend it goes back to the pool when
+    closed, so the worker's first request doesn't pay the handshake.
+    """
+    for connection in connections.all():
+        connection.ensure_connection()
+        if not connection.in_atomic_block:
+            connection.close()
+
+
+def warm_caches():
+    """Role group ids, the most recently updated organizations and the egress IP lookup."""
+    from org.cache import organization_cache
+    from org.models import Organization
+    from user.egress import egress_ip
+    from user.groups import warm_group_ids
+
+    warm_group_ids()
+    if settings.WARMUP_ORGANIZATIONS:
+        organization_cache.prime(list(Organization.objects.order_by('-updated_at')[:settings.WARMUP_ORGANIZATIONS]))
+    egress_ip.refresh_async()
+
+
+def run(steps):
+    """Run ``(name, callable)`` steps in order, logging their duration. A failed step is logged and skipped."""
+    timings = {}
+    for name, step in steps:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            logger.exception('Warm-up step %s failed', name)
+            continue
+        timings[name] = time.perf_counter() - started
+        logger.info('Warm-up step %s took %.1f ms', name, timings[name] * 1000)
+    return timings
+
+
+def warm_master():
+    """What forked workers can share: run in the gunicorn master after the app is preloaded."""
+    timings = run([('imports', warm_imports)])
+    # No connection opened here may be inherited by the workers.
+    connections.close_all()
+    close_pools()
+    return timings
+
+
+def warm_worker(imports=False):
+    """
+    Per-process state, run in each worker before it accepts requests. Pass ``imports=True`` when
+    the app wasn't preloaded in the master.
+    """
+    steps = [('imports', warm_imports)] if imports else []
+    return run(steps + [('connections', warm_connections), ('caches', warm_caches)])
@@ -10,8 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+from datetime import timedelta
 from pathlib import Path
 import os
+from importlib.util import find_spec
+
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
@@ -41,25 +45,175 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'common.middleware.MetricsMiddleware',
+    'common.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'common.middleware.BrowserMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'common.db.routers.ReplicaMiddleware',
+]
+
+# Run by common.middleware.BrowserMiddleware for the admin and other browser pages only; requests
+# under API_PATH_PREFIXES authenticate with JWTs and skip them.
+BROWSER_MIDDLEWARE = [
+    'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
+API_PATH_PREFIXES = ['/api/', '/metrics']
+
+# The admin checks look for its middleware in MIDDLEWARE; BrowserMiddleware runs it for /admin/.
+SILENCED_SYSTEM_CHECKS = ['admin.E408', 'admin.E409', 'admin.E410']
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'common.authentication.ClaimsJWTAuthentication',
     ),
+    'DEFAULT_PAGINATION_CLASS': 'common.pagination.KeysetPagination',
+    'PAGE_SIZE': int(os.environ.get('API_PAGE_SIZE', 100)),
+    # orjson-backed JSON (stdlib json without orjson); MessagePack when msgpack is installed.
+    'DEFAULT_RENDERER_CLASSES': [
+        'common.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ] + (['common.renderers.MessagePackRenderer'] if find_spec('msgpack') else []),
+    'DEFAULT_PARSER_CLASSES': [
+        'common.renderers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ] + (['common.renderers.MessagePackParser'] if find_spec('msgpack') else []),
+    # Proxies in front of the app that append to X-Forwarded-For; the client IP used by the
+    # throttles is the address they saw. 0 (default) uses REMOTE_ADDR and ignores the header.
+    'NUM_PROXIES': int(os.environ.get('API_NUM_PROXIES', 0)),
+    'DEFAULT_THROTTLE_CLASSES': [
+        'common.throttling.UserRateThrottle',
+        'common.throttling.OrganizationRateThrottle',
+        'common.throttling.IPRateThrottle',
+    ],
 }
 
+# Request rates ('count/s|min|hour|day', empty disables the scope) per user, organization and client
+# IP, plus login attempts per IP and list requests per user. THROTTLE_ENABLED=False turns them all off.
+THROTTLE_RATES = {
+    'user': os.environ.get('THROTTLE_RATE_USER', '1200/min'),
+    'organization': os.environ.get('THROTTLE_RATE_ORGANIZATION', '12000/min'),
+    'ip': os.environ.get('THROTTLE_RATE_IP', '3000/min'),
+    'login': os.environ.get('THROTTLE_RATE_LOGIN', '30/min'),
+    'list': os.environ.get('THROTTLE_RATE_LIST', '300/min'),
+} if os.environ.get('THROTTLE_ENABLED', 'True') == 'True' else {}
+# Where throttle buckets live: 'mmap' shares them between the processes of a host through
+# THROTTLE_FILE (default: fusus-throttle in /dev/shm) with THROTTLE_SLOTS buckets, 'cache' uses
+# CACHES[THROTTLE_CACHE] to share them between hosts and 'local' keeps them per process.
+THROTTLE_STORE = os.environ.get('THROTTLE_STORE', 'mmap')
+THROTTLE_FILE = os.environ.get('THROTTLE_FILE', '')
+THROTTLE_SLOTS = int(os.environ.get('THROTTLE_SLOTS', 65536))
+THROTTLE_CACHE = os.environ.get('THROTTLE_CACHE', 'default')
+
+# Response compression: accepted encodings in order of preference ('br' and 'zstd' need the
+# brotli/zstandard packages) and the smallest body worth compressing, in bytes.
+COMPRESSION_ENCODINGS = os.environ.get('COMPRESSION_ENCODINGS', 'zstd,br,gzip').split(',')
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+
+# Hard upper bound for the ``page_size`` query parameter.
+MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', 1000))
+
+# Rows fetched per query while streaming an organization's users export.
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 2000))
+
+# Batch user API: operations accepted per request and rows per bulk INSERT/UPDATE.
+USER_BATCH_MAX_SIZE = int(os.environ.get('USER_BATCH_MAX_SIZE', 5000))
+USER_BATCH_WRITE_SIZE = int(os.environ.get('USER_BATCH_WRITE_SIZE', 500))
+# Batches creating/renaming at least this many users index them for search in a durable task
+# (needs `manage.py run_tasks`) instead of in the request. 0 always indexes in the request.
+USER_BATCH_DEFERRED_INDEX_MIN = int(os.environ.get('USER_BATCH_DEFERRED_INDEX_MIN', 0))
+
+# Passwords in a batch are hashed on a process pool once there are at least
+# PASSWORD_HASH_PARALLEL_MIN of them.
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+PASSWORD_HASH_PARALLEL_MIN = int(os.environ.get('PASSWORD_HASH_PARALLEL_MIN', 8))
+
+# User search (?search= and the admin): 'tokens' matches word prefixes against the indexed
+# UserSearchToken table, 'fulltext' uses the MySQL FULLTEXT index on name/email and 'like'
+# keeps the unindexed icontains lookups.
+USER_SEARCH_BACKEND = os.environ.get('USER_SEARCH_BACKEND', 'tokens')
+
+# Public IP reported by /api/info/. Looked up in the background, cached for
+# EGRESS_IP_TTL seconds and retried after EGRESS_IP_RETRY seconds on failure.
+EGRESS_IP_URL = os.environ.get('EGRESS_IP_URL', 'https://api.ipify.org')
+EGRESS_IP_TTL = int(os.environ.get('EGRESS_IP_TTL', 300))
+EGRESS_IP_RETRY = int(os.environ.get('EGRESS_IP_RETRY', 30))
+EGRESS_IP_TIMEOUT = float(os.environ.get('EGRESS_IP_TIMEOUT', 2))
+
+# Cache shared by every worker and host: CACHE_URL=redis://host:6379/0 or memcached://host:11211.
+# Without it each process gets its own local-memory cache and CACHE_SHARED is False, which turns
+# off what is only correct with a shared cache (the member list cache and the shared organization
+# cache level) and makes JWT_REVOCATION_CHECK and THROTTLE_STORE=cache fail the system checks.
+# This holds under every server, runserver included: the same settings run gunicorn workers.
+CACHE_URL = os.environ.get('CACHE_URL', '')
+if CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_URL}}
+elif CACHE_URL.startswith('memcached://'):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+                          'LOCATION': CACHE_URL[len('memcached://'):]}}
+elif CACHE_URL:
+    raise ImproperlyConfigured(f'Unsupported CACHE_URL scheme: {CACHE_URL}')
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+CACHE_SHARED = CACHES['default']['BACKEND'] != 'django.core.cache.backends.locmem.LocMemCache'
+
+# Organization lookups: per-process LRU (size, seconds) in front of CACHES['default'].
+ORGANIZATION_CACHE_SIZE = int(os.environ.get('ORGANIZATION_CACHE_SIZE', 1024))
+ORGANIZATION_CACHE_LOCAL_TTL = int(os.environ.get('ORGANIZATION_CACHE_LOCAL_TTL', 5))
+ORGANIZATION_CACHE_TTL = int(os.environ.get('ORGANIZATION_CACHE_TTL', 300))
+
+# Import + first request time allowed per entry point by `manage.py profile_startup`.
+STARTUP_BUDGET_MS = float(os.environ.get('STARTUP_BUDGET_MS', 1500))
+
+# Organizations (most recently updated first) loaded into the cache by each server worker at start.
+WARMUP_ORGANIZATIONS = int(os.environ.get('WARMUP_ORGANIZATIONS', ORGANIZATION_CACHE_SIZE))
+
+# Rendered organization member lists in CACHES['default'] (seconds). On a cold key one request
+# renders under a lock held for at most LOCK_TIMEOUT; the others wait up to LOCK_WAIT for it.
+MEMBERSHIP_CACHE_TTL = int(os.environ.get('MEMBERSHIP_CACHE_TTL', 300))
+MEMBERSHIP_CACHE_LOCK_TIMEOUT = int(os.environ.get('MEMBERSHIP_CACHE_LOCK_TIMEOUT', 10))
+MEMBERSHIP_CACHE_LOCK_WAIT = float(os.environ.get('MEMBERSHIP_CACHE_LOCK_WAIT', 2))
+
+# Background tasks (common.tasks): worker threads per process and queue bound (beyond it a task
+# runs on the request thread), retries with exponential backoff (seconds) and how long an exiting
+# process waits for queued tasks.
+TASK_WORKERS = int(os.environ.get('TASK_WORKERS', 2))
+TASK_QUEUE_SIZE = int(os.environ.get('TASK_QUEUE_SIZE', 1000))
+TASK_MAX_RETRIES = int(os.environ.get('TASK_MAX_RETRIES', 3))
+TASK_RETRY_BACKOFF = float(os.environ.get('TASK_RETRY_BACKOFF', 0.5))
+TASK_RETRY_MAX_DELAY = float(os.environ.get('TASK_RETRY_MAX_DELAY', 60))
+TASK_DRAIN_TIMEOUT = float(os.environ.get('TASK_DRAIN_TIMEOUT', 10))
+# Durable tasks (DeferredTask table, run by `manage.py run_tasks`): seconds a claimed task stays
+# leased to one worker before another may run it again.
+TASK_LEASE_SECONDS = int(os.environ.get('TASK_LEASE_SECONDS', 300))
+
 JWT_AUTH = {
     'JWT_SECRET_KEY': SECRET_KEY,
 }
 
+# Access tokens carry the user's type and organization, so they are trusted without a
+# database lookup for their whole lifetime. Keep it short.
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=int(os.environ.get('JWT_ACCESS_TOKEN_MINUTES', 5))),
+    'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
+}
+
+# Reject tokens of users that were updated or deleted after the token was issued.
+# Requires a cache shared by all workers (CACHE_URL).
+JWT_REVOCATION_CHECK = os.environ.get('JWT_REVOCATION_CHECK', 'False') == 'True'
+
+# Prometheus metrics served at /metrics. Under gunicorn, point METRICS_DIR at a directory
+# shared by the workers (emptied on deploy) so every worker reports the aggregate.
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 1))
+# When set, /metrics requires "Authorization: Bearer <METRICS_TOKEN>".
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
 ROOT_URLCONF = 'fusus.urls'
 
 TEMPLATES = [
@@ -85,15 +239,42 @@ WSGI_APPLICATION = 'fusus.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        # Pooled backend: connections are reused across requests instead of opened per request.
+        'ENGINE': 'common.db.backends.mysql' if os.environ.get('DB_POOL', 'True') == 'True' else 'django.db.backends.mysql',
         'NAME': os.environ.get('DB_NAME', 'fusus'),
         'USER': os.environ.get('DB_USER', 'fusus'),
         'PASSWORD': os.environ.get('DB_PASSWORD', 'password'),
         'HOST': os.environ.get('DB_HOST', 'localhost'),
         'PORT': os.environ.get('DB_PORT', '3306'),
+        # LOAD DATA LOCAL INFILE for `insert_initial_data --load-data`; the server needs local_infile=ON too.
+        'OPTIONS': {'local_infile': int(os.environ.get('DB_LOCAL_INFILE', '0'))},
+        # Per worker process: at most MAX_SIZE connections, checkouts wait TIMEOUT seconds for one,
+        # connections idle for PING_INTERVAL seconds are pinged before reuse and the ones idle for
+        # MAX_IDLE or open for MAX_LIFETIME seconds are closed. Keep MAX_LIFETIME below wait_timeout.
+        'POOL': {
+            'MAX_SIZE': int(os.environ.get('DB_POOL_SIZE', 10)),
+            'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 5)),
+            'MAX_IDLE': float(os.environ.get('DB_POOL_MAX_IDLE', 300)),
+            'MAX_LIFETIME': float(os.environ.get('DB_POOL_MAX_LIFETIME', 3600)),
+            'PING_INTERVAL': float(os.environ.get('DB_POOL_PING_INTERVAL', 1)),
+        },
     }
 }
 
+# Read replicas as comma-separated host[:port] (same credentials as the primary), exposed as the
+# replica1, replica2, ... aliases. GETs to the user/organization read views go to a healthy
+# replica; a client that wrote stays on the primary for REPLICA_STICKY_SECONDS, and a replica
+# that can't be reached is skipped for REPLICA_RETRY_SECONDS.
+DATABASE_REPLICAS = []
+for _index, _host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), 1):
+    _name, _, _port = _host.strip().partition(':')
+    DATABASES[f'replica{_index}'] = dict(DATABASES['default'], HOST=_name, PORT=_port or DATABASES['default']['PORT'],
+                                         TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS.append(f'replica{_index}')
+DATABASE_ROUTERS = ['common.db.routers.ReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 10))
+REPLICA_RETRY_SECONDS = int(os.environ.get('REPLICA_RETRY_SECONDS', 30))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -113,6 +294,27 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# The first hasher is used for new hashes; the rest can still verify (and upgrade) old ones.
+PASSWORD_HASHERS = list(dict.fromkeys([
+    os.environ.get('PASSWORD_HASHER', 'user.hashing.TunablePBKDF2PasswordHasher'),
+    'user.hashing.TunablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]))
+
+# Work factor of TunablePBKDF2PasswordHasher. Existing hashes are upgraded on login.
+PASSWORD_HASH_ITERATIONS = int(os.environ.get('PASSWORD_HASH_ITERATIONS', 600000))
+
+# Login password checks run on a bounded pool. Requests beyond workers + queue, or
+# waiting longer than the timeout (seconds), get a 503 with Retry-After.
+LOGIN_HASH_WORKERS = int(os.environ.get('LOGIN_HASH_WORKERS', os.cpu_count() or 1))
+LOGIN_HASH_QUEUE = int(os.environ.get('LOGIN_HASH_QUEUE', 16))
+LOGIN_HASH_TIMEOUT = float(os.environ.get('LOGIN_HASH_TIMEOUT', 5))
+LOGIN_RETRY_AFTER = int(os.environ.get('LOGIN_RETRY_AFTER', 1))
+
 AUTH_USER_MODEL = 'user.User'
 
 # Internationalization
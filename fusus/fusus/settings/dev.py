@@ -1,4 +1,4 @@
 from .base import *
 
 DEBUG = True
-ALLOWED_HOSTS = []
\ No newline at end of file
+ALLOWED_HOSTS = []
@@ -0,0 +1,71 @@
+"""
+gunicorn settings for the API: ``gunicorn -c gunicorn.conf.py``.
+
+The app is loaded once in the master and forked, so workers share the imported code
+copy-on-write. Each worker then opens its database connections and fills its caches before it
+accepts requests. Everything can be tuned through GUNICORN_* environment variables.
+"""
+import multiprocessing
+import os
+import shutil
+
+WORKER_CLASSES = {
+    'sync': 'sync',
+    'gthread': 'gthread',
+    'asgi': 'uvicorn.workers.UvicornWorker',
+}
+
+_worker = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+worker_class = WORKER_CLASSES.get(_worker, _worker)
+wsgi_app = 'fusus.asgi:application' if _worker == 'asgi' else 'fusus.wsgi:application'
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+# gthread only; keep DB_POOL_SIZE at least this high.
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'True') == 'True'
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+# Recycle workers now and then so a slow leak can't grow without bound.
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 1000))
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+# Workers write their metrics here so /metrics reports all of them.
+os.environ.setdefault('METRICS_DIR', '/tmp/fusus-metrics')
+
+
+def on_starting(server):
+    # Files of the previous master's workers would be counted forever.
+    shutil.rmtree(os.environ['METRICS_DIR'], ignore_errors=True)
+    os.makedirs(os.environ['METRICS_DIR'], exist_ok=True)
+
+
+def when_ready(server):
+    if preload_app:
+        from django.core.management import call_command
+        from common.warmup import warm_master
+        # Refuse to start with settings that are only correct in a single process (common/checks.py).
+        call_command('check')
+        warm_master()
+
+
+def post_worker_init(worker):
+    from common.warmup import warm_worker
+    warm_worker(imports=not preload_app)
+
+
+def worker_exit(server, worker):
+    # Side effects deferred by the last requests still have to run.
+    from django.conf import settings
+    from common.tasks import task_executor
+    task_executor.drain(settings.TASK_DRAIN_TIMEOUT)
+
+
+def child_exit(server, worker):
+    from common.metrics import mark_process_dead
+    mark_process_dead(worker.pid)
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class OrgConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'org'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from common.metrics import registry
+        from . import cache, membership
+        registry.register_collector(cache.collect_metrics)
+        registry.register_collector(membership.collect_metrics)
@@ -0,0 +1,111 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from common.db.routers import use_primary
+
+from .models import Organization
+
+
+class OrganizationCache:
+    """
+    Read-through cache for organizations: a small per-process LRU in front of Django's
+    cache framework (only when it is shared, see ``CACHE_SHARED``), in front of the database.
+
+    Entries are invalidated from model signals. Other workers only see an invalidation once
+    their local entry expires, so ``ORGANIZATION_CACHE_LOCAL_TTL`` bounds their staleness.
+    Returned instances are shared and must not be modified.
+    """
+
+    def __init__(self):
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'invalidations': 0}
+
+    @staticmethod
+    def _key(pk):
+        return f'organization:{pk}'
+
+    def _count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def get(self, pk):
+        pk = int(pk)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._local.get(pk)
+            if entry is not None and entry[0] > now:
+                self._local.move_to_end(pk)
+                self._stats['local_hits'] += 1
+                return entry[1]
+
+        # A per-process cache would keep entries that another worker invalidated.
+        organization = cache.get(self._key(pk)) if settings.CACHE_SHARED else None
+        if organization is not None:
+            self._count('shared_hits')
+        else:
+            self._count('misses')
+            # Shared by every client, so never filled from a possibly lagging replica.
+            with use_primary():
+                organization = Organization.objects.get(pk=pk)
+            if settings.CACHE_SHARED:
+                cache.set(self._key(pk), organization, settings.ORGANIZATION_CACHE_TTL)
+
+        with self._lock:
+            self._local[pk] = (now + settings.ORGANIZATION_CACHE_LOCAL_TTL, organization)
+            self._local.move_to_end(pk)
+            while len(self._local) > settings.ORGANIZATION_CACHE_SIZE:
+                self._local.popitem(last=False)
+        return organization
+
+    def prime(self, organizations):
+        """Store already loaded organizations in both levels, e.g. when a worker starts."""
+        now = time.monotonic()
+        if settings.CACHE_SHARED:
+            cache.set_many({self._key(organization.pk): organization for organization in organizations},
+                           settings.ORGANIZATION_CACHE_TTL)
+        with self._lock:
+            for organization in organizations:
+                self._local[organization.pk] = (now + settings.ORGANIZATION_CACHE_LOCAL_TTL, organization)
+                self._local.move_to_end(organization.pk)
+            while len(self._local) > settings.ORGANIZATION_CACHE_SIZE:
+                self._local.popitem(last=False)
+
+    def invalidate(self, pk):
+        self._invalidate(pk)
+        # A reader that missed before the writer's transaction committed may have stored the old
+        # row again; drop it once the change is visible to everyone.
+        transaction.on_commit(lambda: self._invalidate(pk))
+
+    def _invalidate(self, pk):
+        with self._lock:
+            self._local.pop(int(pk), None)
+            self._stats['invalidations'] += 1
+        cache.delete(self._key(pk))
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, size=len(self._local))
+
+
+organization_cache = OrganizationCache()
+
+
+def collect_metrics():
+    stats = organization_cache.stats()
+    return [
+        ('counter', 'organization_cache_lookups_total', {'result': 'local_hit'}, stats['local_hits']),
+        ('counter', 'organization_cache_lookups_total', {'result': 'shared_hit'}, stats['shared_hits']),
+        ('counter', 'organization_cache_lookups_total', {'result': 'miss'}, stats['misses']),
+        ('counter', 'organization_cache_invalidations_total', {}, stats['invalidations']),
+        ('gauge', 'organization_cache_local_entries', {}, stats['size']),
+    ]
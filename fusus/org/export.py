@@ -0,0 +1,22 @@
+from django.conf import settings
+from user.models import User
+
+EXPORT_FIELDS = ('id', 'name', 'email', 'phone', 'birthdate', 'user_type', 'is_staff')
+
+
+def iter_user_batches(organization_id, fields=EXPORT_FIELDS, chunk_size=None):
+    # MySQLdb buffers a whole result set on the client, so a single iterator() over the
+    # organization would still hold every row. Walking the primary key in LIMIT-bounded
+    # batches keeps both the server and the worker at one chunk at a time.
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    queryset = User.objects.filter(organization_id=organization_id).order_by('id').values(*fields)
+
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id)[:chunk_size].iterator(chunk_size=chunk_size))
+        if not batch:
+            return
+        yield batch
+        if len(batch) < chunk_size:
+            return
+        last_id = batch[-1]['id']
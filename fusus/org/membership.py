@@ -0,0 +1,138 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+
+from common.db.routers import use_primary
+
+
+class MembershipCache:
+    """
+    Rendered responses of organization member lists, stored in Django's cache under a
+    per-organization membership version.
+
+    Every user create/update/delete and organization change bumps the version (now and again
+    once the transaction commits), which orphans all cached pages of that organization. A
+    read is one ``get_many`` of the version and the entry. On a miss only the worker holding
+    the ``cache.add`` lock renders; the others wait for its entry. Off unless the cache is
+    shared by all workers (``CACHE_SHARED``).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stale': 0, 'lock_waits': 0, 'lock_timeouts': 0, 'bumps': 0}
+
+    @staticmethod
+    def _version_key(organization_id):
+        return f'org-members-version:{organization_id}'
+
+    @staticmethod
+    def _entry_key(request, organization_id):
+        digest = hashlib.md5(
+            f'{request.build_absolute_uri()}|{request.accepted_media_type}'.encode()
+        ).hexdigest()
+        return f'org-members:{organization_id}:{digest}'
+
+    def _count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def _initial_version(self, organization_id):
+        # Start from the clock instead of 1, so a version evicted from the cache never comes back
+        # with a number that older entries were stored under.
+        key = self._version_key(organization_id)
+        cache.add(key, time.time_ns(), None)
+        return cache.get(key)
+
+    def bump(self, organization_id):
+        if organization_id is None:
+            return
+        self._bump(organization_id)
+        # Readers inside the open transaction's lifetime may have cached the old rows under
+        # the new version; bump again once they are visible to everyone.
+        transaction.on_commit(lambda: self._bump(organization_id))
+
+    def _bump(self, organization_id):
+        self._count('bumps')
+        try:
+            cache.incr(self._version_key(organization_id))
+        except ValueError:
+            self._initial_version(organization_id)
+
+    def respond(self, view, request, organization_id, build):
+        """The cached rendering of ``build()`` for this request, rendering and storing it on a miss."""
+        if not settings.CACHE_SHARED:
+            # A bump in one worker would never reach the entries of the others.
+            return build()
+        version_key, entry_key = self._version_key(organization_id), self._entry_key(request, organization_id)
+        values = cache.get_many([version_key, entry_key])
+        version = values.get(version_key)
+        entry = values.get(entry_key)
+        if version is None:
+            version = self._initial_version(organization_id)
+        if entry is not None and entry[0] == version:
+            self._count('hits')
+            return self._response(entry)
+        result = 'misses' if entry is None else 'stale'
+
+        lock_key = f'{entry_key}:lock'
+        if not cache.add(lock_key, 1, settings.MEMBERSHIP_CACHE_LOCK_TIMEOUT):
+            self._count('lock_waits')
+            deadline = time.monotonic() + settings.MEMBERSHIP_CACHE_LOCK_WAIT
+            while time.monotonic() < deadline:
+                time.sleep(0.02)
+                entry = cache.get(entry_key)
+                if entry is not None and entry[0] == version:
+                    self._count('hits')
+                    return self._response(entry)
+            # Whoever holds the lock is too slow; answer without caching rather than pile up.
+            self._count('lock_timeouts')
+            return build()
+
+        self._count(result)
+        try:
+            # A lagging replica would store the rows from before the bump under the new version.
+            with use_primary():
+                response = build()
+            if response.status_code == 200:
+                response = self._render(view, request, response)
+                cache.set(entry_key, (version, response.content, response['Content-Type']),
+                          settings.MEMBERSHIP_CACHE_TTL)
+            return response
+        finally:
+            cache.delete(lock_key)
+
+    @staticmethod
+    def _render(view, request, response):
+        response.accepted_renderer = request.accepted_renderer
+        response.accepted_media_type = request.accepted_media_type
+        response.renderer_context = view.get_renderer_context()
+        return response.render()
+
+    @staticmethod
+    def _response(entry):
+        _, content, content_type = entry
+        return HttpResponse(content, content_type=content_type)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+membership_cache = MembershipCache()
+
+
+def collect_metrics():
+    stats = membership_cache.stats()
+    return [
+        ('counter', 'membership_cache_lookups_total', {'result': 'hit'}, stats['hits']),
+        ('counter', 'membership_cache_lookups_total', {'result': 'miss'}, stats['misses']),
+        ('counter', 'membership_cache_lookups_total', {'result': 'stale'}, stats['stale']),
+        ('counter', 'membership_cache_lock_waits_total', {}, stats['lock_waits']),
+        ('counter', 'membership_cache_lock_timeouts_total', {}, stats['lock_timeouts']),
+        ('counter', 'membership_cache_bumps_total', {}, stats['bumps']),
+    ]
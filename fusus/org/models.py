@@ -1,7 +1,9 @@
 from django.db import models
 
+from common.models import VersionedModel
+
 # Create your models here.
-class Organization(models.Model):
+class Organization(VersionedModel):
     name = models.CharField(max_length=255)
     phone = models.CharField(max_length=15)
     address = models.TextField()
@@ -1,9 +1,10 @@
 from rest_framework import serializers, viewsets
 from .models import Organization
 from user.models import User
+from common.fields import DynamicFieldsMixin
 
 
-class OrganizationSerializer(serializers.ModelSerializer):
+class OrganizationSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     name = serializers.CharField(required=False)
     phone = serializers.CharField(required=False)
     address = serializers.CharField(required=False)
@@ -13,7 +14,7 @@ class OrganizationSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class MinimalUserSerializer(serializers.ModelSerializer):
+class MinimalUserSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'name']
@@ -0,0 +1,13 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import organization_cache
+from .membership import membership_cache
+from .models import Organization
+
+
+@receiver(post_save, sender=Organization)
+@receiver(post_delete, sender=Organization)
+def invalidate_organization(sender, instance, **kwargs):
+    organization_cache.invalidate(instance.pk)
+    membership_cache.bump(instance.pk)
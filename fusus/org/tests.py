@@ -1,6 +1,15 @@
+import csv
+import io
+import json
+from unittest.mock import patch
+from django.core.cache import cache
+from django.test import override_settings
 from django.urls import reverse
 from rest_framework import status
 from user.models import User
+from org.models import Organization
+from org.cache import organization_cache
+from org.membership import membership_cache
 from common.tests.base import BaseTestCase
 
 
@@ -42,7 +51,7 @@ class OrganizationTests(BaseTestCase):
         url = reverse('organization-users-list', args=[self.org1.id])
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        for user_data in response.data:
+        for user_data in response.data['results']:
             self.assertCountEqual(user_data.keys(), ["id", "name"])
 
     def test_list_users_for_organization_viewer(self):
@@ -50,9 +59,22 @@ class OrganizationTests(BaseTestCase):
         url = reverse('organization-users-list', args=[self.org1.id])
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        for user_data in response.data:
+        for user_data in response.data['results']:
             self.assertCountEqual(user_data.keys(), ["id", "name"])
 
+    def test_list_users_for_organization_paginated(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        url = reverse('organization-users-list', args=[self.org1.id])
+        response = self.client.get(url, {'page_size': 4})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 4)
+
+        ids = [user['id'] for user in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            ids.extend(user['id'] for user in response.data['results'])
+        self.assertEqual(ids, list(User.objects.filter(organization=self.org1).order_by('id').values_list('id', flat=True)))
+
     def test_retrieve_user_for_organization_admin(self):
         user = User.objects.filter(organization=self.org1).first()
         self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
@@ -68,3 +90,221 @@ class OrganizationTests(BaseTestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertCountEqual(response.data.keys(), ["id", "name"])
+
+    def test_export_users_ndjson_admin(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        url = reverse('organization-users-export', args=[self.org1.id])
+        with override_settings(EXPORT_CHUNK_SIZE=2):
+            response = self.client.get(url)
+            content = b''.join(response.streaming_content)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('application/x-ndjson'))
+        rows = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows],
+                         list(User.objects.filter(organization=self.org1).order_by('id').values_list('id', flat=True)))
+        for row in rows:
+            self.assertNotIn('password', row)
+
+    def test_export_users_csv_viewer(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["VIEWER"]["TestOrg1"][0])
+        url = reverse('organization-users-export', args=[self.org1.id])
+        response = self.client.get(url, {'format': 'csv'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), User.objects.filter(organization=self.org1).count())
+        self.assertNotIn('password', rows[0])
+
+    def test_export_users_other_organization(self):
+        for user_type in ("ADMIN", "VIEWER"):
+            self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens[user_type]["TestOrg1"][0])
+            response = self.client.get(reverse('organization-users-export', args=[self.org2.id]))
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+            self.assertNotIn(b'testorg2', response.content)
+
+    def test_export_users_non_admin(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["USER"]["TestOrg1"][0])
+        url = reverse('organization-users-export', args=[self.org1.id])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+# The test process is the only worker, so its local-memory cache counts as shared.
+@override_settings(CACHE_SHARED=True)
+class OrganizationCacheTests(BaseTestCase):
+
+    def test_retrieve_organization_not_modified(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["VIEWER"]["TestOrg1"][0])
+        url = reverse('organization-detail', args=[self.org1.id])
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+        self.org1.name = "Renamed"
+        self.org1.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_retrieve_user_for_organization_not_modified(self):
+        user = User.objects.filter(organization=self.org1).first()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        url = reverse('organization-user-detail', args=[self.org1.id, user.id])
+        etag = self.client.get(url)['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        user.name = "Renamed"
+        user.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["name"], "Renamed")
+
+    def test_organization_sparse_fields(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        response = self.client.get(reverse('organization-detail', args=[self.org1.id]), {'fields': 'id,name'})
+        self.assertEqual(response.data, {'id': self.org1.id, 'name': 'TestOrg1'})
+
+        response = self.client.get(reverse('organization-users-list', args=[self.org1.id]), {'exclude': 'name'})
+        self.assertEqual(list(json.loads(response.content)['results'][0]), ['id'])
+
+        response = self.client.get(reverse('organization-users-list', args=[self.org1.id]), {'fields': 'email'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_cached_lookup_skips_database(self):
+        organization_cache.get(self.org1.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(organization_cache.get(self.org1.id).name, "TestOrg1")
+        stats = organization_cache.stats()
+        self.assertGreaterEqual(stats['misses'], 1)
+        self.assertGreaterEqual(stats['local_hits'], 1)
+
+    def test_shared_cache_is_used_after_local_miss(self):
+        organization_cache.get(self.org1.id)
+        organization_cache.clear()
+        with self.assertNumQueries(0):
+            organization_cache.get(self.org1.id)
+
+    @override_settings(CACHE_SHARED=False)
+    def test_shared_cache_is_skipped_when_not_shared(self):
+        cache.clear()
+        organization_cache.clear()
+        organization_cache.get(self.org1.id)
+        self.assertIsNone(cache.get(organization_cache._key(self.org1.id)))
+        organization_cache.clear()
+        with self.assertNumQueries(1):
+            organization_cache.get(self.org1.id)
+
+    def test_save_invalidates(self):
+        organization_cache.get(self.org1.id)
+        Organization.objects.filter(pk=self.org1.id).update(name="Stale")
+        self.org1.name = "Renamed"
+        self.org1.save()
+        self.assertEqual(organization_cache.get(self.org1.id).name, "Renamed")
+
+    def test_save_invalidates_again_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.org1.name = "Renamed"
+            self.org1.save()
+            # A concurrent reader refills the cache with the row from before the commit.
+            cache.set(organization_cache._key(self.org1.id), Organization(pk=self.org1.id, name="TestOrg1"))
+        organization_cache.clear()
+        self.assertEqual(organization_cache.get(self.org1.id).name, "Renamed")
+
+    def test_patch_invalidates(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        url = reverse('organization-detail', args=[self.org1.id])
+        self.client.get(url)
+        self.client.patch(url, {"name": "Patched Org"}, format='json')
+        response = self.client.get(url)
+        self.assertEqual(response.data["name"], "Patched Org")
+
+    def test_missing_organization(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        response = self.client.get(reverse('organization-detail', args=[999999]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(CACHE_SHARED=True)
+class MembershipCacheTests(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+
+    def test_repeated_list_is_served_from_cache(self):
+        url = reverse('organization-users-list', args=[self.org1.id])
+        first = self.client.get(url)
+        hits = membership_cache.stats()['hits']
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["VIEWER"]["TestOrg1"][0])
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Content-Type'], first['Content-Type'])
+        self.assertEqual(membership_cache.stats()['hits'], hits + 1)
+
+    def test_user_changes_invalidate_lists(self):
+        url = reverse('users-list')
+        self.client.get(url)
+        user = User.objects.create_user(email="new@testorg1.com", password="password", name="New",
+                                        organization_id=self.org1.id, phone="1", birthdate="1990-01-01")
+        response = self.client.get(url, {'page_size': 50})
+        self.assertIn(user.id, [item['id'] for item in json.loads(response.content)['results']])
+
+        user.delete()
+        response = self.client.get(url, {'page_size': 50})
+        self.assertNotIn(user.id, [item['id'] for item in json.loads(response.content)['results']])
+
+    def test_organization_change_invalidates_user_list(self):
+        url = reverse('users-list')
+        self.client.get(url)
+        self.org1.name = "Renamed"
+        self.org1.save()
+        response = self.client.get(url)
+        self.assertEqual(json.loads(response.content)['results'][0]['organization_name'], "Renamed")
+
+    def test_bump_after_commit_is_done_before_commit_returns(self):
+        bumps = membership_cache.stats()['bumps']
+        with self.captureOnCommitCallbacks(execute=True):
+            membership_cache.bump(self.org1.id)
+        self.assertEqual(membership_cache.stats()['bumps'], bumps + 2)
+
+    def test_other_organizations_are_not_invalidated(self):
+        url = reverse('organization-users-list', args=[self.org1.id])
+        self.client.get(url)
+        User.objects.filter(organization=self.org2).first().save()
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+    @override_settings(CACHE_SHARED=False)
+    def test_lists_are_not_cached_without_a_shared_cache(self):
+        url = reverse('organization-users-list', args=[self.org1.id])
+        self.client.get(url)
+        stats = membership_cache.stats()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(membership_cache.stats(), stats)
+
+    @override_settings(MEMBERSHIP_CACHE_LOCK_WAIT=0.05)
+    def test_cold_key_is_rendered_by_lock_holder_only(self):
+        url = reverse('organization-users-list', args=[self.org1.id])
+        self.client.get(url)
+        self.org1.save()
+        timeouts = membership_cache.stats()['lock_timeouts']
+        # Someone else holds the render lock and never finishes.
+        with patch('org.membership.cache.add', return_value=False):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(membership_cache.stats()['lock_timeouts'], timeouts + 1)
@@ -3,47 +3,105 @@ from .models import Organization
 from user.models import User
 from rest_framework import filters, status, serializers, viewsets
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from common.permissions import IsAdministrator, IsViewer
+from common.conditional import Validators
+from common.fields import sparse_fields
+from common.pagination import KeysetPagination
+from common.renderers import NDJSONRenderer, CSVRenderer
+from common.throttling import ListRateThrottle
+from .cache import organization_cache
+from .membership import membership_cache
+from .export import EXPORT_FIELDS, iter_user_batches
+
+
+ORGANIZATION_FIELDS = ('id', 'name', 'phone', 'address', 'version', 'updated_at')
+MEMBER_FIELDS = ('id', 'name')
 
 
 class OrganizationDetailView(APIView):
     permission_classes = [IsAdministrator | IsViewer]
+    replica_reads = True
 
     def get_object(self, pk):
         try:
-            return Organization.objects.get(pk=pk)
+            return organization_cache.get(pk)
         except Organization.DoesNotExist:
-            raise status.Http404
+            raise Http404
 
     def get(self, request, pk):
+        fields = sparse_fields(request, ORGANIZATION_FIELDS)
         organization = self.get_object(pk)
-        serializer = OrganizationSerializer(organization)
-        return Response(serializer.data)
+        validators = Validators((organization.version, organization.updated_at))
+        not_modified = validators.not_modified(request)
+        if not_modified:
+            return not_modified
+        serializer = OrganizationSerializer(organization, fields=fields)
+        return validators.apply(Response(serializer.data))
 
     def patch(self, request, pk, partial=False):
-        organization = self.get_object(pk)
+        # Cached instances are shared, so writes always start from a fresh row.
+        organization = get_object_or_404(Organization, pk=pk)
         serializer = OrganizationSerializer(organization, data=request.data, partial=partial)
         if serializer.is_valid():
             serializer.save()
+            organization_cache.invalidate(pk)
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 class OrganizationUsersListView(APIView):
     permission_classes = [IsAdministrator | IsViewer]
+    replica_reads = True
+    pagination_class = KeysetPagination
+    throttle_classes = [*api_settings.DEFAULT_THROTTLE_CLASSES, ListRateThrottle]
+
+    def get(self, request, pk):
+        return membership_cache.respond(self, request, pk, lambda: self.list_users(request, pk))
+
+    def list_users(self, request, pk):
+        fields = sparse_fields(request, MEMBER_FIELDS)
+        # Served from the (organization, id, name) index without touching the table rows.
+        users = User.objects.filter(organization_id=pk).values(*dict.fromkeys(('organization_id', 'id', *fields)))
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(users, request, view=self)
+        serializer = MinimalUserSerializer(page, many=True, fields=fields)
+        return paginator.get_paginated_response(serializer.data)
+
+
+class OrganizationUsersExportView(APIView):
+    permission_classes = [IsAdministrator | IsViewer]
+    renderer_classes = [NDJSONRenderer, CSVRenderer]
+    throttle_classes = [*api_settings.DEFAULT_THROTTLE_CLASSES, ListRateThrottle]
 
     def get(self, request, pk):
-        users = User.objects.filter(organization_id=pk)
-        serializer = MinimalUserSerializer(users, many=True)
-        return Response(serializer.data)
+        # Exports carry personal data; other organizations' users don't exist for the requester.
+        if int(pk) != request.user.organization_id:
+            raise Http404
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(iter_user_batches(pk), EXPORT_FIELDS),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}'
+        )
+        response['Content-Disposition'] = f'attachment; filename="organization-{pk}-users.{renderer.format}"'
+        return response
 
 
 class OrganizationUserDetailView(APIView):
     permission_classes = [IsAdministrator | IsViewer]
+    replica_reads = True
 
     def get(self, request, org_id, user_id):
-        user = get_object_or_404(User, organization_id=org_id, id=user_id)
-        serializer = MinimalUserSerializer(user)
-        return Response(serializer.data)
+        fields = sparse_fields(request, MEMBER_FIELDS)
+        # A single indexed lookup serves both the validators and the body.
+        user = get_object_or_404(User.objects.values(*fields, 'version', 'updated_at'),
+                                 organization_id=org_id, id=user_id)
+        validators = Validators((user['version'], user['updated_at']))
+        not_modified = validators.not_modified(request)
+        if not_modified:
+            return not_modified
+        serializer = MinimalUserSerializer(user, fields=fields)
+        return validators.apply(Response(serializer.data))
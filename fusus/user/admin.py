@@ -1,5 +1,7 @@
+from django.conf import settings
 from django.contrib import admin
 from .models import  User
+from .search import search_terms, search_users
 
 
 @admin.register(User)
@@ -7,3 +9,11 @@ class UserAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'email', 'user_type', 'organization', 'is_staff')
     search_fields = ('name', 'email',)
     list_filter = ('user_type', 'is_staff')
+
+    def get_search_results(self, request, queryset, search_term):
+        if settings.USER_SEARCH_BACKEND == 'like':
+            return super().get_search_results(request, queryset, search_term)
+        terms = search_terms(search_term)
+        if not terms:
+            return queryset, False
+        return search_users(queryset, terms), False
@@ -0,0 +1,231 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework import status
+
+from common.authentication import REVOKING_FIELDS, revoke_user_tokens
+from common.models import version_bump
+from common.tasks import enqueue
+from org.membership import membership_cache
+from .hashing import hash_passwords
+from .groups import group_id_for
+from .models import User
+from .search import index_enabled, index_user_ids, index_users
+from .serializers import BatchUserCreateSerializer, BatchUserUpdateSerializer
+
+UPDATED_FIELDS = ('email', 'name', 'phone', 'birthdate', 'user_type')
+
+
+class UserBatch:
+    """
+    Validates a whole batch of create/update/delete operations up front and, only if every
+    item is valid, applies them with bulk statements inside a single transaction.
+    """
+
+    def __init__(self, requesting_user, create=(), update=(), delete=()):
+        self.requesting_user = requesting_user
+        self.create_items = list(create)
+        self.update_items = list(update)
+        self.delete_ids = list(delete)
+        self.results = {
+            'create': [{'index': i} for i in range(len(self.create_items))],
+            'update': [{'index': i} for i in range(len(self.update_items))],
+            'delete': [{'index': i} for i in range(len(self.delete_ids))],
+        }
+        self.has_errors = False
+        self._claimed_emails = set()
+
+    def _fail(self, op, index, code, errors):
+        self.results[op][index].update({'status': code, 'errors': errors})
+        self.has_errors = True
+
+    def _same_organization(self, organization_id):
+        return self.requesting_user.organization_id == organization_id
+
+    def run(self):
+        creates = self._validate_creates()
+        updates = self._validate_updates()
+        deletes = self._validate_deletes()
+        if self.has_errors:
+            return False
+
+        self._apply(creates, updates, deletes)
+        return True
+
+    def _validate_creates(self):
+        valid = {}
+        for index, item in enumerate(self.create_items):
+            serializer = BatchUserCreateSerializer(data=item)
+            if not serializer.is_valid():
+                self._fail('create', index, status.HTTP_400_BAD_REQUEST, serializer.errors)
+                continue
+            data = dict(serializer.validated_data)
+            if not self._same_organization(data['organization']):
+                self._fail('create', index, status.HTTP_403_FORBIDDEN,
+                           {"detail": "Can only create user for the same organization."})
+                continue
+            data['email'] = User.objects.normalize_email(data['email'])
+            valid[index] = data
+
+        self._check_emails('create', {index: data['email'] for index, data in valid.items()}, valid)
+        return valid
+
+    def _validate_updates(self):
+        valid = {}
+        for index, item in enumerate(self.update_items):
+            serializer = BatchUserUpdateSerializer(data=item)
+            if not serializer.is_valid():
+                self._fail('update', index, status.HTTP_400_BAD_REQUEST, serializer.errors)
+                continue
+            data = dict(serializer.validated_data)
+            if 'email' in data:
+                data['email'] = User.objects.normalize_email(data['email'])
+            valid[index] = data
+
+        users = User.objects.in_bulk([data['id'] for data in valid.values()])
+        seen_ids = set()
+        for index, data in list(valid.items()):
+            user = users.get(data['id'])
+            if user is None:
+                self._fail('update', index, status.HTTP_404_NOT_FOUND, {"detail": "Not found."})
+                del valid[index]
+            elif not self._same_organization(user.organization_id):
+                self._fail('update', index, status.HTTP_403_FORBIDDEN,
+                           {"detail": "Not authorized to update user from another organization"})
+                del valid[index]
+            elif data['id'] in seen_ids or data['id'] in self.delete_ids:
+                self._fail('update', index, status.HTTP_400_BAD_REQUEST,
+                           {"detail": "User appears more than once in this batch."})
+                del valid[index]
+            else:
+                seen_ids.add(data['id'])
+                data['user'] = user
+
+        changed_emails = {index: data['email'] for index, data in valid.items()
+                          if 'email' in data and data['email'] != data['user'].email}
+        self._check_emails('update', changed_emails, valid)
+        return valid
+
+    def _validate_deletes(self):
+        users = User.objects.in_bulk(self.delete_ids)
+        valid = []
+        for index, pk in enumerate(self.delete_ids):
+            user = users.get(pk)
+            if user is None:
+                self._fail('delete', index, status.HTTP_404_NOT_FOUND, {"detail": "Not found."})
+            elif not self._same_organization(user.organization_id):
+                self._fail('delete', index, status.HTTP_403_FORBIDDEN,
+                           {"detail": "Not authorized to delete user from another organization"})
+            else:
+                valid.append(pk)
+        return valid
+
+    def _check_emails(self, op, emails, valid):
+        # One query for collisions with stored users, then duplicates inside the batch itself,
+        # including addresses already claimed by the create section.
+        taken = set(User.objects.filter(email__in=emails.values()).values_list('email', flat=True))
+        for index, email in emails.items():
+            if email in taken or email in self._claimed_emails:
+                self._fail(op, index, status.HTTP_400_BAD_REQUEST, {"email": ["User with this email already exists"]})
+                del valid[index]
+            else:
+                self._claimed_emails.add(email)
+
+    def _apply(self, creates, updates, deletes):
+        passwords = [data['password'] for data in creates.values()]
+        passwords += [data['password'] for data in updates.values() if 'password' in data]
+        hashed = iter(hash_passwords(passwords))
+
+        new_users = []
+        for data in creates.values():
+            new_users.append(User(
+                email=data['email'],
+                name=data['name'],
+                phone=data['phone'],
+                birthdate=data['birthdate'],
+                user_type=data['user_type'],
+                organization_id=data['organization'],
+                password=next(hashed),
+            ))
+
+        update_passwords = {index: next(hashed) for index, data in updates.items() if 'password' in data}
+
+        batch_size = settings.USER_BATCH_WRITE_SIZE
+        with transaction.atomic():
+            if new_users:
+                User.objects.bulk_create(new_users, batch_size=batch_size)
+                self._assign_ids(new_users)
+                self._add_groups(new_users, batch_size)
+            updated = self._update(updates, update_passwords, batch_size) if updates else {}
+            # bulk_create/bulk_update skip post_save, so the search tokens are written here.
+            if index_enabled():
+                indexed = new_users + [user for index, user in updated.items()
+                                       if 'name' in updates[index] or 'email' in updates[index]]
+                deferred_min = settings.USER_BATCH_DEFERRED_INDEX_MIN
+                if deferred_min and len(indexed) >= deferred_min:
+                    enqueue(index_user_ids, [user.pk for user in indexed])
+                else:
+                    index_users(indexed)
+            if deletes:
+                User.objects.filter(id__in=deletes).delete()
+
+            # bulk_create/bulk_update send no signals.
+            membership_cache.bump(self.requesting_user.organization_id)
+
+        revoked = [data['id'] for data in updates.values() if REVOKING_FIELDS.intersection(data)] + deletes
+        for pk in revoked:
+            revoke_user_tokens(pk)
+
+        for index, user in zip(creates, new_users):
+            self.results['create'][index].update({'status': status.HTTP_201_CREATED, 'id': user.pk})
+        for index, data in updates.items():
+            self.results['update'][index].update({'status': status.HTTP_200_OK, 'id': data['id']})
+        for index, pk in enumerate(self.delete_ids):
+            self.results['delete'][index].update({'status': status.HTTP_204_NO_CONTENT, 'id': pk})
+
+    @staticmethod
+    def _update(updates, passwords, batch_size):
+        # The rows read during validation may have changed while the passwords were hashed:
+        # re-read them under lock and write back only the fields each item asked to change.
+        # Returns the updated users by item index; a user deleted in the meantime is left out.
+        users = User.objects.select_for_update().in_bulk([data['id'] for data in updates.values()])
+        bump = version_bump()
+        updated, by_fields = {}, defaultdict(list)
+        for index, data in updates.items():
+            user = users.get(data['id'])
+            if user is None:
+                continue
+            fields = [field for field in UPDATED_FIELDS if field in data]
+            for field in fields:
+                setattr(user, field, data[field])
+            if index in passwords:
+                user.password = passwords[index]
+                fields.append('password')
+            if not fields:
+                continue
+            for field, value in bump.items():
+                setattr(user, field, value)
+            updated[index] = user
+            by_fields[tuple(fields) + tuple(bump)].append(user)
+        for fields, group in by_fields.items():
+            User.objects.bulk_update(group, fields, batch_size=batch_size)
+        return updated
+
+    @staticmethod
+    def _assign_ids(users):
+        # MySQL cannot return generated keys from a multi-row INSERT.
+        if all(user.pk for user in users):
+            return
+        ids = dict(User.objects.filter(email__in=[user.email for user in users]).values_list('email', 'id'))
+        for user in users:
+            user.pk = ids[user.email]
+
+    @staticmethod
+    def _add_groups(users, batch_size):
+        Membership = User.groups.through
+        memberships = [
+            Membership(user_id=user.pk, group_id=group_id_for(user.user_type))
+            for user in users if group_id_for(user.user_type)
+        ]
+        Membership.objects.bulk_create(memberships, batch_size=batch_size)
@@ -0,0 +1,72 @@
+import os
+import threading
+import time
+
+from django.conf import settings
+
+from common.tasks import TaskQueueFull, task_executor
+
+
+class EgressIPProvider:
+    """
+    Process-wide cache of this server's public IP.
+
+    ``get()`` never touches the network: it returns the last known address (``None`` until
+    the first lookup finishes) and, once the value is older than ``EGRESS_IP_TTL``, starts a
+    single background refresh against ``EGRESS_IP_URL``.
+    """
+
+    def __init__(self):
+        self._value = None
+        self._next_refresh = 0.0
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def get(self):
+        if os.getpid() != self._pid:
+            # Forked worker: the refresh thread and its lock stayed behind in the parent.
+            self._reset()
+        if time.monotonic() >= self._next_refresh:
+            self.refresh_async()
+        return self._value
+
+    def refresh_async(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        try:
+            task_executor.submit(self._refresh_in_background)
+        except TaskQueueFull:
+            # Try again on a later request.
+            self._refreshing = False
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        finally:
+            self._refreshing = False
+
+    def refresh(self):
+        # requests is among the slowest imports of the app; only the refresh thread needs it.
+        import requests
+        try:
+            response = requests.get(settings.EGRESS_IP_URL, timeout=settings.EGRESS_IP_TIMEOUT)
+            response.raise_for_status()
+            value = response.text.strip()
+        except requests.RequestException:
+            value = None
+
+        if value:
+            self._value = value
+            self._next_refresh = time.monotonic() + settings.EGRESS_IP_TTL
+        else:
+            self._next_refresh = time.monotonic() + settings.EGRESS_IP_RETRY
+        return self._value
+
+
+egress_ip = EgressIPProvider()
@@ -0,0 +1,40 @@
+import threading
+
+from django.contrib.auth.models import Group
+
+GROUP_MAP = {
+    'ADMIN': 'Administrator',
+    'VIEWER': 'Viewer',
+    'USER': 'User'
+}
+
+_group_ids = None
+_lock = threading.Lock()
+
+
+def warm_group_ids():
+    """
+    Load the ids of the role groups in one query. Called at worker start and after group changes.
+    Only a complete map is kept: groups created later by another process (``insert_initial_data``)
+    don't reset this one's map, so while any is missing every call looks them up again.
+    """
+    global _group_ids
+    ids = dict(Group.objects.filter(name__in=GROUP_MAP.values()).values_list('name', 'id'))
+    if len(ids) == len(GROUP_MAP):
+        with _lock:
+            _group_ids = ids
+    return ids
+
+
+def reset_group_ids():
+    global _group_ids
+    with _lock:
+        _group_ids = None
+
+
+def group_id_for(user_type):
+    group_name = GROUP_MAP.get(user_type)
+    if group_name is None:
+        return None
+    ids = _group_ids if _group_ids is not None else warm_group_ids()
+    return ids.get(group_name)
@@ -0,0 +1,116 @@
+import atexit
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, check_password, make_password
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def _get_pool():
+    global _pool, _pool_pid
+    with _pool_lock:
+        # A pool inherited through fork() belongs to the parent; start a fresh one.
+        if _pool is None or _pool_pid != os.getpid():
+            # Imported here: it pulls in multiprocessing, which only large batches need.
+            from concurrent.futures import ProcessPoolExecutor
+            _pool = ProcessPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, initializer=_init_worker)
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _shutdown_pool():
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.shutdown(wait=False, cancel_futures=True)
+
+
+atexit.register(_shutdown_pool)
+
+
+def hash_passwords(passwords):
+    """Hash raw passwords, fanning out to a process pool for large batches."""
+    passwords = list(passwords)
+    if len(passwords) < settings.PASSWORD_HASH_PARALLEL_MIN or settings.PASSWORD_HASH_WORKERS <= 1:
+        return [make_password(password) for password in passwords]
+
+    chunksize = max(1, len(passwords) // (settings.PASSWORD_HASH_WORKERS * 4))
+    return list(_get_pool().map(make_password, passwords, chunksize=chunksize))
+
+
+class TunablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2-SHA256 with the work factor taken from ``PASSWORD_HASH_ITERATIONS``. Stored hashes
+    with a different count are transparently re-hashed on the next successful login.
+    """
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASH_ITERATIONS
+
+
+class LoginOverloaded(Exception):
+    pass
+
+
+class LoginExecutor:
+    """
+    Bounded thread pool that runs login password checks off the request thread.
+
+    ``hashlib.pbkdf2_hmac`` releases the GIL, so the workers hash in parallel while the request
+    threads only wait. At most ``LOGIN_HASH_WORKERS + LOGIN_HASH_QUEUE`` checks are admitted at
+    once; beyond that, or when a check is not finished within ``LOGIN_HASH_TIMEOUT`` seconds,
+    ``LoginOverloaded`` is raised so the view can shed load instead of tying up the worker.
+    """
+
+    def __init__(self):
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pool = ThreadPoolExecutor(max_workers=settings.LOGIN_HASH_WORKERS, thread_name_prefix='login-hash')
+                self._slots = threading.BoundedSemaphore(settings.LOGIN_HASH_WORKERS + settings.LOGIN_HASH_QUEUE)
+                self._pid = os.getpid()
+
+    def run(self, fn, *args):
+        if self._pid != os.getpid():
+            self._start()
+        if not self._slots.acquire(blocking=False):
+            raise LoginOverloaded()
+
+        slots = self._slots
+        future = self._pool.submit(fn, *args)
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=settings.LOGIN_HASH_TIMEOUT)
+        except TimeoutError:
+            future.cancel()
+            raise LoginOverloaded()
+
+
+login_executor = LoginExecutor()
+
+
+def verify_password(password, encoded):
+    """
+    Return ``(is_correct, new_hash)``. ``new_hash`` is set when the stored hash should be
+    upgraded to the preferred hasher or work factor.
+    """
+    if encoded is None:
+        # Unknown account: spend the same work as a real check so timing does not leak it.
+        make_password(password)
+        return False, None
+
+    rehashed = []
+    is_correct = check_password(password, encoded, setter=lambda raw: rehashed.append(make_password(raw)))
+    return is_correct, rehashed[0] if rehashed else None
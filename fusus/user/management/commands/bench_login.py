@@ -0,0 +1,85 @@
+import json
+import threading
+import time
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from common.benchmark import Recorder, run_workers, write_results
+
+
+class Command(BaseCommand):
+    help = ('Floods /api/auth/login/ on a running server and reports logins/sec and the latency '
+            'other endpoints lose while logins are saturated')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--email', required=True)
+        parser.add_argument('--password', required=True)
+        parser.add_argument('--login-concurrency', type=int, default=32)
+        parser.add_argument('--probe-path', default='/api/info/')
+        parser.add_argument('--probe-concurrency', type=int, default=2)
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds per phase')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        base_url = options['base_url'].rstrip('/')
+        credentials = {'email': options['email'], 'password': options['password']}
+
+        response = requests.post(f'{base_url}/api/auth/login/', json=credentials, timeout=30)
+        if response.status_code != 200:
+            raise CommandError(f'Login failed with {response.status_code}: {response.text}')
+        headers = {'Authorization': f'Bearer {response.json()["access"]}'}
+
+        recorder = Recorder()
+
+        def timed(name, session, method, url, **kwargs):
+            started = time.perf_counter()
+            try:
+                status = session.request(method, url, timeout=30, **kwargs).status_code
+            except requests.RequestException:
+                status = 599
+            recorder.record(name, time.perf_counter() - started, status)
+
+        def probe(name):
+            def target(deadline):
+                session = requests.Session()
+                while time.monotonic() < deadline:
+                    timed(name, session, 'GET', base_url + options['probe_path'], headers=headers)
+            return target
+
+        def login(deadline):
+            session = requests.Session()
+            while time.monotonic() < deadline:
+                timed('login', session, 'POST', f'{base_url}/api/auth/login/', json=credentials)
+
+        duration = options['duration']
+        baseline_elapsed = run_workers(probe('probe_idle'), options['probe_concurrency'], duration)
+
+        probes = threading.Thread(target=run_workers, args=(probe('probe_loaded'), options['probe_concurrency'], duration))
+        probes.start()
+        login_elapsed = run_workers(login, options['login_concurrency'], duration)
+        probes.join()
+
+        logins = recorder.summary('login', login_elapsed, ok=lambda status: status == 200)
+        idle = recorder.summary('probe_idle', baseline_elapsed)
+        loaded = recorder.summary('probe_loaded', login_elapsed)
+        results = {
+            'logins_per_second': logins.get('throughput_rps', 0),
+            'login': logins,
+            'probe_path': options['probe_path'],
+            'probe_idle': idle,
+            'probe_loaded': loaded,
+            'probe_added_p50_ms': _delta(loaded['p50_ms'], idle['p50_ms']),
+            'probe_added_p95_ms': _delta(loaded['p95_ms'], idle['p95_ms']),
+        }
+
+        self.stdout.write(json.dumps(results, indent=2, sort_keys=True))
+        if options['output']:
+            write_results(options['output'], results)
+
+
+def _delta(loaded, idle):
+    if loaded is None or idle is None:
+        return None
+    return round(loaded - idle, 3)
@@ -1,28 +1,63 @@
-from django.core.management.base import BaseCommand
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from user.groups import group_id_for
 from user.models import User
+from user.seeding import parse_roles, seed
 from org.models import Organization
 
 
 class Command(BaseCommand):
-    help = 'Inserts initial data into the database'
+    help = 'Inserts initial data into the database, or a large synthetic dataset with --orgs/--users-per-org'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orgs', type=int, help='Generate this many organizations')
+        parser.add_argument('--users-per-org', type=int, default=1000)
+        parser.add_argument('--roles', default='ADMIN=1,VIEWER=9,USER=90', help='Role distribution per org')
+        parser.add_argument('--password', default='123123', help='Password shared by the generated users')
+        parser.add_argument('--prefix', default='bench', help='Used in generated names and emails')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows per INSERT / LOAD DATA file')
+        parser.add_argument('--workers', type=int, default=1, help='Processes generating rows')
+        parser.add_argument('--load-data', action='store_true',
+                            help='Insert users with LOAD DATA LOCAL INFILE (MySQL, needs DB_LOCAL_INFILE=1)')
+
+    def handle(self, *args, **options):
+        if options['orgs']:
+            self.generate(options)
+            return
 
-    def handle(self, *args, **kwargs):
         org1, created1 = Organization.objects.get_or_create(name='Organization1', defaults={'phone': '123456789', 'address': 'Address1'})
         org2, created2 = Organization.objects.get_or_create(name='Organization2', defaults={'phone': '987654321', 'address': 'Address2'})
+        password = make_password('123123')
 
         for user_type in ['ADMIN', 'VIEWER', 'USER']:
             for idx, org in enumerate([org1, org2], 1):
                 for i in range(1, 3):
                     user_email = f'{user_type.lower()}{(idx - 1) * 2 + i}@example.com'
-                    User.objects.get_or_create(
+                    user, created = User.objects.get_or_create(
                         email=user_email,
                         defaults={
                             'name': f'{user_type} User {(idx - 1) * 2 + i}',
                             'organization_id': org.id,
                             'birthdate': '1990-01-01',
                             'user_type': user_type,
-                            'password': '123123'
+                            'password': password
                         }
                     )
+                    if created and group_id_for(user_type):
+                        user.groups.add(group_id_for(user_type))
 
         self.stdout.write(self.style.SUCCESS('Successfully inserted initial data'))
+
+    def generate(self, options):
+        try:
+            summary = seed(
+                options['orgs'], options['users_per_org'], parse_roles(options['roles']),
+                password=options['password'], prefix=options['prefix'], chunk_size=options['chunk_size'],
+                workers=options['workers'], load_data=options['load_data'], log=self.stdout.write,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Inserted {summary['organizations']} organizations, {summary['users']} users and "
+            f"{summary['memberships']} group memberships in {summary['seconds']}s"
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from user.models import User
+from user.search import index_users
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the user search tokens, e.g. after switching USER_SEARCH_BACKEND to tokens'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        last_id, total = 0, 0
+        while True:
+            users = list(User.objects.filter(id__gt=last_id).order_by('id')
+                         .only('id', 'organization_id', 'name', 'email')[:chunk_size])
+            if not users:
+                break
+            with transaction.atomic():
+                index_users(users)
+            total += len(users)
+            last_id = users[-1].pk
+        self.stdout.write(self.style.SUCCESS(f'Indexed {total} users'))
@@ -0,0 +1,66 @@
+# Generated by Django 4.2.5 on 2026-10-18 13:15
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import re
+
+FULLTEXT_INDEX = 'user_user_name_email_ft'
+
+
+def build_search_tokens(apps, schema_editor):
+    User = apps.get_model('user', 'User')
+    UserSearchToken = apps.get_model('user', 'UserSearchToken')
+    word = re.compile(r'\w+')
+
+    last_id = 0
+    while True:
+        users = list(User.objects.filter(id__gt=last_id).order_by('id')
+                     .values_list('id', 'organization_id', 'name', 'email')[:2000])
+        if not users:
+            return
+        rows = []
+        for pk, organization_id, name, email in users:
+            name, email = (name or '').lower(), (email or '').lower()
+            local, _, domain = email.partition('@')
+            tokens = set(word.findall(name)) | set(word.findall(email)) | {email, local, domain}
+            tokens.discard('')
+            rows += [UserSearchToken(user_id=pk, organization_id=organization_id, token=token[:64])
+                     for token in {token[:64] for token in tokens}]
+        UserSearchToken.objects.bulk_create(rows, batch_size=2000)
+        last_id = users[-1][0]
+
+
+def add_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute(f'ALTER TABLE `user_user` ADD FULLTEXT INDEX `{FULLTEXT_INDEX}` (`name`, `email`)')
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute(f'ALTER TABLE `user_user` DROP INDEX `{FULLTEXT_INDEX}`')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('org', '0001_initial'),
+        ('user', '0002_auto_20230925_0222'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64)),
+                ('organization', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='org.organization')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['organization', 'token'], name='user_search_org_token_idx'), models.Index(fields=['token'], name='user_search_token_idx'), models.Index(fields=['user', 'token'], name='user_search_user_token_idx')],
+            },
+        ),
+        migrations.RunPython(build_search_tokens, migrations.RunPython.noop),
+        migrations.RunPython(add_fulltext_index, drop_fulltext_index),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.5 on 2026-10-18 13:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('org', '0001_initial'),
+        ('user', '0003_user_search_token'),
+    ]
+
+    # The composite indexes go in first so that MySQL always has an index supporting the
+    # organization foreign key when the single-column one is dropped.
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['organization', 'id', 'name'], name='user_org_id_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['organization', 'user_type'], name='user_org_user_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['organization', 'phone'], name='user_org_phone_idx'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='organization',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='org.organization'),
+        ),
+    ]
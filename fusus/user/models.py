@@ -1,7 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from org.models import Organization
-from django.contrib.auth.models import Group
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
+from common.models import VersionedModel
+from .groups import group_id_for
 
 
 class UserManager(BaseUserManager):
@@ -10,27 +11,16 @@ class UserManager(BaseUserManager):
             raise ValueError('The Email field must be set')
         email = self.normalize_email(email)
 
-        organization = None
-        if organization_id:
-            organization = Organization.objects.get(pk=organization_id)
-
-        user = self.model(email=email, organization=organization, **extra_fields)
+        user = self.model(email=email, organization_id=organization_id, **extra_fields)
         user.set_password(password)
-        user.save(using=self._db)
-
-        group_map = {
-            'ADMIN': 'Administrator',
-            'VIEWER': 'Viewer',
-            'USER': 'User'
-        }
-
-        group_name = group_map.get(extra_fields.get('user_type'))
-        if group_name:
-            try:
-                user_group = Group.objects.get(name=group_name)
-                user.groups.add(user_group)
-            except Group.DoesNotExist:
-                pass
+        group_id = group_id_for(extra_fields.get('user_type'))
+
+        # One INSERT for the user and one for the membership. The organization is not fetched
+        # (the FK constraint checks it) and groups.add() is skipped because it SELECTs first.
+        with transaction.atomic(using=self._db):
+            user.save(using=self._db)
+            if group_id:
+                self.model.groups.through.objects.using(self._db).create(user_id=user.pk, group_id=group_id)
 
         return user
 
@@ -41,7 +31,7 @@ class UserManager(BaseUserManager):
         return self.create_user(email, organization_id, password, **extra_fields)
 
 
-class User(AbstractBaseUser, PermissionsMixin):
+class User(AbstractBaseUser, PermissionsMixin, VersionedModel):
     USER_TYPE_CHOICES = (
         ('ADMIN', 'Administrator'),
         ('VIEWER', 'Viewer'),
@@ -50,7 +40,8 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     phone = models.CharField(max_length=15)
     email = models.EmailField(unique=True)
-    organization = models.ForeignKey(Organization, on_delete=models.CASCADE)
+    # Indexed through the composite indexes below, which all start with organization.
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, db_index=False)
     birthdate = models.DateField()
     is_staff = models.BooleanField(default=False)
     user_type = models.CharField(max_length=10, choices=USER_TYPE_CHOICES, default='USER')
@@ -59,3 +50,25 @@ class User(AbstractBaseUser, PermissionsMixin):
     REQUIRED_FIELDS = ['name', 'organization_id', 'birthdate']
 
     objects = UserManager()
+
+    class Meta:
+        indexes = [
+            # Org-scoped lists keyed on (organization_id, id); name makes the id/name listing covering.
+            models.Index(fields=['organization', 'id', 'name'], name='user_org_id_name_idx'),
+            models.Index(fields=['organization', 'user_type'], name='user_org_user_type_idx'),
+            models.Index(fields=['organization', 'phone'], name='user_org_phone_idx'),
+        ]
+
+
+class UserSearchToken(models.Model):
+    """One lowercased word of a user's name or email, kept in sync by ``user.search``."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='search_tokens', db_index=False)
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, db_index=False)
+    token = models.CharField(max_length=64)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['organization', 'token'], name='user_search_org_token_idx'),
+            models.Index(fields=['token'], name='user_search_token_idx'),
+            models.Index(fields=['user', 'token'], name='user_search_user_token_idx'),
+        ]
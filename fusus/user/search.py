@@ -0,0 +1,125 @@
+import re
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, FloatField, IntegerField, OuterRef, Subquery, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+from rest_framework import filters
+
+from org.membership import membership_cache
+from .models import User, UserSearchToken
+
+TOKEN_LENGTH = UserSearchToken._meta.get_field('token').max_length
+MAX_TERMS = 5
+WORD = re.compile(r'\w+')
+SEARCHED_FIELDS = {'name', 'email', 'organization', 'organization_id'}
+
+
+def tokenize(name, email):
+    """Words of the name, plus the email, its local part, domain and their words, lowercased."""
+    name, email = (name or '').lower(), (email or '').lower()
+    local, _, domain = email.partition('@')
+    tokens = set(WORD.findall(name)) | set(WORD.findall(email)) | {email, local, domain}
+    tokens.discard('')
+    return {token[:TOKEN_LENGTH] for token in tokens}
+
+
+def search_terms(value):
+    terms = [term.lower()[:TOKEN_LENGTH] for term in re.split(r'[\s,]+', value or '') if term]
+    return list(dict.fromkeys(terms))[:MAX_TERMS]
+
+
+def index_users(users):
+    """Rebuild the tokens of ``users`` (anything with pk, organization_id, name and email)."""
+    users = [user for user in users if user.pk]
+    if not users:
+        return
+    UserSearchToken.objects.filter(user_id__in=[user.pk for user in users]).delete()
+    UserSearchToken.objects.bulk_create(
+        [UserSearchToken(user_id=user.pk, organization_id=user.organization_id, token=token)
+         for user in users for token in tokenize(user.name, user.email)],
+        batch_size=1000,
+    )
+
+
+def index_user_ids(ids):
+    """``index_users`` for the users with these ids; run as a durable task by large batches."""
+    users = list(User.objects.filter(pk__in=ids).only('id', 'organization_id', 'name', 'email'))
+    with transaction.atomic():
+        index_users(users)
+    # Cached member lists may hold search results from before the tokens existed.
+    for organization_id in {user.organization_id for user in users}:
+        membership_cache.bump(organization_id)
+
+
+def reindex_user(user, created=False):
+    """Bring one user's tokens up to date, writing only the rows that changed."""
+    wanted = {(user.organization_id, token) for token in tokenize(user.name, user.email)}
+    existing = set() if created else set(
+        UserSearchToken.objects.filter(user_id=user.pk).values_list('organization_id', 'token')
+    )
+    stale = existing - wanted
+    if stale:
+        UserSearchToken.objects.filter(user_id=user.pk, token__in=[token for _, token in stale]).delete()
+    UserSearchToken.objects.bulk_create(
+        [UserSearchToken(user_id=user.pk, organization_id=organization_id, token=token)
+         for organization_id, token in wanted - existing]
+    )
+
+
+def index_enabled():
+    return settings.USER_SEARCH_BACKEND == 'tokens'
+
+
+def _token_search(queryset, terms, organization_id):
+    tokens = UserSearchToken.objects.all()
+    if organization_id is not None:
+        tokens = tokens.filter(organization_id=organization_id)
+
+    # Every term has to prefix-match one of the user's tokens; each one is a range scan on
+    # (organization, token). Exact token matches rank first.
+    for term in terms:
+        queryset = queryset.filter(id__in=tokens.filter(token__istartswith=term).values('user_id'))
+    exact = (UserSearchToken.objects.filter(user_id=OuterRef('pk'), token__in=terms)
+             .order_by().values('user_id').annotate(matches=Count('id')).values('matches'))
+    return queryset.annotate(search_rank=Coalesce(Subquery(exact, output_field=IntegerField()), Value(0)))
+
+
+def _fulltext_search(queryset, terms):
+    words = [word for term in terms for word in WORD.findall(term)]
+    if not words:
+        return queryset.none()
+    match = 'MATCH ({}, {}) AGAINST (%s IN BOOLEAN MODE)'.format(
+        *(connection.ops.quote_name(User._meta.get_field(name).column) for name in ('name', 'email'))
+    )
+    query = ' '.join(f'+{word}*' for word in words)
+    return queryset.annotate(search_rank=RawSQL(match, [query], output_field=FloatField())).filter(search_rank__gt=0)
+
+
+def search_users(queryset, terms, organization_id=None):
+    """
+    ``queryset`` narrowed to users matching every term, annotated with ``search_rank``
+    (higher is better). Pass ``organization_id`` to keep the index lookups inside one tenant.
+    """
+    if settings.USER_SEARCH_BACKEND == 'fulltext':
+        return _fulltext_search(queryset, terms)
+    return _token_search(queryset, terms, organization_id)
+
+
+class UserSearchFilter(filters.SearchFilter):
+    """
+    ``?search=`` through ``search_users`` ordered by relevance, or DRF's icontains search
+    when ``USER_SEARCH_BACKEND`` is 'like'.
+    """
+    keyset_ordering = ('-search_rank', 'id')
+
+    def filter_queryset(self, request, queryset, view):
+        if settings.USER_SEARCH_BACKEND == 'like':
+            return super().filter_queryset(request, queryset, view)
+
+        terms = search_terms(request.query_params.get(self.search_param, ''))
+        if not terms:
+            return queryset
+        view.keyset_ordering = self.keyset_ordering
+        return search_users(queryset, terms, request.user.organization_id)
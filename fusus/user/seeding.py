@@ -0,0 +1,192 @@
+import csv
+import math
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.utils import timezone
+
+from org.models import Organization
+from .groups import group_id_for
+from .models import User, UserSearchToken
+from .search import index_enabled, tokenize
+
+ROLE_DISTRIBUTION = {'ADMIN': 1, 'VIEWER': 9, 'USER': 90}
+USER_COLUMNS = ('password', 'is_superuser', 'name', 'phone', 'email', 'organization_id', 'birthdate',
+                'is_staff', 'user_type', 'version', 'updated_at')
+
+
+def parse_roles(value):
+    """``'ADMIN=1,VIEWER=9,USER=90'`` -> ``{'ADMIN': 1, 'VIEWER': 9, 'USER': 90}``."""
+    roles = {}
+    for part in value.split(','):
+        role, _, weight = part.partition('=')
+        role = role.strip().upper()
+        if role not in ROLE_DISTRIBUTION or not weight.strip().isdigit():
+            raise ValueError(f'Invalid role weight {part!r}, expected e.g. ADMIN=1,VIEWER=9,USER=90')
+        roles[role] = int(weight)
+    if not sum(roles.values()):
+        raise ValueError('At least one role needs a positive weight')
+    return roles
+
+
+def role_cycle(roles):
+    """Roles spread evenly over a cycle of ``sum(weights)`` slots, so every org gets the same mix."""
+    divisor = reduce(math.gcd, roles.values())
+    roles = {role: weight // divisor for role, weight in roles.items() if weight}
+    total = sum(roles.values())
+    cycle = []
+    for slot in range(total):
+        # Pick the role that is furthest behind its share at this slot.
+        role = max(roles, key=lambda r: roles[r] * (slot + 1) / total - cycle.count(r))
+        cycle.append(role)
+    return cycle
+
+
+def iter_ids(queryset, chunk_size, fields=('id', 'user_type')):
+    """``fields`` of ``queryset`` (the primary key first) in ascending LIMIT-bounded batches."""
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id).order_by('id').values_list(*fields)[:chunk_size])
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1][0]
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def user_rows(task):
+    """Column tuples (see ``USER_COLUMNS``) for users ``start..stop`` of one organization."""
+    organization_id, start, stop, cycle, password_hash, prefix, updated_at = task
+    rows = []
+    for n in range(start + 1, stop + 1):
+        role = cycle[(n - 1) % len(cycle)]
+        rows.append((
+            password_hash, 0, f'{role} User {n}', f'{organization_id % 100000:05d}{n:010d}'[-15:],
+            f'{role.lower()}{n}@{prefix}-org{organization_id}.example.com', organization_id, '1990-01-01',
+            int(role == 'ADMIN'), role, 1, updated_at,
+        ))
+    return rows
+
+
+def user_file(task):
+    """Like ``user_rows`` but written to a tab-separated file for LOAD DATA; returns (path, rows)."""
+    directory, task = task[0], task[1:]
+    rows = user_rows(task)
+    fd, path = tempfile.mkstemp(suffix='.tsv', dir=directory)
+    with os.fdopen(fd, 'w', newline='') as output:
+        csv.writer(output, delimiter='\t', lineterminator='\n').writerows(rows)
+    return path, len(rows)
+
+
+def _insert_rows(rows):
+    users = [User(**dict(zip(USER_COLUMNS, row))) for row in rows]
+    with transaction.atomic():
+        User.objects.bulk_create(users, batch_size=len(users))
+    return len(users)
+
+
+def _load_file(path):
+    # Needs local_infile enabled on the server and on the connection (DB_LOCAL_INFILE=1).
+    columns = ', '.join(f'`{User._meta.get_field(name).column}`' for name in USER_COLUMNS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"LOAD DATA LOCAL INFILE %s INTO TABLE `{User._meta.db_table}` "
+            f"FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' ({columns})",
+            [path],
+        )
+
+
+def seed(orgs, users_per_org, roles=None, password='password', prefix='bench', chunk_size=5000, workers=1,
+         load_data=False, log=None):
+    """
+    Bulk-insert ``orgs`` organizations with ``users_per_org`` users each, plus their group
+    memberships and search tokens. Every user shares one precomputed password hash.
+
+    Rows are generated on ``workers`` processes while the main process inserts them, either with
+    ``bulk_create`` or, with ``load_data`` on MySQL, with ``LOAD DATA LOCAL INFILE``.
+    """
+    if load_data and connection.vendor != 'mysql':
+        raise ValueError('load_data is only supported on MySQL')
+
+    log = log or (lambda message: None)
+    cycle = role_cycle(roles or ROLE_DISTRIBUTION)
+    password_hash = make_password(password)
+    started = time.monotonic()
+
+    first_org_id = (Organization.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+    first_user_id = (User.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+
+    Organization.objects.bulk_create(
+        [Organization(name=f'{prefix} org {i}', phone=f'{i:010d}'[-15:], address=f'{i} {prefix} street')
+         for i in range(1, orgs + 1)],
+        batch_size=chunk_size,
+    )
+    organization_ids = list(Organization.objects.filter(id__gte=first_org_id).order_by('id')
+                            .values_list('id', flat=True))
+    log(f'Created {len(organization_ids)} organizations')
+
+    updated_at = timezone.now().strftime('%Y-%m-%d %H:%M:%S.%f')
+    tasks = [(organization_id, start, min(users_per_org, start + chunk_size), cycle, password_hash, prefix,
+              updated_at)
+             for organization_id in organization_ids
+             for start in range(0, users_per_org, chunk_size)]
+    progress_every = max(1, len(tasks) // 20)
+
+    with tempfile.TemporaryDirectory() as directory:
+        if load_data:
+            generate, tasks = user_file, [(directory,) + task for task in tasks]
+        else:
+            generate = user_rows
+
+        if workers > 1:
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+            results = pool.map(generate, tasks, chunksize=max(1, len(tasks) // (workers * 8)))
+        else:
+            pool, results = None, map(generate, tasks)
+
+        created = 0
+        try:
+            for index, result in enumerate(results, 1):
+                if load_data:
+                    path, count = result
+                    _load_file(path)
+                    os.remove(path)
+                    created += count
+                else:
+                    created += _insert_rows(result)
+                if index % progress_every == 0 or index == len(tasks):
+                    log(f'Created {created} users')
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+    Membership = User.groups.through
+    memberships = 0
+    for batch in iter_ids(User.objects.filter(id__gte=first_user_id), chunk_size):
+        rows = [Membership(user_id=pk, group_id=group_id_for(user_type)) for pk, user_type in batch
+                if group_id_for(user_type)]
+        Membership.objects.bulk_create(rows, batch_size=chunk_size)
+        memberships += len(rows)
+    log(f'Created {memberships} group memberships')
+
+    if index_enabled():
+        tokens = 0
+        new_users = User.objects.filter(id__gte=first_user_id)
+        for batch in iter_ids(new_users, chunk_size, ('id', 'organization_id', 'name', 'email')):
+            rows = [UserSearchToken(user_id=pk, organization_id=organization_id, token=token)
+                    for pk, organization_id, name, email in batch for token in tokenize(name, email)]
+            UserSearchToken.objects.bulk_create(rows, batch_size=chunk_size)
+            tokens += len(rows)
+        log(f'Created {tokens} search tokens')
+
+    return {'organizations': len(organization_ids), 'users': created, 'memberships': memberships,
+            'seconds': round(time.monotonic() - started, 2)}
@@ -1,14 +1,87 @@
+from django.conf import settings
 from rest_framework import serializers, viewsets
 from .models import User
+from org.cache import organization_cache
+from common.fields import DynamicFieldsMixin
 from django.contrib.auth.models import Group
 
 
+# Output field -> columns it is rendered from, for list/retrieve. The password hash is never selected.
+READ_SOURCES = {
+    'id': ('id',),
+    'organization_name': ('organization_id',),
+    'last_login': ('last_login',),
+    'is_superuser': ('is_superuser',),
+    'version': ('version',),
+    'updated_at': ('updated_at',),
+    'name': ('name',),
+    'phone': ('phone',),
+    'email': ('email',),
+    'birthdate': ('birthdate',),
+    'is_staff': ('is_staff',),
+    'user_type': ('user_type',),
+    'organization': ('organization_id',),
+    'groups': (),
+    'user_permissions': (),
+}
+READ_FIELDS = tuple(READ_SOURCES)
+# M2M output field -> column of the related id in its through table
+RELATED_COLUMNS = {'groups': 'group_id', 'user_permissions': 'permission_id'}
+RELATED_FIELDS = tuple(RELATED_COLUMNS)
+
+
 class UserSerializer(serializers.ModelSerializer):
-    organization_name = serializers.CharField(source='organization.name', read_only=True)
+    organization_name = serializers.SerializerMethodField()
 
     class Meta:
         model = User
         fields = '__all__'
+        extra_kwargs = {'password': {'write_only': True}}
+
+    def get_organization_name(self, obj):
+        return organization_cache.get(obj.organization_id).name
+
+
+class UserReadSerializer(DynamicFieldsMixin, serializers.Serializer):
+    """
+    Read-only twin of ``UserSerializer`` for rows from ``values()`` over ``READ_SOURCES`` that
+    went through ``add_related_ids``; no model instances are built.
+    """
+    id = serializers.IntegerField()
+    organization_name = serializers.SerializerMethodField()
+    last_login = serializers.DateTimeField()
+    is_superuser = serializers.BooleanField()
+    version = serializers.IntegerField()
+    updated_at = serializers.DateTimeField()
+    name = serializers.CharField()
+    phone = serializers.CharField()
+    email = serializers.EmailField()
+    birthdate = serializers.DateField()
+    is_staff = serializers.BooleanField()
+    user_type = serializers.CharField()
+    organization = serializers.IntegerField(source='organization_id')
+    groups = serializers.ListField(child=serializers.IntegerField())
+    user_permissions = serializers.ListField(child=serializers.IntegerField())
+
+    def get_organization_name(self, row):
+        return organization_cache.get(row['organization_id']).name
+
+
+def add_related_ids(rows, fields=RELATED_FIELDS):
+    """Set the ``groups``/``user_permissions`` id lists named in ``fields`` on user rows, one query each."""
+    by_id = {row['id']: row for row in rows}
+    for row in rows:
+        for field in fields:
+            row[field] = []
+    if not by_id:
+        return rows
+    for field in fields:
+        through = getattr(User, field).through
+        column = RELATED_COLUMNS[field]
+        for user_id, related_id in (through.objects.filter(user_id__in=by_id).order_by()
+                                    .values_list('user_id', column)):
+            by_id[user_id][field].append(related_id)
+    return rows
 
 
 class MinimalUserSerializer(serializers.ModelSerializer):
@@ -21,3 +94,37 @@ class GroupSerializer(serializers.ModelSerializer):
     class Meta:
         model = Group
         fields = ['name']
+
+
+class BatchUserCreateSerializer(serializers.Serializer):
+    email = serializers.EmailField()
+    name = serializers.CharField(max_length=255)
+    phone = serializers.CharField(max_length=15)
+    birthdate = serializers.DateField()
+    user_type = serializers.ChoiceField(choices=User.USER_TYPE_CHOICES, default='USER')
+    organization = serializers.IntegerField()
+    password = serializers.CharField(write_only=True)
+
+
+class BatchUserUpdateSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    email = serializers.EmailField(required=False)
+    name = serializers.CharField(max_length=255, required=False)
+    phone = serializers.CharField(max_length=15, required=False)
+    birthdate = serializers.DateField(required=False)
+    user_type = serializers.ChoiceField(choices=User.USER_TYPE_CHOICES, required=False)
+    password = serializers.CharField(write_only=True, required=False)
+
+
+class UserBatchSerializer(serializers.Serializer):
+    create = serializers.ListField(child=serializers.DictField(), required=False, default=list)
+    update = serializers.ListField(child=serializers.DictField(), required=False, default=list)
+    delete = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+
+    def validate(self, attrs):
+        size = len(attrs['create']) + len(attrs['update']) + len(attrs['delete'])
+        if size == 0:
+            raise serializers.ValidationError("Batch must contain at least one operation.")
+        if size > settings.USER_BATCH_MAX_SIZE:
+            raise serializers.ValidationError(f"Batch cannot contain more than {settings.USER_BATCH_MAX_SIZE} operations.")
+        return attrs
@@ -0,0 +1,43 @@
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_save, post_delete
+from django.dispatch import receiver
+
+from org.membership import membership_cache
+from .groups import reset_group_ids
+from .models import User
+from .search import SEARCHED_FIELDS, index_enabled, reindex_user
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_ids(sender, **kwargs):
+    reset_group_ids()
+
+
+@receiver(post_save, sender=User)
+def update_search_tokens(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    if raw or not index_enabled():
+        return
+    # e.g. save(update_fields=['last_login']) leaves the tokens alone.
+    if update_fields is not None and not SEARCHED_FIELDS.intersection(update_fields):
+        return
+    reindex_user(instance, created=created)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def bump_membership_version(sender, instance, raw=False, **kwargs):
+    if not raw:
+        membership_cache.bump(instance.organization_id)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def bump_membership_version_on_groups(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        membership_cache.bump(instance.organization_id)
+        return
+    users = User.objects.all() if pk_set is None else User.objects.filter(pk__in=pk_set)
+    for organization_id in users.order_by().values_list('organization_id', flat=True).distinct():
+        membership_cache.bump(organization_id)
@@ -1,9 +1,29 @@
+import base64
+import json
 from django.urls import reverse
 from rest_framework import status
 from user.models import User, Organization
 from rest_framework_simplejwt.tokens import RefreshToken, AccessToken
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.db import connection
 from django.db.models import Q
+from django.contrib.auth.hashers import check_password
+from django.contrib.auth.models import Group
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from common.tests.base import BaseTestCase
+from common.pagination import KeysetPagination
+from user.hashing import LoginExecutor, hash_passwords
+from user.groups import reset_group_ids, warm_group_ids
+from user.egress import EgressIPProvider, egress_ip
+from user.seeding import parse_roles, seed
+from user.serializers import UserSerializer
+from common.authentication import revoke_user_tokens, tokens_for_user
+from common.tasks import run_due_tasks
+from django.core.cache import cache
+from unittest.mock import patch
 
 
 class AuthTests(BaseTestCase):
@@ -41,6 +61,89 @@ class AuthTests(BaseTestCase):
         self.assertIn("User", group_names)
 
 
+    def test_login_token_carries_claims(self):
+        response = self.client.post(reverse('auth-login'), {"email": "viewer1@testorg1.com", "password": "password"},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        token = AccessToken(response.data["access"])
+        self.assertEqual(token["user_type"], "VIEWER")
+        self.assertEqual(token["organization_id"], self.org1.id)
+        self.assertEqual(token["organization_name"], self.org1.name)
+
+    def test_claims_token_needs_no_user_query(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        with patch.object(egress_ip, 'get', return_value="203.0.113.7"), self.assertNumQueries(0):
+            response = self.client.get(reverse('info'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["organization_name"], self.org1.name)
+
+    def test_legacy_token_without_claims(self):
+        user = User.objects.get(email="viewer1@testorg1.com")
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + str(RefreshToken.for_user(user).access_token))
+        response = self.client.get(reverse('users-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), User.objects.filter(organization=self.org1).count())
+
+    def test_revoked_token_is_rejected(self):
+        user = User.objects.get(email="admin1@testorg1.com")
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        with self.settings(JWT_REVOCATION_CHECK=True):
+            revoke_user_tokens(user.id)
+            response = self.client.get(reverse('users-list'))
+        cache.clear()
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_token_issued_right_after_revocation_is_accepted(self):
+        user = User.objects.get(email="admin1@testorg1.com")
+        second = float(int(time.time()))
+        with self.settings(JWT_REVOCATION_CHECK=True):
+            with patch('time.time', return_value=second + 0.2):
+                revoke_user_tokens(user.id)
+            with patch('time.time', return_value=second + 0.7):
+                token = tokens_for_user(user).access_token
+            self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + str(token))
+            response = self.client.get(reverse('users-list'))
+        cache.clear()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(PASSWORD_HASHERS=['user.hashing.TunablePBKDF2PasswordHasher'], PASSWORD_HASH_ITERATIONS=1000)
+    def test_login_rehashes_to_configured_work_factor(self):
+        user = User.objects.get(email="user1@testorg1.com")
+        user.set_password("password")
+        user.save()
+        self.assertIn("$1000$", user.password)
+
+        with self.settings(PASSWORD_HASH_ITERATIONS=2000):
+            response = self.client.post(reverse('auth-login'), {"email": user.email, "password": "password"},
+                                        format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        user.refresh_from_db()
+        self.assertIn("$2000$", user.password)
+        self.assertTrue(user.check_password("password"))
+
+    def test_login_invalid_password(self):
+        response = self.client.post(reverse('auth-login'), {"email": "user1@testorg1.com", "password": "wrong"},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(LOGIN_HASH_WORKERS=1, LOGIN_HASH_QUEUE=0)
+    def test_login_rejected_when_hash_pool_is_full(self):
+        executor = LoginExecutor()
+        started, release = threading.Event(), threading.Event()
+        busy = threading.Thread(target=executor.run, args=(lambda: started.set() or release.wait(),))
+        busy.start()
+        started.wait()
+
+        with patch('user.views.login_executor', executor):
+            response = self.client.post(reverse('auth-login'), {"email": "user1@testorg1.com", "password": "password"},
+                                        format='json')
+        release.set()
+        busy.join()
+
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertIn('Retry-After', response)
+
 class UserTests(BaseTestCase):
 
     def test_list_users_as_admin(self):
@@ -60,7 +163,7 @@ class UserTests(BaseTestCase):
         search_name = "ADMIN User 1"
         response = self.client.get(url, {'search': search_name})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data[0]['name'], search_name)
+        self.assertEqual(response.data['results'][0]['name'], search_name)
 
     def test_search_users_by_email_as_admin(self):
         url = reverse('users-list')
@@ -69,7 +172,7 @@ class UserTests(BaseTestCase):
         search_email = "admin1@testorg1.com"
         response = self.client.get(url, {'search': search_email})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data[0]['email'], search_email)
+        self.assertEqual(response.data['results'][0]['email'], search_email)
 
     def test_search_users_by_name_as_viewer(self):
         url = reverse('users-list')
@@ -78,7 +181,7 @@ class UserTests(BaseTestCase):
         search_name = "ADMIN User 1"
         response = self.client.get(url, {'search': search_name})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data[0]['name'], search_name)
+        self.assertEqual(response.data['results'][0]['name'], search_name)
 
     def test_search_users_by_email_as_viewer(self):
         url = reverse('users-list')
@@ -87,7 +190,62 @@ class UserTests(BaseTestCase):
         search_email = "admin1@testorg1.com"
         response = self.client.get(url, {'search': search_email})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data[0]['email'], search_email)
+        self.assertEqual(response.data['results'][0]['email'], search_email)
+
+    def test_search_users_by_prefix_within_organization(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["VIEWER"]["TestOrg1"][0])
+        response = self.client.get(reverse('users-list'), {'search': 'view'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 4)
+        self.assertTrue(all(user['organization'] == self.org1.id for user in response.data['results']))
+
+        response = self.client.get(reverse('users-list'), {'search': 'viewer3@testorg1'})
+        self.assertEqual([user['email'] for user in response.data['results']], ['viewer3@testorg1.com'])
+
+    def test_search_users_orders_exact_matches_first(self):
+        user = User.objects.get(email='user4@testorg1.com')
+        user.name = 'Userland Person'
+        user.save()
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        response = self.client.get(reverse('users-list'), {'search': 'user', 'page_size': 20})
+        names = [user['name'] for user in response.data['results']]
+        self.assertEqual(names[-1], 'Userland Person')
+
+    def test_search_follows_name_and_email_updates(self):
+        user = User.objects.get(email='viewer1@testorg1.com')
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        response = self.client.patch(reverse('users-detail', args=[user.id]),
+                                     {'name': 'Zelda Quux', 'email': 'zq@testorg1.com'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.get(reverse('users-list'), {'search': 'zel qu'})
+        self.assertEqual([found['id'] for found in response.data['results']], [user.id])
+        response = self.client.get(reverse('users-list'), {'search': 'viewer1'})
+        self.assertEqual(response.data['results'], [])
+
+    def test_search_users_follows_next_page(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        first = self.client.get(reverse('users-list'), {'search': 'view', 'page_size': 2})
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertIsNotNone(first.data['next'])
+
+        second = self.client.get(first.data['next'])
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        ids = [user['id'] for user in first.data['results'] + second.data['results']]
+        self.assertEqual(len(ids), 4)
+        self.assertEqual(set(ids), set(User.objects.filter(organization=self.org1, email__startswith='viewer')
+                                       .values_list('id', flat=True)))
+
+        cursor = base64.urlsafe_b64encode(json.dumps(["a", "b"]).encode()).decode().rstrip('=')
+        response = self.client.get(reverse('users-list'), {'search': 'view', 'cursor': cursor})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(USER_SEARCH_BACKEND='like')
+    def test_search_users_like_backend(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        response = self.client.get(reverse('users-list'), {'search': 'ewer 2'})
+        self.assertEqual([user['name'] for user in response.data['results']], ['VIEWER User 2'])
 
     def test_filter_users_by_phone_as_admin(self):
         url = reverse('users-list')
@@ -96,7 +254,7 @@ class UserTests(BaseTestCase):
         filter_phone = "1000000001"
         response = self.client.get(url, {'phone': filter_phone})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data[0]['phone'], filter_phone)
+        self.assertEqual(response.data['results'][0]['phone'], filter_phone)
 
     def test_filter_users_by_phone_as_viewer(self):
         url = reverse('users-list')
@@ -105,7 +263,128 @@ class UserTests(BaseTestCase):
         filter_phone = "1000000001"
         response = self.client.get(url, {'phone': filter_phone})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data[0]['phone'], filter_phone)
+        self.assertEqual(response.data['results'][0]['phone'], filter_phone)
+
+    def test_list_users_query_count_does_not_grow_with_page(self):
+        url = reverse('users-list')
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        # users, then one query each for groups and user_permissions
+        with self.assertNumQueries(3):
+            response = self.client.get(url, {'page_size': 2})
+        self.assertEqual(len(response.data['results']), 2)
+
+        with self.assertNumQueries(3):
+            response = self.client.get(url, {'page_size': 50})
+        self.assertEqual(len(response.data['results']), 9)
+
+        admin = next(user for user in response.data['results'] if user['user_type'] == 'ADMIN')
+        viewer = next(user for user in response.data['results'] if user['user_type'] == 'VIEWER')
+        self.assertEqual(len(admin['groups']), 1)
+        self.assertEqual(len(viewer['groups']), 1)
+        self.assertNotEqual(admin['groups'], viewer['groups'])
+
+    def test_list_and_retrieve_match_user_serializer_without_password(self):
+        user = User.objects.get(email="viewer1@testorg1.com")
+        expected = dict(UserSerializer(user).data)
+        self.assertNotIn('password', expected)
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('users-detail', args=[user.id]))
+        self.assertEqual(dict(response.data), expected)
+        self.assertEqual(list(response.data), list(expected))
+
+        response = self.client.get(reverse('users-list'), {'page_size': 50})
+        listed = next(item for item in response.data['results'] if item['id'] == user.id)
+        self.assertEqual(dict(listed), expected)
+
+    def test_list_users_does_not_select_password(self):
+        user_id = User.objects.get(email="user1@testorg1.com").id
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('users-list'))
+            self.client.get(reverse('users-detail', args=[user_id]))
+        self.assertFalse(any('password' in query['sql'] for query in queries.captured_queries))
+
+    def test_list_users_sparse_fields(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('users-list'), {'fields': 'email,id,name'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(response.data['results'][0]), ['id', 'name', 'email'])
+        self.assertEqual(len(queries.captured_queries), 1)
+        self.assertNotIn('"phone"', queries.captured_queries[0]['sql'])
+
+        response = self.client.get(reverse('users-list'), {'exclude': 'groups,user_permissions,organization_name'})
+        self.assertNotIn('groups', response.data['results'][0])
+        self.assertIn('phone', response.data['results'][0])
+
+    def test_list_users_sparse_fields_paginates(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        response = self.client.get(reverse('users-list'), {'fields': 'name', 'page_size': 5})
+        self.assertEqual(list(response.data['results'][0]), ['name'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 4)
+
+    def test_sparse_fields_are_validated(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        response = self.client.get(reverse('users-list'), {'fields': 'id,password'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('fields', response.data)
+
+        user = User.objects.get(email="user1@testorg1.com")
+        response = self.client.get(reverse('users-detail', args=[user.id]), {'exclude': 'nope'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_retrieve_user_sparse_fields(self):
+        user = User.objects.get(email="viewer1@testorg1.com")
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('users-detail', args=[user.id]), {'fields': 'id,groups'})
+        self.assertEqual(response.data, {'id': user.id, 'groups': list(user.groups.values_list('id', flat=True))})
+
+    def test_list_users_keyset_pagination(self):
+        url = reverse('users-list')
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+
+        seen = []
+        next_url = url + '?page_size=2'
+        while next_url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(next_url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 2)
+            for query in queries.captured_queries:
+                self.assertNotIn('COUNT(', query['sql'].upper())
+                self.assertNotIn('OFFSET', query['sql'].upper())
+            seen.extend(user['id'] for user in response.data['results'])
+            next_url = response.data['next']
+
+        expected = list(User.objects.filter(organization=self.org1).order_by('id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_list_users_page_size_is_capped(self):
+        url = reverse('users-list')
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        with patch.object(KeysetPagination, 'max_page_size', 3):
+            response = self.client.get(url, {'page_size': 500})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_list_users_invalid_cursor(self):
+        url = reverse('users-list')
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        response = self.client.get(url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_list_users_cursor_with_wrong_types(self):
+        url = reverse('users-list')
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        for position in (["a", "b"], [None, 1], [[1], {}]):
+            cursor = base64.urlsafe_b64encode(json.dumps(position).encode()).decode().rstrip('=')
+            response = self.client.get(url, {'cursor': cursor})
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND, position)
 
     def test_create_user_admin(self):
         url = reverse('users-list')
@@ -122,6 +401,69 @@ class UserTests(BaseTestCase):
         response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
+    def test_create_user_query_count(self):
+        warm_group_ids()
+        with CaptureQueriesContext(connection) as queries:
+            user = User.objects.create_user(
+                email="pinned@test.com",
+                name="Pinned",
+                phone="922",
+                birthdate="1992-12-20",
+                organization_id=self.org1.id,
+                user_type="VIEWER",
+                password="password"
+            )
+        statements = [query['sql'] for query in queries.captured_queries
+                      if not query['sql'].upper().startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))]
+        # user, group membership and search tokens
+        self.assertEqual(len(statements), 3)
+        self.assertTrue(all(sql.upper().startswith('INSERT') for sql in statements))
+        self.assertEqual(list(user.groups.values_list('name', flat=True)), ["Viewer"])
+
+    def test_create_user_finds_group_created_by_another_process(self):
+        # The new group's id is rolled back with the test.
+        self.addCleanup(reset_group_ids)
+        Group.objects.filter(name='Viewer').delete()
+        warm_group_ids()
+        # bulk_create sends no post_save, like a group inserted by another process.
+        Group.objects.bulk_create([Group(name='Viewer')])
+
+        user = User.objects.create_user(email="late@test.com", name="Late", phone="923", birthdate="1992-12-20",
+                                        organization_id=self.org1.id, user_type="VIEWER", password="password")
+        self.assertEqual(list(user.groups.values_list('name', flat=True)), ["Viewer"])
+
+    def test_create_user_duplicate_email(self):
+        url = reverse('users-list')
+        data = {
+            "email": "admin1@testorg1.com",
+            "name": "Duplicate",
+            "password": "password",
+            "phone": "923",
+            "birthdate": "1992-12-20",
+            "user_type": "USER",
+            "organization": self.org1.id
+        }
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data["detail"], "User with this email already exists")
+        self.assertEqual(User.objects.filter(email="admin1@testorg1.com").count(), 1)
+
+    def test_create_user_missing_name_is_not_reported_as_duplicate(self):
+        data = {
+            "email": "noname@test.com",
+            "password": "password",
+            "phone": "924",
+            "birthdate": "1992-12-20",
+            "user_type": "USER",
+            "organization": self.org1.id
+        }
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        response = self.client.post(reverse('users-list'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNotEqual(response.data["detail"], "User with this email already exists")
+        self.assertFalse(User.objects.filter(email="noname@test.com").exists())
+
     def test_create_user_as_viewer(self):
         url = reverse('users-list')
         data = {
@@ -187,6 +529,49 @@ class UserTests(BaseTestCase):
         response = self.client.get(url)
         self.assertNotEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_retrieve_user_not_modified(self):
+        user = User.objects.get(email="user1@testorg1.com")
+        url = reverse('users-detail', args=[user.id])
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["VIEWER"]["TestOrg1"][0])
+        response = self.client.get(url)
+        etag = response['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_retrieve_user_etag_changes_with_user_and_organization(self):
+        user = User.objects.get(email="user1@testorg1.com")
+        url = reverse('users-detail', args=[user.id])
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        etag = self.client.get(url)['ETag']
+
+        self.client.patch(url, {"name": "Changed"})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["name"], "Changed")
+        etag = response['ETag']
+
+        self.org1.name = "Renamed Org"
+        self.org1.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["organization_name"], "Renamed Org")
+
+    def test_retrieve_user_not_modified_checks_permissions(self):
+        user = User.objects.get(email="user1@testorg1.com")
+        url = reverse('users-detail', args=[user.id])
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        etag = self.client.get(url)['ETag']
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["VIEWER"]["TestOrg2"][0])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
     def test_retrieve_users_viewer_wrong_org(self):
         self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["VIEWER"]["TestOrg2"][0])
 
@@ -224,8 +609,156 @@ class UserTests(BaseTestCase):
         self.assertFalse(User.objects.filter(id=user_from_org1.id).exists())
 
 
+class UserBatchTests(BaseTestCase):
+
+    def _user_data(self, idx, org):
+        return {
+            "email": f"batch{idx}@test.com",
+            "name": f"Batch User {idx}",
+            "password": "password",
+            "phone": str(2000000000 + idx),
+            "birthdate": "1992-12-20",
+            "user_type": "VIEWER",
+            "organization": org.id
+        }
+
+    def test_batch_as_admin(self):
+        url = reverse('users-batch')
+        to_update = User.objects.filter(organization=self.org1, user_type='USER').first()
+        to_delete = User.objects.filter(organization=self.org1, user_type='USER').last()
+        data = {
+            "create": [self._user_data(1, self.org1), self._user_data(2, self.org1)],
+            "update": [{"id": to_update.id, "name": "Batch Updated", "password": "newpassword"}],
+            "delete": [to_delete.id],
+        }
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        response = self.client.post(url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['status'] for item in response.data['create']], [201, 201])
+        self.assertEqual(response.data['update'][0]['status'], 200)
+        self.assertEqual(response.data['delete'][0]['status'], 204)
+
+        created = User.objects.get(id=response.data['create'][0]['id'])
+        self.assertEqual(created.email, "batch1@test.com")
+        self.assertTrue(created.check_password("password"))
+        self.assertEqual(list(created.groups.values_list('name', flat=True)), ["Viewer"])
+
+        to_update.refresh_from_db()
+        self.assertEqual(to_update.name, "Batch Updated")
+        self.assertTrue(to_update.check_password("newpassword"))
+        self.assertFalse(User.objects.filter(id=to_delete.id).exists())
+
+        created_ids = {item['id'] for item in response.data['create']}
+        search = self.client.get(reverse('users-list'), {'search': 'batch'})
+        self.assertEqual({user['id'] for user in search.data['results']}, created_ids | {to_update.id})
+
+    def test_batch_update_keeps_concurrent_changes(self):
+        first, second = User.objects.filter(organization=self.org1, user_type='USER')[:2]
+
+        def hash_while_others_write(passwords):
+            # Another request changes both users while the batch is hashing.
+            User.objects.filter(id=first.id).update(phone='111')
+            User.objects.filter(id=second.id).update(name='Renamed Elsewhere')
+            return hash_passwords(passwords)
+
+        data = {"update": [{"id": first.id, "name": "Batch Updated"}, {"id": second.id, "password": "newpassword"}]}
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        with patch('user.batch.hash_passwords', side_effect=hash_while_others_write):
+            response = self.client.post(reverse('users-batch'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.name, first.phone), ("Batch Updated", '111'))
+        self.assertEqual(second.name, 'Renamed Elsewhere')
+        self.assertTrue(second.check_password("newpassword"))
+
+    @override_settings(USER_BATCH_DEFERRED_INDEX_MIN=2)
+    def test_batch_defers_search_indexing(self):
+        data = {"create": [self._user_data(1, self.org1), self._user_data(2, self.org1)]}
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        response = self.client.post(reverse('users-batch'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(reverse('users-list'), {'search': 'batch'}).data['results'], [])
+
+        self.assertEqual(run_due_tasks(), 1)
+        search = self.client.get(reverse('users-list'), {'search': 'batch'})
+        self.assertEqual({user['id'] for user in search.json()['results']},
+                         {item['id'] for item in response.data['create']})
+
+    def test_batch_other_organization_is_rejected(self):
+        url = reverse('users-batch')
+        other_org_user = User.objects.filter(organization=self.org2).first()
+        data = {
+            "create": [self._user_data(1, self.org1), self._user_data(2, self.org2)],
+            "delete": [other_org_user.id],
+        }
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        response = self.client.post(url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNotIn('status', response.data['create'][0])
+        self.assertEqual(response.data['create'][1]['status'], status.HTTP_403_FORBIDDEN)
+        self.assertEqual(response.data['delete'][0]['status'], status.HTTP_403_FORBIDDEN)
+        self.assertFalse(User.objects.filter(email__startswith="batch").exists())
+        self.assertTrue(User.objects.filter(id=other_org_user.id).exists())
+
+    def test_batch_duplicate_email(self):
+        url = reverse('users-batch')
+        duplicate = self._user_data(2, self.org1)
+        duplicate["email"] = "admin1@testorg1.com"
+        data = {"create": [self._user_data(1, self.org1), self._user_data(1, self.org1), duplicate]}
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["ADMIN"]["TestOrg1"][0])
+        response = self.client.post(url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNotIn('status', response.data['create'][0])
+        self.assertEqual(response.data['create'][1]['status'], status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['create'][2]['status'], status.HTTP_400_BAD_REQUEST)
+
+    def test_batch_as_viewer(self):
+        url = reverse('users-batch')
+        data = {"create": [self._user_data(1, self.org1)]}
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["VIEWER"]["TestOrg1"][0])
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(PASSWORD_HASH_WORKERS=2, PASSWORD_HASH_PARALLEL_MIN=2)
+    def test_hash_passwords_in_parallel(self):
+        hashed = hash_passwords(["first", "second", "third"])
+        self.assertEqual(len(hashed), 3)
+        self.assertTrue(check_password("second", hashed[1]))
+        self.assertNotEqual(hashed[0], hashed[2])
+
+
+class StubIPHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = b"203.0.113.7"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
 class OtherTests(BaseTestCase):
 
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.ip_server = ThreadingHTTPServer(("127.0.0.1", 0), StubIPHandler)
+        threading.Thread(target=cls.ip_server.serve_forever, daemon=True).start()
+        cls.ip_url = f"http://127.0.0.1:{cls.ip_server.server_port}/"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.ip_server.shutdown()
+        cls.ip_server.server_close()
+        super().tearDownClass()
+
     def test_info(self):
         url = reverse('info')
 
@@ -233,7 +766,8 @@ class OtherTests(BaseTestCase):
         decoded_token = AccessToken(user_token)
         user = User.objects.get(id=decoded_token["user_id"])
         self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + user_token)
-        response = self.client.get(url)
+        with self.settings(EGRESS_IP_URL=self.ip_url):
+            response = self.client.get(url)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
@@ -242,3 +776,44 @@ class OtherTests(BaseTestCase):
         self.assertEqual(response.data["organization_name"], user.organization.name)
 
         self.assertIn("public_ip", response.data)
+
+    def test_info_serves_cached_public_ip(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens["USER"]["TestOrg1"][0])
+        with self.settings(EGRESS_IP_URL=self.ip_url):
+            egress_ip.refresh()
+            with patch('requests.get') as get:
+                response = self.client.get(reverse('info'))
+                get.assert_not_called()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["public_ip"], "203.0.113.7")
+
+    def test_egress_ip_refreshes_in_background(self):
+        provider = EgressIPProvider()
+        with self.settings(EGRESS_IP_URL=self.ip_url):
+            self.assertIsNone(provider.get())
+            deadline = time.monotonic() + 5
+            while provider.get() is None and time.monotonic() < deadline:
+                time.sleep(0.01)
+        self.assertEqual(provider.get(), "203.0.113.7")
+
+    def test_egress_ip_keeps_last_value_on_failure(self):
+        provider = EgressIPProvider()
+        with self.settings(EGRESS_IP_URL=self.ip_url):
+            provider.refresh()
+        with self.settings(EGRESS_IP_URL="http://127.0.0.1:1/", EGRESS_IP_TIMEOUT=0.5):
+            self.assertEqual(provider.refresh(), "203.0.113.7")
+
+    def test_seed_generates_orgs_users_and_memberships(self):
+        summary = seed(2, 10, parse_roles('ADMIN=1,VIEWER=1,USER=3'), password='123123', prefix='seed', chunk_size=4)
+
+        self.assertEqual(summary['organizations'], 2)
+        self.assertEqual(summary['users'], 20)
+        users = User.objects.filter(email__contains='@seed-org')
+        self.assertEqual(users.count(), 20)
+        self.assertEqual(users.filter(user_type='ADMIN').count(), 4)
+        self.assertEqual(users.filter(user_type='USER').count(), 12)
+        self.assertEqual(summary['memberships'], 20)
+        for user in users.filter(user_type='VIEWER'):
+            self.assertEqual(list(user.groups.values_list('name', flat=True)), ['Viewer'])
+        self.assertTrue(check_password('123123', users.first().password))
@@ -1,15 +1,31 @@
-import requests
-from .serializers import UserSerializer, GroupSerializer
+from .serializers import (READ_FIELDS, READ_SOURCES, RELATED_FIELDS, UserSerializer, UserReadSerializer,
+                          GroupSerializer, UserBatchSerializer, add_related_ids)
 from .models import User
+from .batch import UserBatch
+from .egress import egress_ip
+from .search import UserSearchFilter
+from .hashing import LoginOverloaded, login_executor, verify_password
 from rest_framework import filters, status, serializers, viewsets
-from rest_framework_simplejwt.tokens import RefreshToken, AccessToken
+from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
-from django.contrib.auth import authenticate
+from django.conf import settings
+from django.db import IntegrityError
 from enum import Enum
 from django.contrib.auth.models import Group
+from common.models import version_bump
+from org.membership import membership_cache
+from common.conditional import Validators, is_conditional
+from common.fields import columns_for, sparse_fields
 from common.permissions import IsAdministrator, IsViewer, IsUser
+from common.authentication import REVOKING_FIELDS, tokens_for_user, revoke_user_tokens
+from common.throttling import IPRateThrottle, ListRateThrottle, LoginRateThrottle
+
+
+# Columns the users-detail ETag and Last-Modified are built from.
+VERSION_FIELDS = ('id', 'organization_id', 'version', 'updated_at', 'organization__version', 'organization__updated_at')
 
 
 class UserType(Enum):
@@ -19,14 +35,28 @@ class UserType(Enum):
 
 
 class LoginView(APIView):
+    throttle_classes = [IPRateThrottle, LoginRateThrottle]
+
     def post(self, request):
         email = request.data.get("email")
         password = request.data.get("password")
 
-        user = authenticate(email=email, password=password)
-
-        if user is not None:
-            refresh = RefreshToken.for_user(user)
+        # Only the password hash runs on the login executor; the lookup and the rehash write
+        # stay on the request thread and its database connection.
+        user = User.objects.filter(email=email).first() if email else None
+        try:
+            is_correct, new_hash = login_executor.run(verify_password, password, user.password if user else None)
+        except LoginOverloaded:
+            return Response({'error': 'Too many login attempts in progress, retry shortly'},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            headers={'Retry-After': str(settings.LOGIN_RETRY_AFTER)})
+
+        if is_correct and user.is_active:
+            if new_hash:
+                user.password = new_hash
+                User.objects.filter(pk=user.pk).update(password=new_hash, **version_bump())
+                membership_cache.bump(user.organization_id)
+            refresh = tokens_for_user(user)
             return Response({'refresh': str(refresh), 'access': str(refresh.access_token)})
         else:
             return Response({'error': 'Invalid Email or Password'}, status=400)
@@ -40,11 +70,13 @@ class GroupView(APIView):
 
 
 class UserViewSet(viewsets.ModelViewSet):
-    queryset = User.objects.all().select_related('organization')
+    queryset = User.objects.all()
     serializer_class = UserSerializer
-    filter_backends = [filters.SearchFilter, DjangoFilterBackend, ]
+    filter_backends = [UserSearchFilter, DjangoFilterBackend, ]
     search_fields = ['name', 'email']
-    filter_fields = ['phone']
+    filterset_fields = ['phone', 'user_type']
+    replica_reads = True
+    throttle_classes = [*api_settings.DEFAULT_THROTTLE_CLASSES, ListRateThrottle]
 
     def _check_same_organization(self, user1, user2):
         return user1.organization_id == user2.organization_id
@@ -65,37 +97,74 @@ class UserViewSet(viewsets.ModelViewSet):
         user = self.request.user
 
         if user.user_type == UserType.ADMINISTRATOR.value or user.user_type == UserType.VIEWER.value:
-            return self.queryset.filter(organization=user.organization)
+            return self.queryset.filter(organization_id=user.organization_id)
         elif user.user_type == UserType.USER.value:
             return self.queryset.filter(id=user.id)
 
         return self.queryset.none()
 
+    def list(self, request, *args, **kwargs):
+        # Administrators and viewers all see the same organization-wide list, so it is cached per
+        # organization; a USER only ever lists themselves.
+        if request.user.user_type == UserType.USER.value:
+            return self.list_users(request)
+        return membership_cache.respond(self, request, request.user.organization_id,
+                                        lambda: self.list_users(request))
+
+    def list_users(self, request):
+        fields = sparse_fields(request, READ_FIELDS)
+        queryset = self.filter_queryset(self.get_queryset())
+        # The paginator's key columns and annotations (e.g. search_rank) stay selected for the cursor.
+        keyset = [field.lstrip('-') for field in self.paginator.get_ordering(self)]
+        columns = columns_for(fields, READ_SOURCES, 'id', *keyset)
+        rows = queryset.values(*[column for column in columns if column not in queryset.query.annotations],
+                               *queryset.query.annotations)
+        page = self.paginate_queryset(rows)
+        related = [field for field in RELATED_FIELDS if field in fields]
+        data = UserReadSerializer(add_related_ids(page, related), many=True, fields=fields).data
+        return self.get_paginated_response(data)
+
     def retrieve(self, request, *args, **kwargs):
         requesting_user = request.user
-        user_from_db = User.objects.filter(id=kwargs.get('pk')).first()
+        fields = sparse_fields(request, READ_FIELDS)
+        row = None
+        if is_conditional(request):
+            # Revalidation costs one indexed lookup of the versions; nothing is serialized on a 304.
+            versions = User.objects.filter(id=kwargs.get('pk')).values_list(*VERSION_FIELDS).first()
+        else:
+            columns = columns_for(fields, READ_SOURCES, *VERSION_FIELDS)
+            row = User.objects.filter(id=kwargs.get('pk')).values(*columns).first()
+            versions = row and tuple(row[field] for field in VERSION_FIELDS)
 
-        if not user_from_db:
+        if not versions:
             return Response({"detail": "User not found"}, status=status.HTTP_404_NOT_FOUND)
+        user_id, organization_id = versions[:2]
 
-        if requesting_user.user_type == UserType.VIEWER.value and user_from_db.organization != requesting_user.organization:
+        if requesting_user.user_type == UserType.VIEWER.value and \
+                organization_id != requesting_user.organization_id:
             return Response({"detail": "Not authorized to retrieve user from another organization"},
                             status=status.HTTP_403_FORBIDDEN)
 
-        elif requesting_user.user_type == UserType.USER.value and user_from_db != requesting_user:
+        elif requesting_user.user_type == UserType.USER.value and user_id != requesting_user.pk:
             return Response({"detail": "Not authorized to retrieve other user's information"},
                             status=status.HTTP_403_FORBIDDEN)
 
-        serializer = self.get_serializer(user_from_db)
-        return Response(serializer.data)
+        # The representation includes the organization name, so its version is part of the ETag.
+        validators = Validators(versions[2:4], versions[4:6])
+        if row is None:
+            not_modified = validators.not_modified(request)
+            if not_modified:
+                return not_modified
+            row = User.objects.filter(id=user_id).values(*columns_for(fields, READ_SOURCES, 'id')).get()
+
+        related = [field for field in RELATED_FIELDS if field in fields]
+        serializer = UserReadSerializer(add_related_ids([row], related)[0], fields=fields)
+        return validators.apply(Response(serializer.data))
 
     def create(self, request):
         user_type = request.user.user_type
         email = request.data.get("email")
 
-        if User.objects.filter(email=email).exists():
-            return Response({"detail": "User with this email already exists"}, status=status.HTTP_400_BAD_REQUEST)
-
         if user_type == UserType.USER.value and email != request.user.email:
             return Response({"detail": "Not authorized to create account for others"},
                             status=status.HTTP_403_FORBIDDEN)
@@ -125,6 +194,12 @@ class UserViewSet(viewsets.ModelViewSet):
                     user_type=user_type,
                     password=password
                 )
+            except IntegrityError as e:
+                # Missing required fields end up here too (NOT NULL), so check which constraint it was.
+                if email and User.objects.filter(email=User.objects.normalize_email(email)).exists():
+                    return Response({"detail": "User with this email already exists"},
+                                    status=status.HTTP_400_BAD_REQUEST)
+                return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
             except Exception as e:
                 return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -133,12 +208,23 @@ class UserViewSet(viewsets.ModelViewSet):
 
         return Response({"detail": "Invalid user type"}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        serializer = UserBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        batch = UserBatch(request.user, **serializer.validated_data)
+        if not batch.run():
+            return Response(batch.results, status=status.HTTP_400_BAD_REQUEST)
+        return Response(batch.results, status=status.HTTP_200_OK)
+
     def update(self, request, pk=None, partial=False):
         user_type = request.user.user_type
         user = self.get_object()
 
         if (user_type == UserType.ADMINISTRATOR.value and
-            request.user.organization == user.organization) or IsUser().has_object_permission(request, None, user):
+            request.user.organization_id == user.organization_id) or IsUser().has_object_permission(request, None, user):
             if "password" in request.data:
                 user.set_password(request.data["password"])
                 user.save()
@@ -151,7 +237,13 @@ class UserViewSet(viewsets.ModelViewSet):
             serializer = UserSerializer(user, data=updated_data, partial=partial)
 
             if serializer.is_valid():
+                previous_organization_id = user.organization_id
                 serializer.save()
+                if user.organization_id != previous_organization_id:
+                    # post_save only bumps the organization the user moved to.
+                    membership_cache.bump(previous_organization_id)
+                if REVOKING_FIELDS.intersection(request.data):
+                    revoke_user_tokens(user.pk)
                 return Response(serializer.data)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -170,6 +262,7 @@ class UserViewSet(viewsets.ModelViewSet):
                 return Response({"detail": "Not authorized to delete user from another organization"},
                                 status=status.HTTP_403_FORBIDDEN)
             user.delete()
+            revoke_user_tokens(pk)
             return Response(status=status.HTTP_204_NO_CONTENT)
         except User.DoesNotExist:
             return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
@@ -182,7 +275,7 @@ class InfoView(APIView):
         try:
             user = request.user
 
-            public_ip = requests.get('https://api.ipify.org').text
+            public_ip = egress_ip.get()
 
             data = {
                 'user_name': user.name,